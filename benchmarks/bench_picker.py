@@ -0,0 +1,241 @@
+"""
+PathPicker benchmarks over synthetic directory trees.
+
+Times listing, navigating down and up (one level, and through every level of the tree), toggling dotfiles and per-keystroke filtering on the headless PathPickerEngine,
+and drawing the viewport with the PathPicker view, reporting p50/p99 latencies and peak memory. No terminal or running
+prompt_toolkit application is needed.
+
+    python -m benchmarks.bench_picker [--sizes 10,1000,100000] [--kinds flat,dotfiles] [--save NAME] [--compare NAME]
+
+With ``--memory``, each tree is copied into a ``MemoryFilesystem`` first, leaving the disk and the kernel's caches out of
+the results.
+
+Trees with 1M entries are supported (``--sizes 1000000``) but aren't run by default, generating them is slow.
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable
+from pathlib import Path
+from typing import NamedTuple
+
+from benchmarks.trees import TREE_KINDS, get_tree
+from xontrib_bluray.filesystem import Filesystem, GuardedFilesystem, LocalFilesystem
+from xontrib_bluray.memory_fs import MemoryFilesystem
+from xontrib_bluray.path_picker import PathPicker
+from xontrib_bluray.picker_engine import PathPickerEngine
+
+BASELINES_DIR = Path(__file__).parent / "baselines"
+DEFAULT_TREE_CACHE = Path(tempfile.gettempdir()) / "bluray-bench-trees"
+FILTER_QUERY = "file_00"
+MAX_DESCEND_DEPTH = 200
+
+
+class Result(NamedTuple):
+    name: str
+    p50: float
+    p99: float
+    peak_memory: int
+
+
+def measure(
+    name: str,
+    setup: Callable[[], object],
+    operation: Callable[[object], None],
+    repeat: int,
+) -> Result:
+    timings = []
+
+    for _ in range(repeat):
+        state = setup()
+        start = time.perf_counter()
+        operation(state)
+        timings.append(time.perf_counter() - start)
+
+    # Memory is measured separately, tracemalloc slows everything down a lot
+    state = setup()
+    tracemalloc.start()
+    operation(state)
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    if len(timings) > 1:
+        percentiles = statistics.quantiles(timings, n=100, method="inclusive")
+        p50, p99 = percentiles[49], percentiles[98]
+    else:
+        p50 = p99 = timings[0]
+
+    return Result(name=name, p50=p50, p99=p99, peak_memory=peak_memory)
+
+
+# Measure how long the work takes, rather than giving up on huge trees (especially with tracemalloc slowing things down)
+LOCAL_FILESYSTEM = LocalFilesystem()
+UNLIMITED_TIMEOUT = 60 * 60
+
+
+def new_engine(tree: Path, filesystem: GuardedFilesystem) -> PathPickerEngine:
+    # Toggling dotfiles shouldn't touch the real state file
+    return PathPickerEngine(
+        current_dir=tree,
+        show_dotfiles=True,
+        persist_state=False,
+        filesystem=filesystem,
+    )
+
+
+def type_filter(engine: PathPickerEngine) -> None:
+    # Each keystroke updates the filter text, which re-filters the listing
+    engine.set_filtering(True)
+    for idx in range(1, len(FILTER_QUERY) + 1):
+        engine.set_filter_text(FILTER_QUERY[:idx])
+
+
+def select_first_subdir(engine: PathPickerEngine) -> bool:
+    engine.selected_option = next(
+        (
+            idx
+            for idx, option in enumerate(engine.options)
+            if idx > 0 and engine.is_dir(option)
+        ),
+        0,
+    )
+    return engine.selected_option != 0
+
+
+def navigate_down_and_up(engine: PathPickerEngine) -> None:
+    select_first_subdir(engine)
+    engine.navigate_down()
+    engine.navigate_up()
+
+
+def descend_and_climb(engine: PathPickerEngine) -> None:
+    # Down to the bottom of the tree through the first subdirectory of each level, then all the way back up
+    depth = 0
+    while depth < MAX_DESCEND_DEPTH and select_first_subdir(engine):
+        engine.navigate_down()
+        depth += 1
+
+    for _ in range(depth):
+        engine.navigate_up()
+
+
+def draw_scrolled(picker: PathPicker) -> None:
+    for _ in range(20):
+        picker._move_cursor(1)
+        picker._draw()
+
+
+def bench_tree(
+    kind: str, size: int, tree: Path, repeat: int, memory: bool
+) -> list[Result]:
+    prefix = f"{kind}/{size}"
+
+    inner: Filesystem = MemoryFilesystem.copy_of(tree) if memory else LOCAL_FILESYSTEM
+    filesystem = GuardedFilesystem(inner, timeout=UNLIMITED_TIMEOUT)
+
+    def reset_listings():
+        # Everything is already in memory, there's no cache to start again without
+        if not memory:
+            LOCAL_FILESYSTEM.listings.reset()
+
+    def fresh_engine():
+        return new_engine(tree, filesystem)
+
+    return [
+        measure(
+            f"{prefix}/list",
+            reset_listings,
+            lambda _: new_engine(tree, filesystem),
+            repeat,
+        ),
+        measure(
+            f"{prefix}/list_cached",
+            lambda: None,
+            lambda _: new_engine(tree, filesystem),
+            repeat,
+        ),
+        measure(f"{prefix}/navigate", fresh_engine, navigate_down_and_up, repeat),
+        measure(f"{prefix}/descend", fresh_engine, descend_and_climb, repeat),
+        measure(
+            f"{prefix}/toggle_dotfiles",
+            fresh_engine,
+            lambda engine: engine.toggle_dotfiles(),
+            repeat,
+        ),
+        measure(f"{prefix}/filter", fresh_engine, type_filter, repeat),
+        # Drawing is the only part which needs the prompt_toolkit view
+        measure(
+            f"{prefix}/draw",
+            lambda: PathPicker(current_dir=tree, filesystem=filesystem),
+            draw_scrolled,
+            repeat,
+        ),
+    ]
+
+
+def print_results(results: list[Result], baseline: dict[str, dict] | None) -> None:
+    header = f"{'benchmark':<32} {'p50 ms':>10} {'p99 ms':>10} {'peak KiB':>10}"
+    if baseline is not None:
+        header += f" {'p50 vs baseline':>16}"
+    print(header)
+
+    for result in results:
+        line = (
+            f"{result.name:<32} {result.p50 * 1000:>10.3f} {result.p99 * 1000:>10.3f}"
+            f" {result.peak_memory / 1024:>10.1f}"
+        )
+
+        if baseline is not None:
+            if result.name in baseline:
+                ratio = result.p50 / baseline[result.name]["p50"]
+                line += f" {ratio:>15.2f}x"
+            else:
+                line += f" {'-':>16}"
+
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="10,1000,100000")
+    parser.add_argument("--kinds", default=",".join(TREE_KINDS))
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--tree-cache", type=Path, default=DEFAULT_TREE_CACHE)
+    parser.add_argument(
+        "--memory", action="store_true", help="run on in-memory copies of the trees"
+    )
+    parser.add_argument("--save", metavar="NAME", help="save the results as a baseline")
+    parser.add_argument(
+        "--compare", metavar="NAME", help="compare against a saved baseline"
+    )
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        baseline = json.loads((BASELINES_DIR / f"{args.compare}.json").read_text())
+
+    # The picker view creates its result future up front, which wants an event loop to belong to
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    results = []
+
+    for kind in args.kinds.split(","):
+        for size in map(int, args.sizes.split(",")):
+            tree = get_tree(args.tree_cache, kind, size)
+            results.extend(bench_tree(kind, size, tree, args.repeat, args.memory))
+
+    print_results(results, baseline)
+
+    if args.save:
+        BASELINES_DIR.mkdir(exist_ok=True)
+        (BASELINES_DIR / f"{args.save}.json").write_text(
+            json.dumps({result.name: result._asdict() for result in results}, indent=2)
+        )
+
+
+if __name__ == "__main__":
+    main()
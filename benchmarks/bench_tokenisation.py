@@ -0,0 +1,81 @@
+"""
+Tokeniser throughput benchmark.
+
+Lexes realistic multi-kilobyte xonsh command lines with the whitespace preserving lexer used by ctrl+y and reports
+the throughput in tokens per second.
+
+    python -m benchmarks.bench_tokenisation [--size 4096] [--repeat 50]
+"""
+
+import argparse
+import itertools
+import statistics
+import time
+
+from xontrib_bluray.custom_lexer import CustomLexer
+
+COMMAND_FRAGMENTS = [
+    'rsync -avh --progress --exclude ".git" p"./build/output dir" user@host:/srv/www/',
+    "find . -name '*.py' -not -path './.venv/*' | xargs grep -n TODO",
+    '$(git rev-parse --show-toplevel) && ls -la @(some_var) "quoted arg with spaces"',
+    'tar -czf f"archive-{date}.tar.gz" src/ docs/ README.md 2>/dev/null',
+    "echo $HOME ${'PATH'} `.*\\.txt` && ![cat /etc/hostname] || true",
+    "python -m pytest -q tests/test_module.py::TestClass::test_case -k 'not slow' \\\n    --maxfail=1",
+]
+
+
+def build_command_line(size: int) -> str:
+    parts = []
+    length = 0
+
+    for fragment in itertools.cycle(COMMAND_FRAGMENTS):
+        if length >= size:
+            break
+
+        parts.append(fragment)
+        length += len(fragment) + 3
+
+    return " | ".join(parts)
+
+
+def count_tokens(text: str) -> int:
+    lexer = CustomLexer(tolerant=True, pymode=False)
+    lexer.input(text, is_subproc=True)
+    return sum(1 for _ in lexer)
+
+
+def run(size: int, repeat: int) -> None:
+    text = build_command_line(size)
+    token_count = count_tokens(text)
+    lexer = CustomLexer(tolerant=True, pymode=False)
+    timings = []
+
+    # Warm up any lazily compiled state
+    lexer.split(text)
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        lexer.split(text)
+        timings.append(time.perf_counter() - start)
+
+    median = statistics.median(timings)
+    print(f"input size:  {len(text)} chars, {token_count} tokens")
+    print(f"median time: {median * 1000:.3f} ms")
+    print(f"throughput:  {token_count / median:,.0f} tokens/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--size",
+        type=int,
+        default=4096,
+        help="approximate command line length in characters",
+    )
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    run(args.size, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
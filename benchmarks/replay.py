@@ -0,0 +1,219 @@
+"""
+Keystroke replay harness for end-to-end latency.
+
+Replays recorded key sequences into a ctrl+k or ctrl+y dialog through prompt_toolkit's pipe input and a dummy output,
+and measures the time from each key being sent until the screen has been re-rendered for it. This catches the latency
+from the interplay between showing the float, focus changes, text changed handlers and redraws, which the
+microbenchmarks don't.
+
+    python -m benchmarks.replay [SCENARIO ...] [--json]
+
+Scenarios are text files in ``benchmarks/scenarios`` with one step per line:
+
+    # A comment
+    tree flat 1000      the fixture tree to run in (see benchmarks/trees.py), must come first
+    c-k                 a key, using prompt_toolkit's key names (down, right, enter, escape, c-y, ...)
+    .                   a single character
+    type some text      types each character as a separate key
+"""
+
+import argparse
+import asyncio
+import json
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import NamedTuple
+from unittest import mock
+
+from prompt_toolkit import PromptSession
+from prompt_toolkit.input import create_pipe_input
+from prompt_toolkit.input.ansi_escape_sequences import REVERSE_ANSI_SEQUENCES
+from prompt_toolkit.key_binding import KeyBindings
+from prompt_toolkit.keys import KEY_ALIASES, Keys
+from prompt_toolkit.output import DummyOutput
+
+from benchmarks.trees import get_tree
+from xontrib_bluray import dialog, picker_engine
+from xontrib_bluray.constants import MAX_HEIGHT
+from xontrib_bluray.path_picker import PathPickerDialog
+
+SCENARIOS_DIR = Path(__file__).parent / "scenarios"
+DEFAULT_TREE_CACHE = Path(tempfile.gettempdir()) / "bluray-bench-trees"
+# A key's render is done once nothing else has been rendered for this long
+SETTLE_TIME = 0.03
+RENDER_TIMEOUT = 10
+
+
+class Scenario(NamedTuple):
+    name: str
+    tree_kind: str
+    tree_size: int
+    keys: list[str]
+
+
+class KeyTiming(NamedTuple):
+    key: str
+    time_to_render: float
+
+
+def key_to_input(key: str) -> str:
+    if len(key) == 1:
+        return key
+
+    key = KEY_ALIASES.get(key, key)
+    return REVERSE_ANSI_SEQUENCES[Keys(key)]
+
+
+def load_scenario(path: Path) -> Scenario:
+    tree_kind, tree_size = "flat", 1000
+    keys = []
+
+    for line in path.read_text().splitlines():
+        step = line.strip()
+
+        if not step or step.startswith("#"):
+            continue
+
+        command, _, argument = step.partition(" ")
+
+        if command == "tree":
+            kind, size = argument.split()
+            tree_kind, tree_size = kind, int(size)
+        elif command == "type":
+            keys.extend(argument)
+        else:
+            key_to_input(step)  # Fail early on unknown keys
+            keys.append(step)
+
+    return Scenario(name=path.stem, tree_kind=tree_kind, tree_size=tree_size, keys=keys)
+
+
+async def replay(scenario: Scenario, tree: Path) -> list[KeyTiming]:
+    renders: list[float] = []
+    rendered = asyncio.Event()
+    timings = []
+
+    def on_render(_):
+        renders.append(time.perf_counter())
+        rendered.set()
+
+    # Mirrors the bindings added by the xontrib, without needing a running xonsh
+    kb = KeyBindings()
+    dialog_tasks = set()
+
+    def bind_dialog(key: str, accept_files: bool) -> None:
+        @kb.add(key)
+        def _(event):
+            async def show():
+                await dialog.show_as_float(
+                    PathPickerDialog(
+                        "Replay", current_dir=tree, accept_files=accept_files
+                    ),
+                    height=MAX_HEIGHT,
+                    bottom=0,
+                    top=1,
+                    left=0,
+                )
+                event.app.exit(result="")
+
+            task = asyncio.ensure_future(show())
+            dialog_tasks.add(task)
+            task.add_done_callback(dialog_tasks.discard)
+
+    bind_dialog("c-k", accept_files=False)
+    bind_dialog("c-y", accept_files=True)
+
+    with create_pipe_input() as pipe_input:
+        session = PromptSession(input=pipe_input, output=DummyOutput(), key_bindings=kb)
+        prompt_task = asyncio.ensure_future(session.prompt_async())
+
+        async def wait_for_renders(since: int) -> None:
+            # Wait for the first render, then until rendering has settled
+            while len(renders) <= since:
+                rendered.clear()
+                await asyncio.wait_for(rendered.wait(), RENDER_TIMEOUT)
+
+            while True:
+                rendered.clear()
+                try:
+                    await asyncio.wait_for(rendered.wait(), SETTLE_TIME)
+                except TimeoutError:
+                    return
+
+        session.app.after_render += on_render
+        # Wait for the initial prompt to be drawn
+        await wait_for_renders(0)
+
+        for key in scenario.keys:
+            if prompt_task.done():
+                break
+
+            renders_before = len(renders)
+            sent_at = time.perf_counter()
+            pipe_input.send_text(key_to_input(key))
+
+            try:
+                await wait_for_renders(renders_before)
+            except TimeoutError:
+                # The last key may close the dialog and end the prompt without rendering
+                if not prompt_task.done():
+                    raise
+
+                break
+
+            timings.append(KeyTiming(key=key, time_to_render=renders[-1] - sent_at))
+
+        if not prompt_task.done():
+            session.app.exit(result="")
+
+        await prompt_task
+
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "scenarios",
+        nargs="*",
+        type=Path,
+        default=sorted(SCENARIOS_DIR.glob("*.keys")),
+    )
+    parser.add_argument("--tree-cache", type=Path, default=DEFAULT_TREE_CACHE)
+    parser.add_argument(
+        "--json", action="store_true", help="print the timings as JSON lines"
+    )
+    args = parser.parse_args()
+
+    for path in args.scenarios:
+        scenario = load_scenario(path)
+        tree = get_tree(args.tree_cache, scenario.tree_kind, scenario.tree_size)
+
+        # Toggling dotfiles persists the setting, don't touch the real state file
+        with (
+            tempfile.TemporaryDirectory() as state_dir,
+            mock.patch.object(picker_engine, "STATE_FILE", Path(state_dir) / "bluray"),
+        ):
+            timings = asyncio.run(replay(scenario, tree))
+
+        if args.json:
+            for timing in timings:
+                print(json.dumps({"scenario": scenario.name, **timing._asdict()}))
+            continue
+
+        print(f"{scenario.name} ({scenario.tree_kind}/{scenario.tree_size})")
+        for timing in timings:
+            print(f"  {timing.key:<10} {timing.time_to_render * 1000:>9.2f} ms")
+
+        latencies = [timing.time_to_render for timing in timings]
+        if len(latencies) > 1:
+            percentiles = statistics.quantiles(latencies, n=100, method="inclusive")
+            print(
+                f"  p50 {percentiles[49] * 1000:.2f} ms, p99 {percentiles[98] * 1000:.2f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
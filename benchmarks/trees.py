@@ -0,0 +1,117 @@
+"""
+Synthetic directory trees for the benchmarks. Trees are generated once into a cache directory and reused between runs,
+generating the bigger ones takes a while.
+"""
+
+import os
+import shutil
+from collections.abc import Callable
+from pathlib import Path
+
+UNICODE_NAME_PARTS = [
+    "données",
+    "日本語のファイル",
+    "Ωμέγα",
+    "emoji_🐍🐚",
+    "Ünïcödé",
+    "кириллица",
+]
+
+
+def _touch(path: Path) -> None:
+    with open(path, "w"):
+        pass
+
+
+def flat_tree(root: Path, size: int) -> Path:
+    """One directory with ``size`` entries, a tenth of them directories"""
+    for idx in range(size):
+        if idx % 10 == 0:
+            (root / f"dir_{idx:07}").mkdir()
+        else:
+            _touch(root / f"file_{idx:07}.txt")
+
+    return root
+
+
+def deep_tree(root: Path, size: int) -> Path:
+    """A chain of nested directories ``size`` levels deep (capped to stay within PATH_MAX), with a few files in each"""
+    current = root
+
+    for depth in range(min(size, 200)):
+        current = current / f"level_{depth:03}"
+        current.mkdir()
+
+        for idx in range(5):
+            _touch(current / f"file_{idx}.txt")
+
+    return root
+
+
+def dotfile_tree(root: Path, size: int) -> Path:
+    """Mostly dotfiles, like ~/.cache or a home directory"""
+    for idx in range(size):
+        if idx % 4 == 0:
+            _touch(root / f"visible_{idx:07}")
+        elif idx % 3 == 0:
+            (root / f".hidden_dir_{idx:07}").mkdir()
+        else:
+            _touch(root / f".hidden_{idx:07}")
+
+    return root
+
+
+def unicode_tree(root: Path, size: int) -> Path:
+    """Long names made up of multibyte characters"""
+    for idx in range(size):
+        part = UNICODE_NAME_PARTS[idx % len(UNICODE_NAME_PARTS)]
+        _touch(root / f"{part}_{part}_{part}_{idx:07}")
+
+    return root
+
+
+def symlink_tree(root: Path, size: int) -> Path:
+    """A farm of symlinks, half pointing at directories and half at files"""
+    targets = root / "targets"
+    targets.mkdir()
+    (targets / "dir").mkdir()
+    _touch(targets / "file")
+    farm = root / "farm"
+    farm.mkdir()
+
+    for idx in range(size):
+        target = targets / ("dir" if idx % 2 == 0 else "file")
+        os.symlink(target, farm / f"link_{idx:07}")
+
+    return farm
+
+
+TREE_KINDS: dict[str, Callable[[Path, int], Path]] = {
+    "flat": flat_tree,
+    "deep": deep_tree,
+    "dotfiles": dotfile_tree,
+    "unicode": unicode_tree,
+    "symlinks": symlink_tree,
+}
+
+
+def get_tree(cache_dir: Path, kind: str, size: int) -> Path:
+    """Returns the directory to benchmark in, generating the tree first if it isn't already in the cache"""
+    root = cache_dir / f"{kind}-{size}"
+    marker = root / ".complete"
+    generate = TREE_KINDS[kind]
+
+    if not marker.exists():
+        if root.exists():
+            # A previous run was interrupted part way through generating this tree
+            shutil.rmtree(root)
+
+        root.mkdir(parents=True)
+        result = generate(root, size)
+        _touch(marker)
+        return result
+
+    if kind == "symlinks":
+        return root / "farm"
+
+    return root
@@ -0,0 +1,148 @@
+import io
+import os
+import tarfile
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from xontrib_bluray import archive_fs
+from xontrib_bluray.archive_fs import ArchiveFilesystem
+from xontrib_bluray.filesystem import KIND_DIR, KIND_FILE, DirListing, LocalFilesystem
+
+
+@pytest.fixture
+def filesystem():
+    return ArchiveFilesystem(LocalFilesystem())
+
+
+def write_zip(path: Path, members: dict[str, bytes]) -> Path:
+    with zipfile.ZipFile(path, "w") as archive:
+        for name, contents in members.items():
+            archive.writestr(name, contents)
+
+    return path
+
+
+def write_tar(path: Path, members: dict[str, bytes], mode: str = "w") -> Path:
+    with tarfile.open(path, mode) as archive:
+        for name, contents in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(contents)
+            archive.addfile(info, io.BytesIO(contents))
+
+    return path
+
+
+def test_zip_members_are_browsed_as_paths(tmp_path, filesystem):
+    archive = write_zip(
+        tmp_path / "a.zip",
+        {"src/pkg/mod.py": b"print()", "README.md": b"hi", "src/b.txt": b""},
+    )
+
+    assert filesystem.kind(archive) == KIND_DIR
+    # Directories without entries of their own are made up from their members' paths
+    assert filesystem.list_dir(archive) == DirListing(dirs=["src"], files=["README.md"])
+    assert filesystem.list_dir(archive / "src") == DirListing(
+        dirs=["pkg"], files=["b.txt"]
+    )
+    assert filesystem.kind(archive / "src" / "pkg") == KIND_DIR
+    assert filesystem.stat(archive / "src" / "pkg" / "mod.py").st_size == 7
+    assert filesystem.read_bytes(archive / "src" / "pkg" / "mod.py", 5) == b"print"
+
+
+def test_paths_outside_archives_are_passed_on(tmp_path, filesystem):
+    (tmp_path / "dir").mkdir()
+    (tmp_path / "file.txt").write_bytes(b"text")
+
+    assert filesystem.list_dir(tmp_path) == DirListing(dirs=["dir"], files=["file.txt"])
+    assert filesystem.read_bytes(tmp_path / "file.txt", 100) == b"text"
+    assert filesystem.is_native(tmp_path / "file.txt")
+
+
+def test_members_are_not_native(tmp_path, filesystem):
+    archive = write_zip(tmp_path / "a.zip", {"a.txt": b""})
+
+    assert not filesystem.is_native(archive)
+    assert not filesystem.is_native(archive / "a.txt")
+
+
+def test_missing_member(tmp_path, filesystem):
+    archive = write_zip(tmp_path / "a.zip", {"a.txt": b""})
+
+    assert filesystem.kind(archive / "missing") is None
+    with pytest.raises(FileNotFoundError):
+        filesystem.stat(archive / "missing")
+    with pytest.raises(NotADirectoryError):
+        filesystem.list_dir(archive / "a.txt")
+
+
+def test_names_escaping_the_archive_are_left_out(tmp_path, filesystem):
+    archive = write_zip(
+        tmp_path / "a.zip", {"../evil.txt": b"", "/abs.txt": b"", "ok.txt": b""}
+    )
+
+    assert filesystem.list_dir(archive) == DirListing(
+        dirs=[], files=["abs.txt", "ok.txt"]
+    )
+
+
+def test_zeroed_zip_dates_fall_back_to_the_archive_mtime(tmp_path, filesystem):
+    archive = tmp_path / "a.zip"
+    with zipfile.ZipFile(archive, "w") as zip_file:
+        zip_file.writestr(
+            zipfile.ZipInfo("a.txt", date_time=(1980, 0, 0, 0, 0, 0)), b""
+        )
+    os.utime(archive, ns=(1_700_000_000_000_000_000, 1_700_000_000_000_000_000))
+
+    assert filesystem.kind(archive) == KIND_DIR
+    assert filesystem.stat(archive / "a.txt").st_mtime_ns == pytest.approx(
+        1_700_000_000_000_000_000, abs=1000
+    )
+
+
+def test_tar_members_are_browsed_as_paths(tmp_path, filesystem):
+    archive = write_tar(tmp_path / "a.tar", {"dir/a.txt": b"contents"})
+
+    assert filesystem.list_dir(archive) == DirListing(dirs=["dir"], files=[])
+    assert filesystem.read_bytes(archive / "dir" / "a.txt", 100) == b"contents"
+
+
+def test_compressed_tar_is_browsed(tmp_path, filesystem):
+    archive = write_tar(tmp_path / "a.tar.gz", {"a.txt": b"x"}, mode="w:gz")
+
+    assert filesystem.list_dir(archive) == DirListing(dirs=[], files=["a.txt"])
+
+
+def test_big_compressed_tar_is_a_plain_file(tmp_path, filesystem, monkeypatch):
+    archive = write_tar(tmp_path / "a.tar.gz", {"a.txt": b"x"}, mode="w:gz")
+    monkeypatch.setattr(archive_fs, "ARCHIVE_MAX_COMPRESSED_TAR_SIZE", 10)
+
+    assert filesystem.kind(archive) == KIND_FILE
+    assert filesystem.list_dir(tmp_path).files == ["a.tar.gz"]
+
+
+def test_compressed_tar_named_tar_is_a_plain_file(tmp_path, filesystem):
+    # Plain tars are never decompressed, however they're named
+    write_tar(tmp_path / "a.tar.gz", {"a.txt": b"x"}, mode="w:gz")
+    archive = (tmp_path / "a.tar.gz").rename(tmp_path / "a.tar")
+
+    assert filesystem.kind(archive) == KIND_FILE
+
+
+def test_corrupt_archive_is_a_plain_file(tmp_path, filesystem):
+    archive = tmp_path / "a.zip"
+    archive.write_bytes(b"not a zip")
+
+    assert filesystem.kind(archive) == KIND_FILE
+    assert filesystem.read_bytes(archive, 100) == b"not a zip"
+
+
+def test_changed_archive_is_read_again(tmp_path, filesystem):
+    archive = write_zip(tmp_path / "a.zip", {"a.txt": b""})
+    assert filesystem.list_dir(archive).files == ["a.txt"]
+
+    write_zip(archive, {"a.txt": b"", "b.txt": b"longer"})
+
+    assert filesystem.list_dir(archive).files == ["a.txt", "b.txt"]
+    assert filesystem.misses == 2
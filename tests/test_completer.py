@@ -0,0 +1,96 @@
+import pytest
+from xonsh.built_ins import XSH
+from xonsh.parsers.completion_context import (
+    CommandArg,
+    CommandContext,
+    CompletionContext,
+)
+
+from xontrib_bluray.completer import complete_path_from_cache
+
+
+@pytest.fixture
+def env(monkeypatch):
+    env = {"CASE_SENSITIVE_COMPLETIONS": False}
+    monkeypatch.setattr(XSH, "env", env)
+    return env
+
+
+@pytest.fixture
+def cwd(tmp_path, monkeypatch, env):
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "main.py").touch()
+    (tmp_path / "Setup.py").touch()
+    (tmp_path / "setup.cfg").touch()
+    (tmp_path / ".hidden").touch()
+    (tmp_path / "with space").touch()
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def complete(prefix: str, *, arg_index: int = 1, opening_quote: str = ""):
+    context = CompletionContext(
+        command=CommandContext(
+            args=(CommandArg("ls"),),
+            arg_index=arg_index,
+            prefix=prefix,
+            opening_quote=opening_quote,
+        )
+    )
+    result = complete_path_from_cache(context)
+
+    if result is None:
+        return None
+
+    completions, length = result
+    assert length == len(prefix)
+    return {str(completion): completion for completion in completions}
+
+
+def test_names_starting_with_the_prefix(cwd):
+    completions = complete("se")
+
+    assert set(completions) == {"Setup.py", "setup.cfg"}
+    assert completions["setup.cfg"].append_space
+
+
+def test_case_sensitive_completions(cwd, env):
+    env["CASE_SENSITIVE_COMPLETIONS"] = True
+
+    assert set(complete("se")) == {"setup.cfg"}
+    assert set(complete("Se")) == {"Setup.py"}
+
+
+def test_directories_get_a_trailing_separator(cwd):
+    completions = complete("s")
+
+    assert "src/" in completions
+    assert not completions["src/"].append_space
+    assert completions["src/"].display == "src/"
+
+
+def test_inside_a_directory(cwd):
+    assert set(complete("src/m")) == {"src/main.py"}
+
+
+def test_dotfiles_only_once_a_dot_is_typed(cwd):
+    assert ".hidden" not in complete("")
+    assert set(complete(".h")) == {".hidden"}
+
+
+def test_names_needing_quotes_are_quoted(cwd):
+    assert set(complete("wi")) == {"'with space'"}
+
+
+def test_nothing_starting_with_the_prefix_falls_back_to_xonsh(cwd):
+    # Close matches like "setup.cfg" would replace what was typed with a different path
+    assert complete("stup") is None
+
+
+def test_left_to_xonsh(cwd):
+    # Commands, quoted paths, variables, ~user and missing directories
+    assert complete("s", arg_index=0) is None
+    assert complete("s", opening_quote="'") is None
+    assert complete("$HOME/") is None
+    assert complete("~root") is None
+    assert complete("missing/") is None
@@ -0,0 +1,184 @@
+import errno
+import os
+import socket
+import threading
+import time
+from contextlib import suppress
+from pathlib import Path
+
+import pytest
+
+from xontrib_bluray import daemon
+from xontrib_bluray.constants import DAEMON_TIMEOUT, FS_TIMEOUT
+from xontrib_bluray.daemon import DaemonFilesystem, decode_listing, encode_listing
+from xontrib_bluray.filesystem import DirListing, GuardedFilesystem, LocalFilesystem
+
+
+def wait_for(condition, timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def socket_path(tmp_path):
+    return tmp_path / "bluray" / "daemon.sock"
+
+
+@pytest.fixture
+def running_daemon(socket_path):
+    thread = threading.Thread(target=daemon.serve, args=(socket_path, 0.5), daemon=True)
+    thread.start()
+    wait_for(socket_path.exists)
+    yield socket_path
+
+
+@pytest.fixture
+def listed_dir(tmp_path):
+    directory = tmp_path / "listed"
+    directory.mkdir()
+    (directory / "sub").mkdir()
+    (directory / "b.txt").touch()
+    (directory / "A.txt").touch()
+    # Listings of directories modified within the last couple of seconds aren't cached
+    os.utime(directory, ns=(0, 0))
+    return directory
+
+
+@pytest.mark.parametrize(
+    "listing",
+    [
+        DirListing(dirs=[], files=[]),
+        DirListing(dirs=["a", "b c"], files=[]),
+        DirListing(dirs=[], files=["x"]),
+        # Names which aren't valid in the filesystem encoding still get across
+        DirListing(dirs=[os.fsdecode(b"\xff\xfe")], files=["café", "new\nline"]),
+    ],
+)
+def test_listing_round_trip(listing):
+    assert decode_listing(encode_listing(123, listing)) == (123, listing)
+
+
+def test_lists_through_the_daemon(running_daemon, listed_dir):
+    filesystem = DaemonFilesystem(running_daemon, autostart=False)
+
+    listing = filesystem.list_dir(listed_dir)
+
+    assert listing == LocalFilesystem().list_dir(listed_dir)
+    assert filesystem.get_daemon_stats().misses == 1
+
+
+def test_unchanged_directory_isnt_asked_for_again(running_daemon, listed_dir):
+    filesystem = DaemonFilesystem(running_daemon, autostart=False)
+    first = filesystem.list_dir(listed_dir)
+
+    # The same object, so the picker sees nothing changed
+    assert filesystem.list_dir(listed_dir) is first
+    assert filesystem.get_daemon_stats().misses == 1
+
+    (listed_dir / "c.txt").touch()
+    os.utime(listed_dir, ns=(10**9, 10**9))
+
+    assert filesystem.list_dir(listed_dir).files == ["A.txt", "b.txt", "c.txt"]
+
+
+def test_errors_are_passed_on(running_daemon, tmp_path):
+    filesystem = DaemonFilesystem(running_daemon, autostart=False)
+    # Exists here, but not as a directory the daemon can list
+    (tmp_path / "file").touch()
+
+    with pytest.raises(OSError) as error:
+        filesystem.list_dir(tmp_path / "file")
+
+    assert error.value.errno == errno.ENOTDIR
+
+
+def test_falls_back_to_listing_in_process_when_down(socket_path, listed_dir):
+    filesystem = DaemonFilesystem(socket_path, autostart=False)
+
+    assert filesystem.list_dir(listed_dir) == DirListing(
+        dirs=["sub"], files=["A.txt", "b.txt"]
+    )
+
+
+@pytest.fixture
+def stuck_daemon(socket_path):
+    """Accepts connections, but never answers anything on them"""
+    socket_path.parent.mkdir(mode=0o700)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(str(socket_path))
+    server.listen()
+    connections = []
+    stopped = threading.Event()
+
+    def accept():
+        with suppress(OSError):
+            while not stopped.is_set():
+                connections.append(server.accept()[0])
+
+    threading.Thread(target=accept, daemon=True).start()
+    yield socket_path
+
+    stopped.set()
+    server.close()
+    for connection in connections:
+        connection.close()
+
+
+def test_falls_back_before_the_call_times_out_when_stuck(stuck_daemon, listed_dir):
+    filesystem = GuardedFilesystem(
+        DaemonFilesystem(stuck_daemon, autostart=False), timeout=FS_TIMEOUT
+    )
+    started_at = time.monotonic()
+
+    assert filesystem.list_dir(listed_dir) == DirListing(
+        dirs=["sub"], files=["A.txt", "b.txt"]
+    )
+    assert time.monotonic() - started_at < FS_TIMEOUT
+    assert not filesystem.is_unresponsive(listed_dir)
+
+    # The stuck daemon isn't waited on again straight away
+    started_at = time.monotonic()
+    filesystem.list_dir(listed_dir / "sub")
+    assert time.monotonic() - started_at < DAEMON_TIMEOUT
+
+
+def test_refuses_a_directory_that_isnt_private(socket_path, listed_dir):
+    socket_path.parent.mkdir(mode=0o755)
+    os.chmod(socket_path.parent, 0o755)
+
+    with pytest.raises(PermissionError):
+        daemon.serve(socket_path, 0.1)
+
+    assert not socket_path.exists()
+
+    # Shells don't connect to anything in it either
+    filesystem = DaemonFilesystem(socket_path, autostart=False)
+    assert filesystem.list_dir(listed_dir).dirs == ["sub"]
+
+
+def test_refuses_a_symlinked_directory(socket_path, tmp_path):
+    target = tmp_path / "elsewhere"
+    target.mkdir(mode=0o700)
+    socket_path.parent.symlink_to(target)
+
+    with pytest.raises(PermissionError):
+        daemon.serve(socket_path, 0.1)
+
+    assert list(target.iterdir()) == []
+
+
+def test_doesnt_follow_a_symlinked_lock_file(socket_path, tmp_path):
+    victim = tmp_path / "victim"
+    victim.write_text("keep")
+    socket_path.parent.mkdir(mode=0o700)
+    socket_path.with_suffix(".lock").symlink_to(victim)
+
+    with pytest.raises(OSError) as error:
+        daemon.serve(socket_path, 0.1)
+
+    assert error.value.errno == errno.ELOOP
+    assert victim.read_text() == "keep"
+    assert not Path(socket_path).exists()
@@ -0,0 +1,117 @@
+import time
+from pathlib import Path
+
+import pytest
+
+from xontrib_bluray import dir_sizes as dir_sizes_module
+from xontrib_bluray.dir_sizes import DirSize, DirSizes, SizeJob
+from xontrib_bluray.filesystem import GuardedFilesystem, LocalFilesystem
+from xontrib_bluray.memory_fs import MemoryFilesystem
+from xontrib_bluray.picker_engine import PathPickerEngine
+
+PROJECT = Path("/project")
+
+
+def wait_for(job: SizeJob, names: list[str], timeout: float = 5) -> dict[str, DirSize]:
+    deadline = time.monotonic() + timeout
+
+    while time.monotonic() < deadline:
+        if all(name in job.sizes and job.sizes[name].done for name in names):
+            return job.sizes
+
+        time.sleep(0.01)
+
+    pytest.fail(f"sizes of {names} never finished: {job.sizes}")
+
+
+def measure(filesystem, directory: Path, names: list[str], budget: int = 1000):
+    job = DirSizes(max_workers=1).measure(
+        filesystem, directory, names, budget, lambda: None
+    )
+    return wait_for(job, names)
+
+
+def test_memory_filesystem_is_walked_through_the_filesystem():
+    filesystem = GuardedFilesystem(
+        MemoryFilesystem(
+            [
+                (PROJECT / "src" / "a.py", b"x" * 1000),
+                (PROJECT / "src" / "pkg" / "b.py", b"x" * 10),
+                (PROJECT / "empty", None),
+            ]
+        ),
+        timeout=5,
+    )
+
+    sizes = measure(filesystem, PROJECT, ["src", "empty"])
+
+    # Sizes are in whole 512 byte blocks, like du
+    assert sizes["src"] == DirSize(1024 + 512, complete=True, done=True)
+    assert sizes["empty"] == DirSize(0, complete=True, done=True)
+
+
+def test_budget_cuts_a_walk_through_the_filesystem_short():
+    filesystem = GuardedFilesystem(
+        MemoryFilesystem(
+            [(PROJECT / "src" / f"dir{i}" / "a.py", b"x") for i in range(10)]
+        ),
+        timeout=5,
+    )
+
+    sizes = measure(filesystem, PROJECT, ["src"], budget=5)
+
+    assert not sizes["src"].complete
+
+
+def test_unresponsive_directory_is_not_walked(tmp_path, monkeypatch):
+    (tmp_path / "hung").mkdir()
+    filesystem = GuardedFilesystem(LocalFilesystem(), timeout=5)
+    filesystem._unresponsive[tmp_path / "hung"] = time.monotonic() + 60
+
+    def fail(*args):
+        raise AssertionError("walked an unresponsive directory")
+
+    monkeypatch.setattr(DirSizes, "_walk", fail)
+
+    sizes = measure(filesystem, tmp_path, ["hung"])
+
+    assert sizes["hung"] == DirSize(0, complete=False, done=True)
+
+
+def test_mount_points_inside_the_tree_are_skipped(tmp_path, monkeypatch):
+    (tmp_path / "src" / "mnt").mkdir(parents=True)
+    (tmp_path / "src" / "mnt" / "big").write_bytes(b"x" * 100_000)
+    (tmp_path / "src" / "small").write_bytes(b"x")
+    filesystem = GuardedFilesystem(LocalFilesystem(), timeout=5)
+
+    unskipped = measure(filesystem, tmp_path, ["src"])["src"]
+
+    monkeypatch.setattr(
+        dir_sizes_module,
+        "mount_points",
+        lambda: frozenset({str(tmp_path / "src" / "mnt")}),
+    )
+    skipped = measure(filesystem, tmp_path, ["src"])["src"]
+
+    assert unskipped.size >= 100_000
+    assert skipped.size < 100_000
+    assert skipped.complete
+
+
+def test_closing_the_engine_cancels_its_size_job():
+    engine = PathPickerEngine(
+        current_dir=PROJECT,
+        filesystem=GuardedFilesystem(
+            MemoryFilesystem([(PROJECT / "src" / "a.py", b"")]), timeout=5
+        ),
+        persist_state=False,
+    )
+    engine.toggle_sizes()
+    job = engine._size_job
+    assert job is not None
+
+    engine.close()
+
+    assert job.cancelled
+    assert engine._size_job is None
+    assert engine.on_update is None
@@ -0,0 +1,190 @@
+import os
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from xontrib_bluray.filesystem import (
+    DirListing,
+    GuardedFilesystem,
+    LocalFilesystem,
+    UnresponsiveDirectoryError,
+)
+
+
+class HangingFilesystem:
+    """Stands in for a slow mount: listing anything under ``/hung`` blocks until it's released"""
+
+    def __init__(self):
+        self.released = threading.Event()
+        self.listed: list[Path] = []
+
+    def list_dir(self, path: Path) -> DirListing:
+        if path.is_relative_to("/hung"):
+            self.released.wait(10)
+
+        self.listed.append(path)
+        return DirListing(dirs=[], files=[path.name])
+
+
+@pytest.fixture
+def slow_fs():
+    filesystem = HangingFilesystem()
+    yield filesystem
+    filesystem.released.set()
+
+
+def test_hung_directory_is_marked_unresponsive(slow_fs):
+    guarded = GuardedFilesystem(slow_fs, timeout=0.05)
+
+    with pytest.raises(UnresponsiveDirectoryError):
+        guarded.list_dir(Path("/hung/a"))
+
+    assert guarded.is_unresponsive(Path("/hung/a/child"))
+
+    # Avoided from then on, without calling into the filesystem again
+    slow_fs.released.set()
+    with pytest.raises(UnresponsiveDirectoryError):
+        guarded.list_dir(Path("/hung/a"))
+    assert Path("/hung/a") not in slow_fs.listed[1:]
+
+
+def test_hung_calls_dont_use_up_the_workers(slow_fs):
+    guarded = GuardedFilesystem(slow_fs, timeout=0.05, max_workers=2)
+
+    for name in "abcd":
+        with pytest.raises(UnresponsiveDirectoryError):
+            guarded.list_dir(Path("/hung") / name)
+
+    assert guarded._executor.stuck == 4
+    # Stuck workers were replaced, so a healthy directory is still listed
+    assert guarded.list_dir(Path("/tmp")).files == ["tmp"]
+    assert not guarded.is_unresponsive(Path("/tmp"))
+
+
+def test_queued_call_is_cancelled_without_marking_its_directory(slow_fs):
+    guarded = GuardedFilesystem(slow_fs, timeout=0.05, max_workers=1)
+    # Takes the only worker without being given up on, as if another directory was still within its timeout
+    guarded._executor.submit(slow_fs.list_dir, Path("/hung/a"))
+
+    with pytest.raises(UnresponsiveDirectoryError):
+        guarded.list_dir(Path("/tmp"))
+
+    assert not guarded.is_unresponsive(Path("/tmp"))
+
+    slow_fs.released.set()
+    assert guarded.list_dir(Path("/tmp")).files == ["tmp"]
+    # The cancelled call never ran
+    assert slow_fs.listed.count(Path("/tmp")) == 1
+
+
+def test_stuck_workers_go_away_once_they_return(slow_fs):
+    guarded = GuardedFilesystem(slow_fs, timeout=0.05, max_workers=1)
+
+    with pytest.raises(UnresponsiveDirectoryError):
+        guarded.list_dir(Path("/hung/a"))
+
+    executor = guarded._executor
+    assert executor.stuck == 1
+
+    slow_fs.released.set()
+    for _ in range(100):
+        if executor.stuck == 0:
+            break
+        threading.Event().wait(0.01)
+
+    assert executor.stuck == 0
+    assert executor._threads == 1
+
+
+class SlowDict(dict):
+    """Gives other threads a chance to look up the same entry between a lookup and what's done with it"""
+
+    def get(self, key, default=None):
+        value = super().get(key, default)
+        time.sleep(0.001)
+        return value
+
+
+def test_expired_directory_is_dropped_by_several_threads_at_once():
+    filesystem = GuardedFilesystem(HangingFilesystem(), timeout=5)
+    filesystem._unresponsive = SlowDict({Path("/hung"): time.monotonic() - 1})
+    errors = []
+
+    def check():
+        try:
+            assert not filesystem.is_unresponsive(Path("/hung/child"))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=check) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert not filesystem.has_unresponsive
+
+
+def test_renamed_and_recreated_directory_is_listed_again(tmp_path):
+    filesystem = LocalFilesystem()
+    directory = tmp_path / "dir"
+    directory.mkdir()
+    (directory / "old").touch()
+
+    assert filesystem.list_dir(directory).files == ["old"]
+
+    directory.rename(tmp_path / "dir.old")
+    directory.mkdir()
+    (directory / "new").touch()
+
+    assert filesystem.list_dir(directory).files == ["new"]
+    assert filesystem.list_dir(tmp_path / "dir.old").files == ["old"]
+
+
+def test_deleted_directory_is_not_listed(tmp_path):
+    filesystem = LocalFilesystem()
+    directory = tmp_path / "dir"
+    directory.mkdir()
+    filesystem.list_dir(directory)
+
+    directory.rmdir()
+
+    with pytest.raises(FileNotFoundError):
+        filesystem.list_dir(directory)
+
+
+def test_unchanged_directory_reuses_its_handle_and_listing(tmp_path):
+    filesystem = LocalFilesystem()
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").touch()
+    # Directories modified too recently aren't cached yet
+    os.utime(tmp_path, ns=(0, 0))
+
+    first = filesystem.list_dir(tmp_path)
+
+    assert filesystem.list_dir(tmp_path) is first
+    assert first == DirListing(dirs=["a"], files=["b"])
+    assert filesystem.handles.hits == 1
+
+
+def test_cached_listing_only_takes_one_stat(tmp_path, monkeypatch):
+    filesystem = LocalFilesystem()
+    (tmp_path / "a").touch()
+    os.utime(tmp_path, ns=(0, 0))
+    first = filesystem.list_dir(tmp_path)
+    calls = []
+
+    for name in ("stat", "fstat", "open", "scandir"):
+        original = getattr(os, name)
+
+        def counted(*args, _name=name, _original=original, **kwargs):
+            calls.append(_name)
+            return _original(*args, **kwargs)
+
+        monkeypatch.setattr(os, name, counted)
+
+    assert filesystem.list_dir(tmp_path) is first
+    assert calls == ["stat"]
@@ -0,0 +1,189 @@
+import os
+import shutil
+import subprocess
+import threading
+from pathlib import Path
+
+import pytest
+
+from xontrib_bluray.filesystem import LocalFilesystem
+from xontrib_bluray.git_status import GitStatus, GitStatuses, parse_status
+
+ROOT = Path("/repo")
+
+
+def records(*fields: str) -> bytes:
+    return "".join(f"{field}\0" for field in fields).encode()
+
+
+def test_parse_changes():
+    status = parse_status(
+        ROOT,
+        records(
+            "1 .M N... 100644 100644 100644 abc abc src/main.py",
+            "1 A. N... 000000 100644 100644 000 abc new file.txt",
+            "1 MM N... 100644 100644 100644 abc abc both.txt",
+        ),
+    )
+
+    assert status.entries == {
+        "src/main.py": "modified",
+        "new file.txt": "staged",
+        "both.txt": "modified",
+    }
+    assert status.dirs == {"src": "modified"}
+
+
+def test_parse_rename_skips_the_original_path():
+    status = parse_status(
+        ROOT,
+        records(
+            "2 R. N... 100644 100644 100644 abc abc R100 docs/new name.md",
+            "docs/old name.md",
+            "? untracked.txt",
+        ),
+    )
+
+    assert status.entries == {
+        "docs/new name.md": "staged",
+        "untracked.txt": "untracked",
+    }
+
+
+def test_parse_unmerged_untracked_and_ignored():
+    status = parse_status(
+        ROOT,
+        records(
+            "u UU N... 100644 100644 100644 100644 a b c a/conflict.txt",
+            "? a/b/untracked dir/",
+            "! build/",
+            "! a/b/c/debug.log",
+        ),
+    )
+
+    assert status.entries == {
+        "a/conflict.txt": "conflicted",
+        "a/b/untracked dir": "untracked",
+        "build": "ignored",
+        "a/b/c/debug.log": "ignored",
+    }
+    # The most important state of anything in a directory, ignored entries aside
+    assert status.dirs == {"a": "conflicted", "a/b": "untracked"}
+    assert status.state_of("a") == "conflicted"
+    assert status.inherited_state("build/obj/x") == "ignored"
+    assert status.inherited_state("a/b") is None
+
+
+def test_parse_paths_with_newlines():
+    status = parse_status(
+        ROOT, records("? line\nbreak.txt", "1 .M N... 1 1 1 a a x\ny")
+    )
+
+    assert status.entries == {"line\nbreak.txt": "untracked", "x\ny": "modified"}
+
+
+def test_parse_empty_output():
+    assert parse_status(ROOT, b"") == GitStatus(ROOT, {}, {})
+
+
+requires_git = pytest.mark.skipif(shutil.which("git") is None, reason="needs git")
+
+
+def git(repo: Path, *args: str, check: bool = True) -> None:
+    subprocess.run(
+        ["git", "-c", "user.name=t", "-c", "user.email=t@example.com", *args],
+        cwd=repo,
+        check=check,
+        capture_output=True,
+        env={**os.environ, "GIT_CONFIG_GLOBAL": os.devnull, "GIT_CONFIG_NOSYSTEM": "1"},
+    )
+
+
+@pytest.fixture
+def repo(tmp_path):
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    git(repo, "init", "-q")
+    (repo / ".gitignore").write_text("*.log\n")
+    (repo / "src").mkdir()
+    (repo / "src" / "main.py").write_text("a\n")
+    (repo / "old name.txt").write_text("rename me\n")
+    (repo / "conflict.txt").write_text("base\n")
+    git(repo, "add", ".")
+    git(repo, "commit", "-qm", "base")
+    return repo
+
+
+class Waiter:
+    """An ``on_ready`` callback that can be waited on"""
+
+    def __init__(self):
+        self.ready = threading.Event()
+        self.status: GitStatus | None = None
+
+    def __call__(self, status: GitStatus) -> None:
+        self.status = status
+        self.ready.set()
+
+    def wait(self) -> GitStatus:
+        assert self.ready.wait(10)
+        return self.status
+
+
+def get_status(statuses: GitStatuses, repo: Path) -> GitStatus:
+    """The status once it's been worked out in the background"""
+    waiter = Waiter()
+    return statuses.get(LocalFilesystem(), repo, waiter) or waiter.wait()
+
+
+@requires_git
+def test_status_of_a_repository(repo):
+    (repo / "src" / "main.py").write_text("b\n")
+    git(repo, "mv", "old name.txt", "new name.txt")
+    (repo / "debug.log").write_text("")
+    (repo / "untracked\nname.txt").write_text("")
+
+    status = get_status(GitStatuses(), repo)
+
+    assert status.root == repo
+    assert status.state_of("src/main.py") == "modified"
+    assert status.state_of("src") == "modified"
+    assert status.state_of("new name.txt") == "staged"
+    assert status.state_of("old name.txt") is None
+    assert status.state_of("debug.log") == "ignored"
+    assert status.state_of("untracked\nname.txt") == "untracked"
+
+
+@requires_git
+def test_status_of_a_conflict(repo):
+    git(repo, "checkout", "-qb", "other")
+    (repo / "conflict.txt").write_text("other\n")
+    git(repo, "commit", "-qam", "other")
+    git(repo, "checkout", "-q", "-")
+    (repo / "conflict.txt").write_text("main\n")
+    git(repo, "commit", "-qam", "main")
+    git(repo, "merge", "-q", "other", check=False)
+
+    assert get_status(GitStatuses(), repo).state_of("conflict.txt") == "conflicted"
+
+
+@requires_git
+def test_refreshed_once_the_index_changes(repo):
+    statuses = GitStatuses()
+    (repo / "src" / "main.py").write_text("b\n")
+    first = get_status(statuses, repo)
+
+    assert first.state_of("src/main.py") == "modified"
+    # Unchanged, so not worked out again
+    assert statuses.get(LocalFilesystem(), repo, lambda status: None) is first
+    assert statuses.hits == 1
+
+    git(repo, "add", "src/main.py")
+    # Make sure the index's mtime moved on, however coarse the filesystem's timestamps are
+    index = repo / ".git" / "index"
+    os.utime(index, ns=(0, index.stat().st_mtime_ns + 10**9))
+
+    waiter = Waiter()
+    # Until the new status is ready, the old one is still returned
+    assert statuses.get(LocalFilesystem(), repo, waiter) is first
+    assert waiter.wait().state_of("src/main.py") == "staged"
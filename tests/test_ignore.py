@@ -0,0 +1,167 @@
+from pathlib import Path
+
+import pytest
+
+from xontrib_bluray.ignore import (
+    NO_RULES,
+    IgnoreMatcher,
+    IgnoreMatchers,
+    parse_ignore_file,
+    walk,
+)
+from xontrib_bluray.memory_fs import MemoryFilesystem
+
+REPO = Path("/repo")
+
+
+def matches(text: str, path: str, base: str = "") -> bool:
+    """Whether a path (with a trailing "/" for directories) is ignored by the rules of one ignore file"""
+    prefix, _, name = path.rstrip("/").rpartition("/")
+    prefix = f"{prefix}/" if prefix else ""
+
+    return IgnoreMatcher(prefix, parse_ignore_file(text, base)).is_ignored(
+        name, path.endswith("/")
+    )
+
+
+@pytest.mark.parametrize(
+    ("text", "path", "ignored"),
+    [
+        # Without a "/" a pattern matches at any depth
+        ("*.log", "a.log", True),
+        ("*.log", "deep/down/a.log", True),
+        ("*.log", "a.log.txt", False),
+        # With one it's relative to the ignore file
+        ("/build", "build/", True),
+        ("/build", "src/build/", False),
+        ("docs/*.md", "docs/a.md", True),
+        ("docs/*.md", "docs/sub/a.md", False),
+        # A trailing "/" only matches directories
+        ("out/", "out/", True),
+        ("out/", "out", False),
+        ("**/cache", "a/b/cache/", True),
+        ("logs/**", "logs/a/b.txt", True),
+        ("a/**/b", "a/x/y/b", True),
+        ("a/**/b", "a/b", True),
+        ("file?.txt", "file1.txt", True),
+        ("file?.txt", "file10.txt", False),
+        ("[!a]*.txt", "b.txt", True),
+        ("[!a]*.txt", "a.txt", False),
+        # Escapes, comments and trailing spaces
+        ("\\#notes", "#notes", True),
+        ("#notes", "#notes", False),
+        ("trailing   ", "trailing", True),
+        ("\\!bang", "!bang", True),
+        # The last matching rule decides
+        ("*.log\n!keep.log", "keep.log", False),
+        ("*.log\n!keep.log", "other.log", True),
+        ("!keep.log\n*.log", "keep.log", True),
+    ],
+)
+def test_rules(text, path, ignored):
+    assert matches(text, path) is ignored
+
+
+def test_rules_of_a_nested_ignore_file_are_relative_to_it():
+    assert matches("/tmp", "sub/tmp/", base="sub/")
+    assert not matches("/tmp", "tmp/", base="sub/")
+
+
+@pytest.fixture
+def repo():
+    return MemoryFilesystem(
+        [
+            (REPO / ".git" / "info" / "exclude", b"secret.txt\n"),
+            (REPO / ".gitignore", b"*.log\nbuild/\n!important.log\n"),
+            (REPO / ".ignore", b"important.log\n"),
+            (REPO / "a.log", b""),
+            (REPO / "important.log", b""),
+            (REPO / "secret.txt", b""),
+            (REPO / "main.py", b""),
+            (REPO / "build" / "out.o", b""),
+            (REPO / "src" / ".gitignore", b"!debug.log\ngenerated/\n"),
+            (REPO / "src" / "debug.log", b""),
+            (REPO / "src" / "trace.log", b""),
+            (REPO / "src" / "generated" / "x.py", b""),
+            (REPO / "src" / "app.py", b""),
+        ]
+    )
+
+
+def ignored_in(matchers, filesystem, path: Path) -> set[str]:
+    return set(matchers.get(filesystem, path).ignored_names(filesystem.list_dir(path)))
+
+
+def test_ignored_names(repo):
+    matchers = IgnoreMatchers()
+
+    # .ignore wins over .gitignore, and .git/info/exclude applies too
+    assert ignored_in(matchers, repo, REPO) == {
+        "a.log",
+        "important.log",
+        "secret.txt",
+        "build",
+    }
+    # Rules further down win over those above
+    assert ignored_in(matchers, repo, REPO / "src") == {"trace.log", "generated"}
+
+
+def test_everything_in_an_ignored_directory_is_ignored(repo):
+    repo.add_file(REPO / "build" / ".gitignore", b"!out.o\n")
+    matchers = IgnoreMatchers()
+
+    assert ignored_in(matchers, repo, REPO / "build") == {"out.o", ".gitignore"}
+
+
+def test_outside_a_repository_nothing_is_ignored(repo):
+    repo.add_file("/elsewhere/a.log")
+
+    assert IgnoreMatchers().get(repo, Path("/elsewhere")) is NO_RULES
+
+
+def test_a_new_repository_is_noticed(repo):
+    repo.add_file("/elsewhere/deep/a.log")
+    repo.add_file("/elsewhere/deep/.gitignore", b"*.log\n")
+    matchers = IgnoreMatchers()
+
+    assert matchers.find_root(repo, Path("/elsewhere/deep")) is None
+
+    repo.add_dir("/elsewhere/.git")
+
+    assert matchers.find_root(repo, Path("/elsewhere/deep")) == Path("/elsewhere")
+    assert ignored_in(matchers, repo, Path("/elsewhere/deep")) == {"a.log"}
+
+
+def test_matchers_are_reused_until_an_ignore_file_changes(repo):
+    matchers = IgnoreMatchers()
+    matcher = matchers.get(repo, REPO / "src")
+
+    assert matchers.get(repo, REPO / "src") is matcher
+
+    # Changing the root's ignore file changes every matcher below it
+    repo.add_file(REPO / ".gitignore", b"*.py\n")
+    changed = matchers.get(repo, REPO / "src")
+
+    assert changed is not matcher
+    assert changed.is_ignored("app.py", False)
+    assert not changed.is_ignored("trace.log", False)
+
+
+def test_walk_skips_ignored_directories_and_git(repo):
+    walked = [path for path, _ in walk(repo, REPO, budget=1000)]
+
+    assert walked == [REPO, REPO / "src"]
+    assert [path for path, _ in walk(repo, REPO, budget=1000, skip_ignored=False)] == [
+        REPO,
+        REPO / ".git",
+        REPO / "build",
+        REPO / "src",
+        REPO / ".git" / "info",
+        REPO / "src" / "generated",
+    ]
+
+
+def test_walk_stops_at_its_budget(repo):
+    walked = list(walk(repo, REPO, budget=3))
+
+    assert walked == [(REPO, repo.list_dir(REPO))]
@@ -0,0 +1,86 @@
+from pathlib import Path
+
+import pytest
+
+from xontrib_bluray.filesystem import KIND_DIR, KIND_FILE, DirListing
+from xontrib_bluray.memory_fs import MemoryFilesystem
+
+
+@pytest.fixture
+def filesystem():
+    return MemoryFilesystem(
+        [
+            ("/project/src/b.py", b"contents"),
+            ("/project/src/A.py", b""),
+            ("/project/empty", None),
+        ]
+    )
+
+
+def test_parents_are_added(filesystem):
+    assert filesystem.list_dir(Path("/")) == DirListing(dirs=["project"], files=[])
+    assert filesystem.list_dir(Path("/project")) == DirListing(
+        dirs=["empty", "src"], files=[]
+    )
+
+
+def test_listings_are_sorted_ignoring_case(filesystem):
+    assert filesystem.list_dir(Path("/project/src")).files == ["A.py", "b.py"]
+
+
+def test_kinds(filesystem):
+    assert filesystem.kind(Path("/project/src")) == KIND_DIR
+    assert filesystem.kind(Path("/project/src/b.py")) == KIND_FILE
+    assert filesystem.kind(Path("/project/missing")) is None
+    assert filesystem.is_dir(Path("/project/empty"))
+    assert filesystem.is_file(Path("/project/src/A.py"))
+    assert not filesystem.exists(Path("/project/src/missing.py"))
+    assert not filesystem.is_native(Path("/project"))
+
+
+def test_missing_paths_raise(filesystem):
+    with pytest.raises(FileNotFoundError):
+        filesystem.list_dir(Path("/project/missing"))
+    with pytest.raises(FileNotFoundError):
+        filesystem.stat(Path("/project/missing"))
+    with pytest.raises(FileNotFoundError):
+        filesystem.read_bytes(Path("/project/missing"), 10)
+
+
+def test_stat_and_read(filesystem):
+    path = Path("/project/src/b.py")
+
+    assert filesystem.stat(path).st_size == 8
+    assert filesystem.stat(path).st_blocks == 1
+    assert filesystem.read_bytes(path, 4) == b"cont"
+
+
+def test_changes_move_the_mtime(filesystem):
+    src = Path("/project/src")
+    before = filesystem.stat(src).st_mtime_ns
+    listing = filesystem.list_dir(src)
+
+    filesystem.add_file(src / "c.py")
+
+    assert filesystem.stat(src).st_mtime_ns > before
+    # A file's mtime is its directory's
+    assert filesystem.stat(src / "b.py").st_mtime_ns == filesystem.stat(src).st_mtime_ns
+    assert filesystem.list_dir(src) is not listing
+    assert filesystem.list_dir(src).files == ["A.py", "b.py", "c.py"]
+
+
+def test_listing_is_kept_until_a_change(filesystem):
+    src = Path("/project/src")
+
+    assert filesystem.list_dir(src) is filesystem.list_dir(src)
+
+
+def test_copy_of(tmp_path):
+    (tmp_path / "dir").mkdir()
+    (tmp_path / "dir" / "file.txt").write_bytes(b"not copied")
+
+    filesystem = MemoryFilesystem.copy_of(tmp_path)
+
+    assert filesystem.list_dir(tmp_path / "dir").files == ["file.txt"]
+    # Only the names are copied, every file is empty
+    assert filesystem.read_bytes(tmp_path / "dir" / "file.txt", 100) == b""
@@ -0,0 +1,135 @@
+import threading
+from pathlib import Path
+
+import pytest
+
+from xontrib_bluray.mounts import (
+    FUSE_POLICY,
+    LOCAL_POLICY,
+    NETWORK_POLICY,
+    Mount,
+    _MountTable,
+    _unescape,
+    parse_mountinfo,
+    policy_for_fs_type,
+)
+
+MOUNTINFO = """\
+22 1 259:2 / / rw,relatime shared:1 - ext4 /dev/nvme0n1p2 rw
+35 22 0:31 / /mnt rw,relatime shared:2 master:1 - tmpfs tmpfs rw
+36 35 0:32 / /mnt/data rw,relatime - nfs4 server:/export rw,vers=4.2
+37 22 0:33 / /home/me/My\\040Drive rw,nosuid - fuse.rclone drive: rw
+38 22 0:34 / /media/usb rw - fuseblk /dev/sdb1 rw
+not a mountinfo line
+39 22 0:35 / /mnt rw,relatime - xfs /dev/sdc1 rw
+"""
+
+
+def test_unescape():
+    assert _unescape("plain") == "plain"
+    assert _unescape("My\\040Drive") == "My Drive"
+    assert _unescape("tab\\011and\\012newline") == "tab\tand\nnewline"
+    assert _unescape("back\\134slash") == "back\\slash"
+    assert _unescape("café\\040bar") == "café bar"
+
+
+def test_parse_mountinfo():
+    mounts = parse_mountinfo(MOUNTINFO)
+
+    assert mounts[0] == Mount(Path("/"), "ext4", "/dev/nvme0n1p2")
+    # Any number of optional fields come before the separator
+    assert mounts[1] == Mount(Path("/mnt"), "tmpfs", "tmpfs")
+    assert mounts[2] == Mount(Path("/mnt/data"), "nfs4", "server:/export")
+    assert mounts[3] == Mount(Path("/home/me/My Drive"), "fuse.rclone", "drive:")
+    # The broken line is skipped
+    assert len(mounts) == 6
+
+
+@pytest.mark.parametrize(
+    ("fs_type", "policy"),
+    [
+        ("ext4", LOCAL_POLICY),
+        ("tmpfs", LOCAL_POLICY),
+        ("nfs", NETWORK_POLICY),
+        ("nfs4", NETWORK_POLICY),
+        ("cifs", NETWORK_POLICY),
+        ("fuse.sshfs", FUSE_POLICY),
+        ("fuse.rclone", FUSE_POLICY),
+        # Local disks through FUSE, like ntfs-3g
+        ("fuseblk", LOCAL_POLICY),
+    ],
+)
+def test_policy_for_fs_type(fs_type, policy):
+    assert policy_for_fs_type(fs_type) == policy
+
+
+@pytest.fixture
+def table(tmp_path):
+    mountinfo = tmp_path / "mountinfo"
+    mountinfo.write_text(MOUNTINFO)
+    return _MountTable(mountinfo)
+
+
+@pytest.mark.parametrize(
+    ("path", "mount_point"),
+    [
+        ("/", "/"),
+        ("/usr/bin", "/"),
+        ("/mnt/data", "/mnt/data"),
+        ("/mnt/data/deep/down", "/mnt/data"),
+        # Only whole path components count
+        ("/mnt/database", "/mnt"),
+        ("/home/me/My Drive/file", "/home/me/My Drive"),
+    ],
+)
+def test_longest_mount_point_wins(table, path, mount_point):
+    assert table.find(Path(path)).mount_point == Path(mount_point)
+
+
+def test_last_of_shadowed_mounts_wins(table):
+    assert table.find(Path("/mnt/file")).fs_type == "xfs"
+
+
+def test_lookups_are_cached(table):
+    table.find(Path("/mnt/data/a"))
+    table.find(Path("/mnt/data/a"))
+
+    assert (table.hits, table.misses) == (1, 1)
+
+
+def test_mount_points(table):
+    assert table.mount_points() == {
+        "/",
+        "/mnt",
+        "/mnt/data",
+        "/home/me/My Drive",
+        "/media/usb",
+    }
+
+
+def test_without_a_mount_table(tmp_path):
+    table = _MountTable(tmp_path / "missing")
+
+    assert table.find(Path("/anything")) is None
+    assert table.mount_points() == frozenset()
+
+
+def test_lookups_from_several_threads(table):
+    errors = []
+
+    def find():
+        try:
+            for i in range(2000):
+                assert table.find(Path(f"/mnt/data/{i}")).fs_type == "nfs4"
+                if i % 100 == 0:
+                    table.reset()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=find) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
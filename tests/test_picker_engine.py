@@ -0,0 +1,369 @@
+import functools
+import re
+from pathlib import Path
+
+import pytest
+
+from xontrib_bluray.filesystem import DirListing, GuardedFilesystem
+from xontrib_bluray.ignore import ignore_matchers
+from xontrib_bluray.memory_fs import MemoryFilesystem
+from xontrib_bluray.picker_engine import (
+    PathPickerEngine,
+    compile_filter,
+    dotfile_views,
+    is_dotfile,
+)
+
+PROJECT = Path("/project")
+
+
+def make_engine(files, **kwargs) -> PathPickerEngine:
+    filesystem = GuardedFilesystem(MemoryFilesystem(files), timeout=5)
+    kwargs.setdefault("current_dir", PROJECT)
+    kwargs.setdefault("show_dotfiles", True)
+    kwargs.setdefault("show_ignored", True)
+
+    return PathPickerEngine(filesystem=filesystem, persist_state=False, **kwargs)
+
+
+@pytest.fixture
+def engine():
+    return make_engine(
+        [
+            (PROJECT / "src", None),
+            (PROJECT / ".git", None),
+            (PROJECT / ".env", b""),
+            (PROJECT / "README.md", b""),
+            (PROJECT / "test_a.py", b""),
+            (PROJECT / "Test_B.py", b""),
+            (PROJECT / "notes.txt", b""),
+        ]
+    )
+
+
+@pytest.mark.parametrize(
+    ("mode", "filter_text", "name", "matches"),
+    [
+        # Globs without wildcards match anywhere in the name
+        ("glob", "read", "README.md", True),
+        ("glob", "*.py", "test_a.py", True),
+        ("glob", "*.py", "test_a.pyc", False),
+        ("glob", "test_?.py", "Test_B.py", True),
+        # Ignoring case only while the filter is all lowercase
+        ("glob", "Test*", "test_a.py", False),
+        ("glob", "[tT]est*", "test_a.py", True),
+        ("regex", "^test_", "Test_B.py", True),
+        ("regex", "^Test_", "test_a.py", False),
+        ("regex", r"\.md$", "README.md", True),
+        ("regex", "md", "README.md", True),
+    ],
+)
+def test_compile_filter(mode, filter_text, name, matches):
+    assert bool(compile_filter(mode, filter_text)(name)) is matches
+
+
+def test_compile_filter_rejects_invalid_filters():
+    with pytest.raises(re.error):
+        compile_filter("regex", "(")
+    with pytest.raises(ValueError):
+        compile_filter("fuzzy", "a")
+
+
+def test_glob_and_regex_filters_keep_the_listing_order(engine):
+    engine.set_filtering(True)
+    engine.cycle_filter_mode()
+    assert engine.filter_mode == "glob"
+
+    engine.set_filter_text("*.py")
+    assert engine.options == [".", "test_a.py", "Test_B.py"]
+
+    # The same text is applied again in the new mode, where it isn't valid
+    engine.cycle_filter_mode()
+    assert engine.filter_mode == "regex"
+    assert engine.options == ["."]
+
+    engine.set_filter_text("^(t|n)")
+    assert engine.options == [".", "notes.txt", "test_a.py", "Test_B.py"]
+
+
+def test_invalid_regex_is_reported_instead_of_raised(engine):
+    engine.set_filtering(True)
+    engine.filter_mode = "regex"
+    engine.set_filter_text("(")
+
+    assert engine.options == ["."]
+    assert engine.filter_error.startswith("Invalid regex")
+
+    engine.set_filter_text("(a|n)o")
+    assert engine.filter_error is None
+    assert engine.options == [".", "notes.txt"]
+
+
+@pytest.mark.parametrize(
+    "listing",
+    [
+        DirListing(dirs=[], files=[]),
+        DirListing(dirs=[".a", ".b"], files=[".c"]),
+        DirListing(dirs=[".git", "src"], files=[".env", "a", "B", "c"]),
+        DirListing(dirs=["docs", "src"], files=["a", "z"]),
+        # "_" and "-" sort around "." too, only names starting with "." are dotfiles
+        DirListing(dirs=["-x", ".y", "_z"], files=["#a", ".b", "~c"]),
+    ],
+)
+def test_dotfile_views(listing):
+    listing = DirListing(
+        sorted(listing.dirs, key=str.lower), sorted(listing.files, key=str.lower)
+    )
+    views = dotfile_views(listing)
+
+    assert views.shown == [".", *listing.dirs, *listing.files]
+    assert views.hidden == [
+        ".",
+        *(name for name in views.shown[1:] if not is_dotfile(name)),
+    ]
+
+    for position, option in enumerate(views.hidden):
+        assert views.shown[views.to_shown(position)] == option
+        assert views.to_hidden(views.to_shown(position)) == position
+
+    # After the current directory option, which is never hidden
+    for position, option in enumerate(views.shown[1:], 1):
+        hidden_position = views.to_hidden(position)
+
+        if not is_dotfile(option):
+            assert views.hidden[hidden_position] == option
+        else:
+            # The next option that isn't a dotfile, or the last one if there's none after it
+            following = [
+                name for name in views.shown[position:] if not is_dotfile(name)
+            ]
+            assert views.hidden[hidden_position] == (
+                following[0] if following else views.hidden[-1]
+            )
+
+
+def test_toggling_dotfiles_keeps_the_selection(engine):
+    engine.selected_option = engine.options.index("README.md")
+
+    engine.toggle_dotfiles()
+    assert engine.options == [
+        ".",
+        "src",
+        "notes.txt",
+        "README.md",
+        "test_a.py",
+        "Test_B.py",
+    ]
+    assert engine.options[engine.selected_option] == "README.md"
+
+    engine.toggle_dotfiles()
+    assert engine.options[engine.selected_option] == "README.md"
+
+
+def test_hiding_a_selected_dotfile_selects_the_next_entry(engine):
+    engine.selected_option = engine.options.index(".env")
+
+    engine.toggle_dotfiles()
+
+    assert engine.options[engine.selected_option] == "notes.txt"
+
+
+def test_views_are_reused_while_the_listing_is_unchanged(engine):
+    views = engine._views
+
+    engine.set_filtering(True)
+    engine.set_filter_text("read")
+    engine.set_filtering(False)
+
+    assert engine._views is views
+    assert engine.options is views.shown
+
+
+@pytest.fixture
+def repo_engine():
+    # Matchers are cached by path, and every memory filesystem starts its clock from the same place
+    ignore_matchers.reset()
+    yield functools.partial(
+        make_engine,
+        [
+            (PROJECT / ".git", None),
+            (PROJECT / ".gitignore", b"*.log\n"),
+            (PROJECT / ".env", b""),
+            (PROJECT / "debug.log", b""),
+            (PROJECT / "main.py", b""),
+        ],
+    )
+    ignore_matchers.reset()
+
+
+def test_toggling_ignored_files(repo_engine):
+    engine = repo_engine(show_ignored=False)
+    assert engine.options == [".", ".git", ".env", ".gitignore", "main.py"]
+
+    engine.toggle_ignored()
+    assert "debug.log" in engine.options
+
+
+@pytest.mark.parametrize(
+    ("selected", "show_dotfiles"),
+    [("debug.log", True), (".env", False)],
+)
+def test_opening_on_a_hidden_entry_selects_the_first_option(
+    repo_engine, selected, show_dotfiles
+):
+    engine = repo_engine(
+        selected_item=PROJECT / selected,
+        show_ignored=False,
+        show_dotfiles=show_dotfiles,
+    )
+
+    assert selected not in engine.options
+    assert engine.selected_option == 0
+
+
+def test_opening_on_an_entry_selects_it(repo_engine):
+    engine = repo_engine(selected_item=PROJECT / "main.py")
+
+    assert engine.options[engine.selected_option] == "main.py"
+
+
+def test_ignored_names_are_reused_while_the_listing_is_unchanged(
+    repo_engine, monkeypatch
+):
+    engine = repo_engine(show_ignored=False)
+    calls = []
+    get = ignore_matchers.get
+    monkeypatch.setattr(
+        ignore_matchers, "get", lambda *args: calls.append(args) or get(*args)
+    )
+
+    engine.set_filtering(True)
+    engine.set_filter_text("m")
+    engine.update_and_reselect()
+
+    assert calls == []
+
+    engine.filesystem.inner.add_file(PROJECT / "other.log")
+    engine.update_and_reselect()
+
+    assert len(calls) == 1
+    assert "other.log" not in engine.options
+
+
+def select(engine, option: str) -> None:
+    engine.selected_option = engine.options.index(option)
+
+
+def test_toggle_mark_marks_and_moves_on(engine):
+    select(engine, "notes.txt")
+
+    engine.toggle_mark()
+    assert engine.marked_here == {"notes.txt"}
+    assert engine.options[engine.selected_option] == "README.md"
+
+    select(engine, "notes.txt")
+    engine.toggle_mark()
+    assert engine.marked_here == set()
+
+
+def test_current_directory_can_not_be_marked(engine):
+    engine.select_first()
+    engine.toggle_mark()
+    assert engine.selected_option == 1
+
+    engine.select_first()
+    engine.mark_and_move(1)
+
+    assert engine.mark_count == 0
+
+
+def test_mark_and_move_marks_everything_moved_over(engine):
+    select(engine, "notes.txt")
+
+    engine.mark_and_move(1)
+    engine.mark_and_move(1)
+    # Moving back over a marked entry keeps it marked
+    engine.mark_and_move(-1)
+
+    assert engine.marked_here == {"notes.txt", "README.md", "test_a.py"}
+
+
+def test_toggle_mark_all_only_marks_the_filtered_options(engine):
+    engine.filter_mode = "glob"
+    engine.set_filtering(True)
+    engine.set_filter_text("test*")
+
+    engine.toggle_mark_all()
+    assert engine.marked_here == {"test_a.py", "Test_B.py"}
+
+    engine.toggle_mark_all()
+    assert engine.marked_here == set()
+
+
+def test_toggle_mark_all_marks_the_rest_when_some_are_marked(engine):
+    engine.filter_mode = "glob"
+    engine.set_filtering(True)
+    engine.set_filter_text("test*")
+    select(engine, "test_a.py")
+    engine.toggle_mark()
+
+    engine.toggle_mark_all()
+
+    assert engine.marked_here == {"test_a.py", "Test_B.py"}
+
+
+def test_marks_are_kept_per_directory():
+    engine = make_engine(
+        [
+            (PROJECT / "src" / "b.py", b""),
+            (PROJECT / "src" / "a.py", b""),
+            (PROJECT / "README.md", b""),
+        ]
+    )
+    select(engine, "README.md")
+    engine.toggle_mark()
+
+    select(engine, "src")
+    engine.navigate_down()
+    assert engine.marked_here == set()
+    engine.toggle_mark_all()
+
+    engine.navigate_up()
+    assert engine.marked_here == {"README.md"}
+    assert engine.mark_count == 3
+    # A directory at a time, in the order they were first marked in
+    assert engine.select_marked() == [
+        PROJECT / "README.md",
+        PROJECT / "src" / "a.py",
+        PROJECT / "src" / "b.py",
+    ]
+
+
+def test_nothing_is_selected_without_marks(engine):
+    # Looking at the marks of a directory doesn't mark anything
+    assert engine.marked_here == set()
+
+    assert engine.select_marked() == []
+
+
+def test_looking_around_adds_no_directories_to_the_marks(engine):
+    select(engine, "src")
+    engine.navigate_down()
+    assert engine.marked_here == set()
+    engine.navigate_up()
+    assert engine.marked_here == set()
+
+    assert engine.marked == {}
+
+
+def test_unmarking_everything_drops_the_directory(engine):
+    select(engine, "README.md")
+    engine.toggle_mark()
+    select(engine, "README.md")
+    engine.toggle_mark()
+
+    engine.toggle_mark_all()
+    engine.toggle_mark_all()
+
+    assert engine.marked == {}
+    assert engine.mark_count == 0
@@ -0,0 +1,105 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from xontrib_bluray.constants import (
+    PREVIEW_MAX_BYTES,
+    PREVIEW_MAX_LINES,
+    PREVIEW_SNIFF_BYTES,
+)
+from xontrib_bluray.filesystem import LocalFilesystem
+from xontrib_bluray.memory_fs import MemoryFilesystem
+from xontrib_bluray.preview import PreviewCache, format_size, is_binary
+
+DIR = Path("/files")
+
+
+@pytest.mark.parametrize(
+    ("size", "expected"),
+    [
+        (0, "0 B"),
+        (1023, "1023 B"),
+        (1024, "1.0 KiB"),
+        (1536, "1.5 KiB"),
+        (5 * 1024**2, "5.0 MiB"),
+        (3 * 1024**4, "3.0 TiB"),
+    ],
+)
+def test_format_size(size, expected):
+    assert format_size(size) == expected
+
+
+def test_is_binary_only_sniffs_the_start():
+    assert is_binary(b"abc\0def")
+    assert not is_binary("plain text, ünïcode".encode())
+    assert not is_binary(b"a" * PREVIEW_SNIFF_BYTES + b"\0")
+
+
+def preview(contents: bytes):
+    filesystem = MemoryFilesystem([(DIR / "file", contents)])
+    return PreviewCache().get(filesystem, DIR / "file")
+
+
+def test_text_preview():
+    result = preview(b"first\n\tindented\r\nbell\x07\x1b[31mred")
+
+    assert result.title == "30 B"
+    assert result.lines == ["first", "    indented", "bell��[31mred"]
+
+
+def test_binary_preview_has_no_lines():
+    assert preview(b"\x7fELF\0\0\0").lines == []
+    assert preview(b"\x7fELF\0\0\0").title == "7 B, binary"
+
+
+def test_preview_is_bounded():
+    result = preview(b"line\n" * (PREVIEW_MAX_BYTES // 5 + 100))
+
+    assert len(result.lines) == PREVIEW_MAX_LINES
+
+
+def test_multibyte_character_cut_off_at_the_end():
+    contents = b"a" * (PREVIEW_MAX_BYTES - 1) + "é".encode()
+
+    assert preview(contents).lines[-1].endswith("a�")
+
+
+def test_directory_preview():
+    filesystem = MemoryFilesystem(
+        [(DIR / "sub", None), (DIR / "b", b""), (DIR / "a\nb", b"")]
+    )
+
+    result = PreviewCache().get(filesystem, DIR)
+
+    assert result.title == "1 dirs, 2 files"
+    assert result.lines == ["sub/", "a�b", "b"]
+
+
+def test_previews_are_cached_until_the_file_changes():
+    filesystem = MemoryFilesystem([(DIR / "file", b"old")])
+    cache = PreviewCache()
+    first = cache.get(filesystem, DIR / "file")
+
+    assert cache.get(filesystem, DIR / "file") is first
+    assert cache.peek(DIR / "file") is first
+
+    filesystem.add_file(DIR / "file", b"new")
+
+    assert cache.get(filesystem, DIR / "file").lines == ["new"]
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_missing_file_preview_isnt_cached():
+    cache = PreviewCache()
+
+    assert cache.get(MemoryFilesystem(), DIR / "missing").lines == []
+    assert cache.peek(DIR / "missing") is None
+
+
+def test_fifo_isnt_read(tmp_path):
+    os.mkfifo(tmp_path / "fifo")
+
+    assert PreviewCache().get(LocalFilesystem(), tmp_path / "fifo").title == (
+        "Not a regular file"
+    )
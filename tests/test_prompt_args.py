@@ -0,0 +1,148 @@
+import pytest
+
+from xontrib_bluray.prompt_args import (
+    LogicalLine,
+    SelectedArg,
+    find_logical_line,
+    get_cursor_args,
+    get_selected_prompt_arg,
+    splice_arg_into_prompt,
+    split_prompt_to_args,
+)
+
+
+def splice(prompt: str, cursor_position: int, new_arg: str = "NEW"):
+    return splice_arg_into_prompt(
+        prompt=prompt,
+        cursor_args=get_cursor_args(prompt, cursor_position),
+        new_arg=new_arg,
+    )
+
+
+@pytest.mark.parametrize(
+    ("prompt", "cursor_position", "expected"),
+    [
+        ("ls foo", 3, LogicalLine(0, 6)),
+        ("echo 1\nls foo", 9, LogicalLine(7, 13)),
+        ("echo 1\nls foo", 2, LogicalLine(0, 6)),
+        # Brackets, continuations and multi-line strings don't end the line
+        ("ls (a\nb) c\necho", 2, LogicalLine(0, 10)),
+        ("ls a \\\n b\necho", 8, LogicalLine(0, 9)),
+        ('echo """a\nb"""\nls', 3, LogicalLine(0, 14)),
+        # Neither do newlines inside comments or strings with brackets in them
+        ("echo '(' # (\nls x", 16, LogicalLine(13, 17)),
+    ],
+)
+def test_find_logical_line(prompt, cursor_position, expected):
+    assert find_logical_line(prompt, cursor_position) == expected
+
+
+def test_only_the_cursors_line_is_changed():
+    prompt = "echo 1\nls foo bar\necho 2"
+
+    assert splice(prompt, 11) == (
+        "echo 1\nls NEW bar\necho 2",
+        len("echo 1\nls NEW"),
+    )
+
+
+def test_arg_after_a_multi_line_string_is_replaced():
+    prompt = 'echo """a\nb""" foo'
+
+    assert splice(prompt, len(prompt) - 1) == ('echo """a\nb""" NEW', len(prompt))
+
+
+def test_offsets_match_the_args():
+    prompt_args = split_prompt_to_args('ls  -la p"a b"')
+
+    assert prompt_args.args == ("ls", "  ", "-la", " ", 'p"a b"')
+    assert prompt_args.starts == (0, 2, 4, 7, 8)
+    assert prompt_args.ends == (2, 4, 7, 8, 14)
+
+
+@pytest.mark.parametrize(
+    ("cursor_position", "expected"),
+    [
+        (0, SelectedArg(-1, True)),
+        (1, SelectedArg(0, False)),
+        # Between an arg and whitespace, the whitespace is inserted into
+        (2, SelectedArg(1, True)),
+        (3, SelectedArg(1, True)),
+        (4, SelectedArg(1, True)),
+        (5, SelectedArg(2, False)),
+        (9, SelectedArg(4, False)),
+        (len("ls  -la foo"), SelectedArg(5, True)),
+    ],
+)
+def test_selected_arg(cursor_position, expected):
+    prompt_args = split_prompt_to_args("ls  -la foo")
+
+    assert get_selected_prompt_arg(prompt_args, cursor_position) == expected
+
+
+def linear_selected_arg(args: tuple[str, ...], cursor_position: int) -> SelectedArg:
+    """The scan over every arg which the bisect replaced"""
+    arg_position = -1
+    is_inserting = True
+    start = 0
+
+    for idx, arg in enumerate(args):
+        if cursor_position > start or (arg.isspace() and cursor_position == start):
+            arg_position = idx
+            is_inserting = arg.isspace()
+        else:
+            break
+
+        start += len(arg)
+    else:
+        if cursor_position >= start:
+            arg_position = len(args)
+            is_inserting = True
+
+    return SelectedArg(arg_position, is_inserting)
+
+
+@pytest.mark.parametrize(
+    "prompt",
+    ["ls", "ls foo", "ls  -la   p'a b' x", 'cp "a b" c/d ', "echo $HOME | grep x"],
+)
+def test_selected_arg_matches_a_linear_scan(prompt):
+    prompt_args = split_prompt_to_args(prompt)
+
+    for cursor_position in range(len(prompt_args.text) + 1):
+        assert get_selected_prompt_arg(
+            prompt_args, cursor_position
+        ) == linear_selected_arg(prompt_args.args, cursor_position)
+
+
+def test_empty_prompt():
+    assert get_selected_prompt_arg(split_prompt_to_args(""), 0) == SelectedArg(0, True)
+    assert splice("", 0) == ("NEW", 3)
+
+
+@pytest.mark.parametrize(
+    ("prompt", "cursor_position", "expected"),
+    [
+        ("ls foo bar", 4, ("ls NEW bar", 6)),
+        ("ls foo bar", 10, ("ls foo bar NEW", 14)),
+        ("ls foo", 0, ("NEW ls foo", 0)),
+        ("ls  x", 3, ("ls NEW x", 6)),
+        ("ls  x", 2, ("ls NEW  x", 6)),
+    ],
+)
+def test_splice(prompt, cursor_position, expected):
+    assert splice(prompt, cursor_position) == expected
+
+
+def test_lexed_args_are_cached_by_prompt_text():
+    split_prompt_to_args.cache_clear()
+
+    first = get_cursor_args("ls foo bar", 4)
+    second = get_cursor_args("ls foo bar", 8)
+
+    assert second.args is first.args
+    assert split_prompt_to_args.cache_info().hits == 1
+    # The cached args are shared, so the selection is worked out again for each cursor
+    assert first.selected_arg_text == "foo"
+    assert second.selected_arg_text == "bar"
+    assert get_cursor_args("ls foo baz", 8).selected_arg_text == "baz"
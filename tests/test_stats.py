@@ -0,0 +1,129 @@
+import io
+import json
+import time
+from pathlib import Path
+
+import pytest
+
+from xontrib_bluray import stats, tracing
+from xontrib_bluray.filesystem import (
+    DirListing,
+    _local_filesystem,
+    default_filesystem,
+)
+
+
+class FakeCache:
+    def __init__(self):
+        self.entries = {"a": 1}
+        self.hits = 3
+        self.misses = 1
+
+    def get_stats(self) -> stats.CacheStats:
+        return stats.CacheStats(
+            name="fake",
+            hits=self.hits,
+            misses=self.misses,
+            size=len(self.entries),
+            max_size=None,
+        )
+
+    def reset_counters(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+
+@pytest.fixture
+def cache():
+    cache = FakeCache()
+    stats.register_cache("fake", cache.get_stats, reset_counters=cache.reset_counters)
+
+    yield cache
+
+    del stats._caches["fake"]
+
+
+def run(*args: str) -> tuple[int | None, str]:
+    stdout = io.StringIO()
+    code = stats.bluray_stats(list(args), stdout=stdout)
+    return code, stdout.getvalue()
+
+
+def test_snapshot(cache):
+    snapshot = stats.snapshot()
+    fake = next(it for it in snapshot["caches"] if it["name"] == "fake")
+
+    assert fake["hits"] == 3
+    assert fake["hit_rate"] == 0.75
+    assert all(isinstance(it, int) for it in snapshot["background_tasks"].values())
+    assert snapshot["tracing"] == tracing.is_enabled()
+
+
+def test_format_snapshot(cache):
+    text = stats.format_snapshot(stats.snapshot())
+
+    assert "fake" in text
+    assert "1/inf entries, 75% hit rate (3 hits, 1 misses)" in text
+
+
+def test_format_snapshot_with_latencies():
+    text = stats.format_snapshot(
+        {
+            "tracing": True,
+            "caches": [],
+            "background_tasks": {"dir_sizes": 2},
+            "operations": {
+                "list": {"count": 1, "p50": 1.5, "p99": 2.0, "max": 2.0},
+            },
+            "counters": {"syscall.stat": 4},
+            "slowest_operations": [
+                {"name": "list", "detail": "/somewhere", "duration": 2.0}
+            ],
+            "listing_times": {"/somewhere": 2.0},
+        }
+    )
+
+    assert "dir_sizes                2 in flight" in text
+    assert "p50=1.50" in text
+    assert "syscall.stat             4" in text
+    assert "list /somewhere" in text
+
+
+def test_json_output(cache):
+    code, output = run("--json")
+
+    assert code is None
+    assert any(it["name"] == "fake" for it in json.loads(output)["caches"])
+
+
+def test_bad_arguments_return_an_error_code(cache, capsys):
+    code, output = run("--nope")
+
+    assert code == 2
+    assert output == ""
+
+
+def test_reset_only_zeroes_the_figures(cache):
+    _, output = run("--reset")
+
+    # The figures from before the reset are printed
+    assert "3 hits" in output
+    assert (cache.hits, cache.misses) == (0, 0)
+    assert cache.entries == {"a": 1}
+
+
+def test_reset_keeps_listings_and_unresponsive_directories():
+    path = Path("/bluray-test-unresponsive")
+    listing = DirListing(dirs=[], files=["a"])
+    _local_filesystem.listings.put(path, 1, listing)
+    default_filesystem._unresponsive[path] = time.monotonic() + 60
+
+    try:
+        stats.reset()
+
+        assert _local_filesystem.listings.get(path, 1) == listing
+        assert _local_filesystem.listings.hits == 1
+        assert default_filesystem.is_unresponsive(path)
+    finally:
+        default_filesystem._unresponsive.pop(path, None)
+        _local_filesystem.listings._discard(path)
@@ -0,0 +1,32 @@
+import pytest
+
+from xontrib_bluray.custom_lexer import CustomLexer
+
+
+def split(text: str) -> list[str]:
+    return CustomLexer(tolerant=True, pymode=False).split(text)
+
+
+def test_whitespace_is_kept_between_args():
+    assert split('ls   -la  p"a b"') == ["ls", "   ", "-la", "  ", 'p"a b"']
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        'rsync -avh --progress --exclude ".git" p"./build/output dir" user@host:/srv/www/',
+        "find . -name '*.py' -not -path './.venv/*' | xargs grep -n TODO",
+        'tar -czf f"archive-{date}.tar.gz" src/ docs/ README.md 2>/dev/null',
+        "python -m pytest -q tests/test_module.py::TestClass::test_case -k 'not slow'",
+    ],
+)
+def test_split_round_trips(text):
+    assert "".join(split(text)) == text
+
+
+def test_repeated_splits_are_identical():
+    # The patterns are compiled once and shared, nothing may carry over from one prompt to the next
+    lexer = CustomLexer(tolerant=True, pymode=False)
+    text = "echo 'a b' `.*\\.txt` p\"c d\""
+
+    assert lexer.split(text) == lexer.split(text) == split(text)
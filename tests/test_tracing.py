@@ -0,0 +1,133 @@
+import json
+import threading
+
+import pytest
+
+from xontrib_bluray import tracing
+from xontrib_bluray.tracing import LatencyHistogram
+
+
+@pytest.fixture
+def enabled(tmp_path):
+    trace_file = tmp_path / "trace.jsonl"
+    was_enabled, old_trace_file = tracing.is_enabled(), tracing._tracer.trace_file
+    tracing.reset()
+    tracing.configure(enabled=True, trace_file=trace_file)
+
+    yield trace_file
+
+    tracing.end_session()
+    tracing.configure(enabled=was_enabled)
+    tracing._tracer.trace_file = old_trace_file
+    tracing.reset()
+
+
+def test_small_values_have_a_bucket_each():
+    for value in range(LatencyHistogram.SUB_BUCKETS):
+        assert LatencyHistogram._bucket_index(value) == value
+        assert LatencyHistogram._bucket_value(value) == value
+
+
+@pytest.mark.parametrize(
+    ("value", "index"),
+    [
+        (32, 32),
+        (63, 63),
+        # Above that, each bucket is two values wide, then four, ...
+        (64, 64),
+        (65, 64),
+        (66, 65),
+        (127, 95),
+        (128, 96),
+        (131, 96),
+        (132, 97),
+    ],
+)
+def test_bucket_boundaries(value, index):
+    assert LatencyHistogram._bucket_index(value) == index
+
+
+def test_buckets_hold_the_values_around_their_midpoint():
+    previous = -1
+
+    for value in range(1, 1 << 20, 7):
+        index = LatencyHistogram._bucket_index(value)
+        assert index >= previous
+        previous = index
+
+        midpoint = LatencyHistogram._bucket_value(index)
+        assert abs(midpoint - value) <= value / LatencyHistogram.SUB_BUCKETS
+
+
+def test_percentiles_are_accurate_to_a_few_percent():
+    histogram = LatencyHistogram()
+
+    for value in range(1, 100_001):
+        histogram.record(value * 1000)
+
+    for percentile in (50, 90, 99):
+        expected = percentile * 1000 * 1000
+        assert histogram.percentile(percentile) == pytest.approx(expected, rel=0.03)
+
+    assert histogram.percentile(100) == pytest.approx(100_000_000, rel=0.03)
+    assert histogram.summary()["max"] == 100
+
+
+def test_empty_histogram():
+    assert LatencyHistogram().percentile(50) == 0
+    assert LatencyHistogram().summary()["mean"] == 0
+
+
+def test_span_is_a_no_op_when_disabled():
+    tracing.configure(enabled=False)
+    tracing.reset()
+
+    with tracing.span("list", "/somewhere") as span:
+        pass
+    tracing.count("syscall.stat")
+
+    assert span is None
+    assert tracing.get_histograms() == {}
+    assert tracing.get_counters() == {}
+    assert tracing.get_recent_operations() == []
+
+
+def test_span_records_its_latency(enabled):
+    with tracing.span("list", "/somewhere"):
+        pass
+
+    assert tracing.get_histograms()["list"].total_count == 1
+    assert tracing.get_recent_operations()[0].detail == "/somewhere"
+
+
+def test_counts_from_several_threads_are_all_kept(enabled):
+    def count():
+        for _ in range(10_000):
+            tracing.count("syscall.stat")
+
+    threads = [threading.Thread(target=count) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert tracing.get_counters()["syscall.stat"] == 40_000
+
+
+def test_session_is_appended_as_a_json_line(enabled):
+    tracing.start_session("path_picker")
+    with tracing.span("draw"):
+        pass
+    tracing.count("syscall.scandir", 2)
+    tracing.end_session()
+
+    tracing.start_session("change_directory")
+    tracing.end_session()
+
+    first, second = map(json.loads, enabled.read_text().splitlines())
+    assert first["session"] == "path_picker"
+    assert first["operations"]["draw"]["count"] == 1
+    assert first["counters"] == {"syscall.scandir": 2}
+    assert isinstance(first["caches"], list)
+    assert second["session"] == "change_directory"
+    assert second["operations"] == {}
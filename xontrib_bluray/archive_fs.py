@@ -0,0 +1,366 @@
+"""
+Browsing into ``.zip`` and ``.tar`` archives as if they were directories, without extracting anything.
+
+The members of ``/a/b.zip`` are addressed as paths under it, like ``/a/b.zip/dir/file``. An archive's index (the
+central directory of a zip, the headers of a tar) is read once and kept until the archive's mtime or size changes, so
+listing a directory inside it is only a dict lookup. Everything that isn't inside an archive is passed on to the
+filesystem underneath.
+"""
+
+import errno
+import lzma
+import os
+import tarfile
+import threading
+import zipfile
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path, PurePosixPath
+from stat import S_IFDIR, S_IFREG
+from typing import NamedTuple
+
+from xontrib_bluray import stats, tracing
+from xontrib_bluray.constants import (
+    ARCHIVE_CACHE_SIZE,
+    ARCHIVE_MAX_COMPRESSED_TAR_SIZE,
+)
+from xontrib_bluray.filesystem import (
+    KIND_DIR,
+    KIND_FILE,
+    DirListing,
+    Filesystem,
+    default_filesystem,
+    synthetic_stat,
+)
+
+ZIP_SUFFIXES = (".zip", ".jar", ".whl")
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+# What a corrupt or truncated archive may raise while its index is read
+_ARCHIVE_ERRORS = (
+    OSError,
+    EOFError,
+    ValueError,
+    zipfile.BadZipFile,
+    tarfile.TarError,
+    zlib.error,
+    lzma.LZMAError,
+)
+
+
+class _Member(NamedTuple):
+    is_dir: bool
+    size: int
+    mtime_ns: int
+    # What to read the member with, None for directories
+    info: zipfile.ZipInfo | tarfile.TarInfo | None
+
+
+class _ArchiveIndex:
+    __slots__ = ("archive", "key", "listings", "lock", "members")
+
+    def __init__(
+        self,
+        key: tuple[int, int],
+        archive: zipfile.ZipFile | tarfile.TarFile,
+        members: dict[str, _Member],
+        listings: dict[str, DirListing],
+    ):
+        # The mtime and size of the archive it was read from
+        self.key = key
+        # Kept open for reading members, which tarfile doesn't allow from several threads at once
+        self.archive = archive
+        self.lock = threading.Lock()
+        # Path inside the archive ("" for its root) -> the member
+        self.members = members
+        self.listings = listings
+
+    def close(self) -> None:
+        with self.lock:
+            self.archive.close()
+
+
+def _member_path(name: str) -> str | None:
+    """A member's path relative to the root of the archive, or None for names that would escape it"""
+    parts = [part for part in PurePosixPath(name).parts if part not in ("/", ".")]
+    return "/".join(parts) if parts and ".." not in parts else None
+
+
+def _zip_entries(archive: zipfile.ZipFile, archive_mtime: float):
+    for info in archive.infolist():
+        # Zips store local times, with a two second resolution. Some tools leave them zeroed, which isn't a valid date.
+        try:
+            mtime = datetime(*info.date_time).timestamp()
+        except ValueError:
+            mtime = archive_mtime
+
+        yield info.filename, info.is_dir(), info.file_size, mtime, info
+
+
+def _tar_entries(archive: tarfile.TarFile):
+    for info in archive:
+        if info.isdir():
+            yield info.name, True, 0, info.mtime, None
+        # Links are read as what they point to inside the archive, devices and FIFOs are left out
+        elif info.isreg() or info.issym() or info.islnk():
+            yield info.name, False, info.size, info.mtime, info
+
+
+def read_index(path: Path, key: tuple[int, int]) -> _ArchiveIndex:
+    # The archive is kept open by the index, for reading members from
+    name = path.name.lower()
+
+    if name.endswith(ZIP_SUFFIXES):
+        archive = zipfile.ZipFile(path)
+        entries = _zip_entries(archive, key[0] / 1e9)
+    elif name.endswith(".tar"):
+        # Only the headers are read, skipping over the members in between
+        archive = tarfile.open(path, "r:")  # noqa: SIM115
+        entries = _tar_entries(archive)
+    else:
+        # Compressed tars have to be decompressed all the way through to find every header
+        if key[1] > ARCHIVE_MAX_COMPRESSED_TAR_SIZE:
+            raise OSError(errno.EFBIG, "Too big to index", str(path))
+
+        archive = tarfile.open(path, "r:*")  # noqa: SIM115
+        entries = _tar_entries(archive)
+
+    # Directory -> the names of the directories and files in it
+    children: dict[str, tuple[set[str], set[str]]] = {"": (set(), set())}
+    members = {"": _Member(True, 0, key[0], None)}
+
+    try:
+        for name, is_dir, size, mtime, info in entries:
+            member_path = _member_path(name)
+
+            if member_path is None:
+                continue
+
+            members[member_path] = _Member(is_dir, size, int(mtime * 1e9), info)
+            if is_dir:
+                children.setdefault(member_path, (set(), set()))
+
+            # Archives don't have to have entries for the directories their members are in
+            parent, _, child = member_path.rpartition("/")
+            while True:
+                dirs, files = children.setdefault(parent, (set(), set()))
+                (dirs if is_dir else files).add(child)
+
+                if parent in members:
+                    break
+
+                members[parent] = _Member(True, 0, key[0], None)
+                is_dir = True
+                parent, _, child = parent.rpartition("/")
+    except BaseException:
+        archive.close()
+        raise
+
+    listings = {
+        path: DirListing(
+            dirs=sorted(dirs, key=str.lower),
+            files=sorted(files - dirs, key=str.lower),
+        )
+        for path, (dirs, files) in children.items()
+    }
+
+    return _ArchiveIndex(key, archive, members, listings)
+
+
+class ArchiveFilesystem:
+    def __init__(self, inner: Filesystem, max_archives: int = ARCHIVE_CACHE_SIZE):
+        self.inner = inner
+        self.max_archives = max_archives
+        # Archive -> its index, or None if it couldn't be read
+        self._indexes: OrderedDict[Path, _ArchiveIndex | None] = OrderedDict()
+        self._keys: dict[Path, tuple[int, int]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _index(self, archive: Path) -> _ArchiveIndex | None:
+        stat = self.inner.stat(archive)
+        key = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            if archive in self._indexes and self._keys[archive] == key:
+                self.hits += 1
+                self._indexes.move_to_end(archive)
+                return self._indexes[archive]
+
+            self.misses += 1
+
+        with tracing.span("read_archive_index", archive):
+            try:
+                index = read_index(archive, key)
+            except _ARCHIVE_ERRORS:
+                # Not an archive after all, it's browsed as the file it is
+                index = None
+
+        with self._lock:
+            stale = self._indexes.pop(archive, None)
+            self._indexes[archive] = index
+            self._keys[archive] = key
+
+            while len(self._indexes) > self.max_archives:
+                evicted, stale_index = self._indexes.popitem(last=False)
+                del self._keys[evicted]
+                if stale_index is not None:
+                    stale_index.close()
+
+        if stale is not None:
+            stale.close()
+
+        return index
+
+    def _resolve(self, path: Path) -> tuple[_ArchiveIndex, str] | None:
+        """The index of the archive a path is (or is inside of), and the path inside it"""
+        for candidate in (path, *path.parents):
+            if not candidate.name.lower().endswith(ZIP_SUFFIXES + TAR_SUFFIXES):
+                continue
+
+            kind = self.inner.kind(candidate)
+
+            if kind == KIND_DIR:
+                # A real directory, so is everything above it
+                return None
+            elif kind == KIND_FILE:
+                index = self._index(candidate)
+                if index is None:
+                    return None
+
+                member_path = path.relative_to(candidate).as_posix()
+                return index, "" if member_path == "." else member_path
+
+        return None
+
+    @staticmethod
+    def _member(resolved: tuple[_ArchiveIndex, str], path: Path) -> _Member:
+        index, member_path = resolved
+        member = index.members.get(member_path)
+
+        if member is None:
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), str(path))
+
+        return member
+
+    def list_dir(self, path: Path) -> DirListing:
+        resolved = self._resolve(path)
+
+        if resolved is None:
+            return self.inner.list_dir(path)
+
+        index, member_path = resolved
+        listing = index.listings.get(member_path)
+
+        if listing is None:
+            self._member(resolved, path)
+            raise NotADirectoryError(
+                errno.ENOTDIR, os.strerror(errno.ENOTDIR), str(path)
+            )
+
+        return listing
+
+    def stat(self, path: Path) -> os.stat_result:
+        resolved = self._resolve(path)
+
+        if resolved is None:
+            return self.inner.stat(path)
+
+        member = self._member(resolved, path)
+        mode = S_IFDIR | 0o755 if member.is_dir else S_IFREG | 0o644
+        return synthetic_stat(mode, member.size, member.mtime_ns)
+
+    def kind(self, path: Path) -> str | None:
+        resolved = self._resolve(path)
+
+        if resolved is None:
+            return self.inner.kind(path)
+
+        member = resolved[0].members.get(resolved[1])
+
+        if member is None:
+            return None
+
+        return KIND_DIR if member.is_dir else KIND_FILE
+
+    def is_dir(self, path: Path) -> bool:
+        return self.kind(path) == KIND_DIR
+
+    def is_file(self, path: Path) -> bool:
+        return self.kind(path) == KIND_FILE
+
+    def exists(self, path: Path) -> bool:
+        return self.kind(path) is not None
+
+    def read_bytes(self, path: Path, max_size: int) -> bytes:
+        resolved = self._resolve(path)
+
+        if resolved is None:
+            return self.inner.read_bytes(path, max_size)
+
+        member = self._member(resolved, path)
+
+        if member.info is None:
+            raise IsADirectoryError(errno.EISDIR, os.strerror(errno.EISDIR), str(path))
+
+        index = resolved[0]
+        tracing.count("archive.read")
+
+        with index.lock:
+            try:
+                if isinstance(member.info, zipfile.ZipInfo):
+                    reader = index.archive.open(member.info)
+                else:
+                    reader = index.archive.extractfile(member.info)
+            except (KeyError, *_ARCHIVE_ERRORS) as e:
+                # A link to something that isn't in the archive, or a corrupt member
+                raise OSError(f"{path}: {e}") from None
+
+            if reader is None:
+                return b""
+
+            with reader:
+                try:
+                    return reader.read(max_size)
+                except _ARCHIVE_ERRORS as e:
+                    raise OSError(f"{path}: {e}") from None
+
+    def is_native(self, path: Path) -> bool:
+        return self._resolve(path) is None and self.inner.is_native(path)
+
+    def get_stats(self) -> stats.CacheStats:
+        return stats.CacheStats(
+            name="archives",
+            hits=self.hits,
+            misses=self.misses,
+            size=len(self._indexes),
+            max_size=self.max_archives,
+        )
+
+    def reset(self) -> None:
+        with self._lock:
+            indexes = list(self._indexes.values())
+            self._indexes.clear()
+            self._keys.clear()
+
+        for index in indexes:
+            if index is not None:
+                index.close()
+
+        self.reset_counters()
+
+    def reset_counters(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+
+def enable() -> ArchiveFilesystem:
+    """Makes the picker browse into archives"""
+    filesystem = ArchiveFilesystem(default_filesystem.inner)
+    default_filesystem.inner = filesystem
+    stats.register_cache(
+        "archives", filesystem.get_stats, reset_counters=filesystem.reset_counters
+    )
+
+    return filesystem
@@ -0,0 +1,108 @@
+"""
+An optional path completer for xonsh, backed by the same listing cache as the picker. Tab completion then doesn't list
+a directory again on every key press. Only names starting with what was typed are offered, as xonsh replaces the typed
+text with the completion and anything else would silently turn a typo into a different path.
+
+Only plain paths are handled here. Anything xonsh would expand or that is quoted, like ``$HOME/...`` or ``'a b/...``,
+is left to xonsh's own path completer, which runs whenever this one has nothing to offer.
+"""
+
+import os
+from pathlib import Path
+
+from xonsh.built_ins import XSH
+from xonsh.completers.tools import RichCompletion, contextual_command_completer
+from xonsh.parsers.completion_context import CommandContext
+
+from xontrib_bluray.filesystem import default_filesystem
+from xontrib_bluray.picker_engine import is_dotfile
+
+# Characters which make a name need quoting to be used as an argument
+QUOTED_CHARS = frozenset(" \t\n'\"`$\\&|;<>()[]{}*?!#")
+
+
+def _needs_quotes(name: str) -> bool:
+    return not QUOTED_CHARS.isdisjoint(name)
+
+
+def _completion(dir_text: str, name: str, is_dir: bool) -> RichCompletion | None:
+    suffix = "/" if is_dir else ""
+    value = f"{dir_text}{name}{suffix}"
+
+    if _needs_quotes(name):
+        if "'" in name or "\\" in name or not name.isprintable():
+            # Rare enough to not be worth escaping
+            return None
+
+        value = f"'{value}'"
+
+    return RichCompletion(
+        value,
+        display=name + suffix,
+        append_space=not is_dir,
+        append_closing_quote=False,
+    )
+
+
+@contextual_command_completer
+def complete_path_from_cache(command: CommandContext):
+    """Completes paths from bluray's listing cache"""
+    prefix = command.prefix
+
+    # The command itself is completed from commands and aliases, not paths
+    if command.arg_index == 0:
+        return None
+
+    if command.opening_quote or _needs_quotes(prefix.replace("/", "")):
+        return None
+
+    dir_text, separator, partial = prefix.rpartition("/")
+    dir_text += separator
+
+    # Left to xonsh, which knows about ~user, . and ..
+    if (not dir_text and partial.startswith("~")) or partial in (".", ".."):
+        return None
+
+    if dir_text.startswith("~"):
+        directory = Path(os.path.expanduser(dir_text))
+    else:
+        directory = Path.cwd() / dir_text
+
+    try:
+        listing = default_filesystem.list_dir(directory)
+    except OSError:
+        return None
+
+    # Like globbing, dotfiles are only offered once a "." has been typed
+    if is_dotfile(partial):
+        dirs, files = listing.dirs, listing.files
+    else:
+        dirs = [name for name in listing.dirs if not is_dotfile(name)]
+        files = [name for name in listing.files if not is_dotfile(name)]
+
+    if not partial:
+        matches = [*dirs, *files]
+    else:
+        if XSH.env.get("CASE_SENSITIVE_COMPLETIONS"):
+            matches = [name for name in (*dirs, *files) if name.startswith(partial)]
+        else:
+            lower_partial = partial.lower()
+            matches = [
+                name
+                for name in (*dirs, *files)
+                if name.lower().startswith(lower_partial)
+            ]
+
+    dir_names = set(dirs)
+    completions = set()
+
+    for name in matches:
+        completion = _completion(dir_text, name, name in dir_names)
+
+        if completion is not None:
+            completions.add(completion)
+
+    if not completions:
+        return None
+
+    return completions, len(prefix)
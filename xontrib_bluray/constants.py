@@ -18,13 +18,97 @@ style = Style.from_dict(
         "text-area": "bg:ansidefault",
         "text-area.focused": "white",
         "filter-hint": "darkgray underline",
+        "filter-mode": "fg:orange",
+        "filter-error": "fg:crimson",
         "bottom-bar.disabled": "grey italic",
         "bottom-bar.filtering": "bg:crimson",
         "bottom-bar.dotfiles": "fg:white",
+        "bottom-bar.ignored": "fg:white",
+        "list.unresponsive": "fg:crimson italic",
+        "list.size": "fg:grey",
+        "list.marked": "fg:gold bold",
+        "bottom-bar.marked": "fg:gold",
+        "preview": "fg:silver",
+        "preview.title": "fg:grey italic",
+        "column.current": "bg:grey fg:black",
+        "column.hint": "fg:grey italic",
+        "list.git.ignored": "#666666",
+        "list.git.untracked": "fg:MediumSeaGreen",
+        "list.git.staged": "fg:SpringGreen",
+        "list.git.modified": "fg:orange",
+        "list.git.conflicted": "fg:crimson bold",
+        "bottom-bar.mount.local": "grey italic",
+        "bottom-bar.mount.network": "fg:orange",
+        "bottom-bar.mount.fuse": "fg:orange",
     }
 )
 MAX_HEIGHT = 20
 MAX_CONTENT_HEIGHT = MAX_HEIGHT - 3
 MIN_WIDTH = 40
+# About a 60Hz refresh rate
+DIALOG_REDRAW_INTERVAL = 1 / 60
 FILTER_MAX_RESULTS = 100
+FILTER_PATTERN_CACHE_SIZE = 32
 FILTER_MIN_SCORE = 0.1
+PROMPT_ARGS_CACHE_SIZE = 16
+# Prompt fields whose values depend on the working directory, anything starting with these is reset after ctrl+k
+CWD_PROMPT_FIELD_PREFIXES = (
+    "cwd",
+    "short_cwd",
+    "vte_new_tab_cwd",
+    "curr_branch",
+    "branch_",
+    "gitstatus",
+)
+# How long a single filesystem call may take before the directory is considered unresponsive (e.g. a hung NFS mount)
+FS_TIMEOUT = 3
+# How long an unresponsive directory is avoided for before trying it again
+FS_UNRESPONSIVE_TTL = 30
+FS_MAX_WORKERS = 4
+# Workers stuck on hung mounts are replaced, but only up to this many of them at once
+FS_MAX_STUCK_WORKERS = 16
+# Enough for the current directory and its ancestors, in all but absurdly deep trees
+FS_MAX_DIR_HANDLES = 64
+LISTING_CACHE_SIZE = 256
+# Roughly 100MB worth of names
+LISTING_CACHE_MAX_NAMES = 1_000_000
+IGNORE_MAX_MATCHERS = 256
+# Anything bigger isn't a hand written ignore file, only its start is read
+IGNORE_MAX_FILE_SIZE = 1024 * 1024
+GIT_STATUS_MAX_REPOS = 8
+GIT_STATUS_TIMEOUT = 10
+# Edits to files don't touch the index, so a git status is worked out again (in the background) once it's this old
+GIT_STATUS_MAX_AGE = 5
+PREVIEW_CACHE_SIZE = 64
+# Only the start of a file is ever read for its preview
+PREVIEW_MAX_BYTES = 16 * 1024
+# How much of that start has to be free of NULs for the file to be shown as text
+PREVIEW_SNIFF_BYTES = 1024
+PREVIEW_MAX_LINES = MAX_CONTENT_HEIGHT
+PREVIEW_WIDTH = 60
+# How long the cursor has to stay on an entry before its preview is built
+PREVIEW_DEBOUNCE = 0.1
+# The parent and child columns either side of the list, when showing Miller columns
+COLUMN_WIDTH = 28
+DIR_SIZE_WORKERS = 2
+DIR_SIZE_CACHE_SIZE = 50_000
+# Files changing deep down don't change the mtimes of the directories above them, so totals are only trusted for a while
+DIR_SIZE_MAX_AGE = 60
+# How many entries a size walk goes through before pausing, and for how long, so that it doesn't hog the GIL or disk
+DIR_SIZE_BATCH = 512
+DIR_SIZE_PAUSE = 0.002
+# How often running totals are shown while a directory is still being walked
+DIR_SIZE_UPDATE_INTERVAL = 0.1
+# Each one keeps its archive open, for reading previews of its members
+ARCHIVE_CACHE_SIZE = 8
+# Compressed tars are decompressed all the way through to be indexed, which has to fit well within FS_TIMEOUT. Bigger
+# ones are shown as plain files.
+ARCHIVE_MAX_COMPRESSED_TAR_SIZE = 8 * 1024 * 1024
+# How long the shared daemon keeps running without any shells connected to it
+DAEMON_IDLE_TIMEOUT = 10 * 60
+DAEMON_MAX_LISTINGS = 1024
+# How long to wait before trying to reach the daemon again, after it couldn't be reached
+DAEMON_RETRY_INTERVAL = 5
+# A daemon that doesn't answer within this long is given up on, and directories are listed in-process. Only a small
+# part of the shortest filesystem call timeout (a network mount's), so that listing in-process still fits in the rest.
+DAEMON_TIMEOUT = FS_TIMEOUT / 4
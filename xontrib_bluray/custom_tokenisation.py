@@ -5,6 +5,7 @@ The xonsh tokeniser does not preserve line continuations and indents for lines o
 This is a modified version which does not discard line continuations and which has a modified _tokenize function which preserves indentation for lines other than the first
 """
 
+import functools
 import io
 import itertools
 import re
@@ -68,6 +69,30 @@ if HAS_ASYNC:
     from xonsh.parsers.tokenize import ASYNC, AWAIT
 
 
+@functools.cache
+def _get_pseudo_token_program(
+    is_subproc: bool, tokenize_ioredirects: bool
+) -> re.Pattern:
+    """Builds and compiles the pseudo-token pattern once per mode, instead of once per token"""
+    if tokenize_ioredirects:
+        return _compile(getPseudoToken(is_subproc=is_subproc))
+    else:
+        return _compile(getPseudoTokenWithoutIO(is_subproc=is_subproc))
+
+
+@lazyobject
+def search_path_program():
+    return _compile(SearchPath)
+
+
+@lazyobject
+def end_programs():
+    """Compiled versions of ``endpats``, keeping the ``None`` entries for string prefixes"""
+    return {
+        key: _compile(pattern) if pattern else None for key, pattern in endpats.items()
+    }
+
+
 def custom_get_tokens(
     s, tolerant, pymode=True, tokenize_ioredirects=True, is_subproc=False
 ):
@@ -154,6 +179,8 @@ def custom__tokenize(
 ):
     lnum = parenlev = continued = 0
     numchars = "0123456789"
+    pseudoprog = _get_pseudo_token_program(is_subproc, tokenize_ioredirects)
+    search_path_match = search_path_program.match
     contstr, needcont = "", 0
     contline = None
     indents = [0]
@@ -175,7 +202,9 @@ def custom__tokenize(
         except StopIteration:
             line = b""
 
-        is_subproc = is_subproc or line[:2] in {b"![", b"$[", b"$(", b"!("}
+        if not is_subproc and line[:2] in {b"![", b"$[", b"$(", b"!("}:
+            is_subproc = True
+            pseudoprog = _get_pseudo_token_program(is_subproc, tokenize_ioredirects)
 
         if encoding is not None:
             line = line.decode(encoding)
@@ -287,11 +316,7 @@ def custom__tokenize(
             continued = 0
 
         while pos < max:
-            pseudomatch = _compile(
-                getPseudoToken(is_subproc=is_subproc)
-                if tokenize_ioredirects
-                else getPseudoTokenWithoutIO(is_subproc=is_subproc)
-            ).match(line, pos)
+            pseudomatch = pseudoprog.match(line, pos)
             if pseudomatch:  # scan for tokens
                 start, end = pseudomatch.span(1)
                 spos, epos, pos = (lnum, start), (lnum, end), end
@@ -300,12 +325,14 @@ def custom__tokenize(
                 token, initial = line[start:end], line[start]
 
                 ##### Modified - preserve whitespace after continuations
-                pre_start = pseudomatch.span(0)[0]
-                pre_token = line[pre_start:start]
-                if pre_token.isspace():
-                    yield TokenInfo(
-                        INDENT, pre_token, (lnum, pre_start), (lnum, start), line
-                    )
+                pre_start = pseudomatch.start(0)
+                # Only slice out the leading whitespace when there is some, most tokens have none
+                if pre_start != start:
+                    pre_token = line[pre_start:start]
+                    if pre_token.isspace():
+                        yield TokenInfo(
+                            INDENT, pre_token, (lnum, pre_start), (lnum, start), line
+                        )
                 ##### End
 
                 if token in _redir_check_single:
@@ -336,10 +363,10 @@ def custom__tokenize(
                         stashed = None
                     yield TokenInfo(COMMENT, token, spos, epos, line)
                 # Xonsh-specific Regex Globbing
-                elif re.match(SearchPath, token):
+                elif search_path_match(token):
                     yield TokenInfo(SEARCHPATH, token, spos, epos, line)
                 elif token in triple_quoted:
-                    endprog = _compile(endpats[token])
+                    endprog = end_programs[token]
                     endmatch = endprog.match(line, pos)
                     if endmatch:  # all on one line
                         pos = endmatch.end(0)
@@ -357,8 +384,10 @@ def custom__tokenize(
                 ):
                     if token[-1] == "\n":  # continued string
                         strstart = (lnum, start)
-                        endprog = _compile(
-                            endpats[initial] or endpats[token[1]] or endpats[token[2]]
+                        endprog = (
+                            end_programs[initial]
+                            or end_programs[token[1]]
+                            or end_programs[token[2]]
                         )
                         contstr, needcont = line[start:], 1
                         contline = line
@@ -487,6 +516,15 @@ def custom_special_handlers():
     return sh
 
 
+@functools.cache
+def _get_handler_maps() -> tuple[dict, dict]:
+    """
+    Resolves ``custom_special_handlers`` and ``token_map`` into plain dicts. ``LazyObject`` doesn't proxy ``__contains__``,
+    so ``in`` checks against the lazy objects fall back to iterating over every key.
+    """
+    return dict(custom_special_handlers), dict(token_map)
+
+
 def custom_handle_error_linecont(state, token: TokenInfo):
     yield _new_token("WS", token.string, token.start)
 
@@ -505,6 +543,7 @@ def custom_handle_token(state, token):
     token
         The token (from ``tokenize``) currently under consideration
     """
+    special_handlers, plain_token_map = _get_handler_maps()
     typ = token.type
     st = token.string
     pymode = state["pymode"][-1][0]
@@ -514,16 +553,16 @@ def custom_handle_token(state, token):
             old = state["last"].end
             if cur[0] == old[0] and cur[1] > old[1]:
                 yield _new_token("WS", token.line[old[1] : cur[1]], old)
-    if (typ, st) in custom_special_handlers:
-        yield from custom_special_handlers[(typ, st)](state, token)
-    elif (typ, st) in token_map:
+    if (typ, st) in special_handlers:
+        yield from special_handlers[(typ, st)](state, token)
+    elif (typ, st) in plain_token_map:
         state["last"] = token
-        yield _new_token(token_map[(typ, st)], st, token.start)
-    elif typ in custom_special_handlers:
-        yield from custom_special_handlers[typ](state, token)
-    elif typ in token_map:
+        yield _new_token(plain_token_map[(typ, st)], st, token.start)
+    elif typ in special_handlers:
+        yield from special_handlers[typ](state, token)
+    elif typ in plain_token_map:
         state["last"] = token
-        yield _new_token(token_map[typ], st, token.start)
+        yield _new_token(plain_token_map[typ], st, token.start)
     else:
         m = f"Unexpected token: {token}"
         yield _new_token("ERRORTOKEN", m, token.start)
@@ -0,0 +1,417 @@
+"""
+An optional daemon shared by every xonsh session of a user, which owns the directory listing cache. Ten shells open in
+the same project then only list each directory once between them.
+
+Shells talk to it over a Unix socket with a small binary protocol. Each message is a header of an opcode (or status)
+byte and a payload length, followed by the payload:
+
+    LIST   path  ->  OK  the directory's mtime and number of dirs, then the dir names followed by the file names, NUL
+                         separated
+    STATS        ->  OK  hits, misses, size and max size of the listing cache
+    any          ->  ERROR  errno, then the error message
+
+Set ``$BLURAY_DAEMON = True`` to use it. The daemon is started on demand the first time it can't be reached, and exits
+by itself once no shell has been connected to it for a while. Whenever it isn't available, directories are listed
+in-process as usual. Shells keep the listings they got from it for as long as the directory's mtime doesn't change, so
+filtering or redrawing the same directory doesn't go through the socket every time.
+
+The socket's directory must belong to the user and be private to them (``0o700``). Outside of ``$XDG_RUNTIME_DIR`` it's
+in the shared temporary directory, where another user could have created it first. Neither the daemon nor shells use a
+directory that isn't private, shells then list directories in-process. To run one in the foreground, e.g. in a
+temporary directory:
+
+    python -m xontrib_bluray.daemon --socket /tmp/some-dir/bluray.sock
+"""
+
+import argparse
+import errno
+import fcntl
+import os
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from stat import S_IMODE, S_ISDIR
+
+from xontrib_bluray import stats, tracing
+from xontrib_bluray.constants import (
+    DAEMON_IDLE_TIMEOUT,
+    DAEMON_MAX_LISTINGS,
+    DAEMON_RETRY_INTERVAL,
+    DAEMON_TIMEOUT,
+)
+from xontrib_bluray.filesystem import (
+    DirListing,
+    ListingCache,
+    LocalFilesystem,
+    default_filesystem,
+)
+
+OP_LIST = 1
+OP_STATS = 2
+STATUS_OK = 0
+STATUS_ERROR = 1
+
+HEADER = struct.Struct("!BI")
+LIST_HEADER = struct.Struct("!QI")
+STATS_RESPONSE = struct.Struct("!QQII")
+ERROR_HEADER = struct.Struct("!i")
+
+FS_ENCODING = sys.getfilesystemencoding()
+
+
+def default_socket_path() -> Path:
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+
+    if runtime_dir:
+        return Path(runtime_dir) / "bluray" / "daemon.sock"
+
+    return Path(tempfile.gettempdir()) / f"bluray-{os.getuid()}" / "daemon.sock"
+
+
+def is_private_dir(path: Path) -> bool:
+    """Whether a directory belongs to this user and nobody else can get into it, without following symlinks"""
+    try:
+        stat = os.lstat(path)
+    except OSError:
+        return False
+
+    return (
+        S_ISDIR(stat.st_mode)
+        and stat.st_uid == os.getuid()
+        and S_IMODE(stat.st_mode) & 0o077 == 0
+    )
+
+
+def encode_listing(mtime_ns: int, listing: DirListing) -> bytes:
+    # Encoded all at once, the same as os.fsencode would each name
+    names = "\0".join((*listing.dirs, *listing.files))
+    return LIST_HEADER.pack(mtime_ns, len(listing.dirs)) + names.encode(
+        FS_ENCODING, "surrogateescape"
+    )
+
+
+def decode_listing(payload: bytes) -> tuple[int, DirListing]:
+    mtime_ns, dir_count = LIST_HEADER.unpack_from(payload)
+    body = payload[LIST_HEADER.size :].decode(FS_ENCODING, "surrogateescape")
+    names = body.split("\0") if body else []
+
+    return mtime_ns, DirListing(dirs=names[:dir_count], files=names[dir_count:])
+
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes | None:
+    """Returns None if the connection was closed before anything was received"""
+    chunks = []
+    remaining = size
+
+    while remaining:
+        chunk = sock.recv(remaining)
+
+        if not chunk:
+            if remaining == size:
+                return None
+            raise ConnectionError("Connection closed mid-message")
+
+        chunks.append(chunk)
+        remaining -= len(chunk)
+
+    return b"".join(chunks)
+
+
+def _send(sock: socket.socket, code: int, payload: bytes) -> None:
+    sock.sendall(HEADER.pack(code, len(payload)) + payload)
+
+
+def _receive(sock: socket.socket) -> tuple[int, bytes] | None:
+    header = _recv_exactly(sock, HEADER.size)
+
+    if header is None:
+        return None
+
+    code, length = HEADER.unpack(header)
+    payload = _recv_exactly(sock, length) if length else b""
+
+    if payload is None:
+        raise ConnectionError("Connection closed mid-message")
+
+    return code, payload
+
+
+class _Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: Path, idle_timeout: float):
+        super().__init__(str(socket_path), _Handler)
+        self.filesystem = LocalFilesystem(
+            listings=ListingCache("daemon_listings", DAEMON_MAX_LISTINGS)
+        )
+        self.idle_timeout = idle_timeout
+        self.last_used = time.monotonic()
+        self.connections = 0
+        self._lock = threading.Lock()
+
+    def dispatch(self, op: int, payload: bytes) -> bytes:
+        if op == OP_LIST:
+            path = Path(os.fsdecode(payload))
+            return encode_listing(*self.filesystem.list_dir_with_mtime(path))
+        elif op == OP_STATS:
+            listing_stats = self.filesystem.listings.get_stats()
+            return STATS_RESPONSE.pack(
+                listing_stats.hits,
+                listing_stats.misses,
+                listing_stats.size,
+                listing_stats.max_size or 0,
+            )
+
+        raise OSError(0, f"Unknown opcode {op}")
+
+    def connection_changed(self, change: int) -> None:
+        with self._lock:
+            self.connections += change
+            self.last_used = time.monotonic()
+
+    def is_idle(self) -> bool:
+        with self._lock:
+            return (
+                self.connections == 0
+                and time.monotonic() - self.last_used > self.idle_timeout
+            )
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    server: _Server
+
+    def handle(self) -> None:
+        sock: socket.socket = self.request
+        self.server.connection_changed(1)
+
+        try:
+            while (message := _receive(sock)) is not None:
+                op, payload = message
+
+                try:
+                    response = self.server.dispatch(op, payload)
+                except OSError as e:
+                    error = (e.strerror or str(e)).encode(errors="replace")
+                    _send(sock, STATUS_ERROR, ERROR_HEADER.pack(e.errno or 0) + error)
+                else:
+                    _send(sock, STATUS_OK, response)
+        except OSError:
+            # The shell went away
+            pass
+        finally:
+            self.server.connection_changed(-1)
+
+
+def serve(socket_path: Path, idle_timeout: float = DAEMON_IDLE_TIMEOUT) -> None:
+    """Runs the daemon until it has been idle for ``idle_timeout`` seconds, unless another one is already running"""
+    socket_path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+
+    # Someone else may have made the directory first, and would then be able to replace the socket
+    if not is_private_dir(socket_path.parent):
+        raise PermissionError(
+            errno.EPERM,
+            "Not a directory private to this user",
+            str(socket_path.parent),
+        )
+
+    lock_fd = os.open(
+        socket_path.with_suffix(".lock"),
+        os.O_WRONLY | os.O_CREAT | os.O_NOFOLLOW | os.O_CLOEXEC,
+        0o600,
+    )
+
+    # Shells may start the daemon at the same time, only the one which gets the lock gets to serve
+    with open(lock_fd, "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return
+
+        # Left over from a daemon that didn't exit cleanly
+        socket_path.unlink(missing_ok=True)
+
+        with _Server(socket_path, idle_timeout) as server:
+            os.chmod(socket_path, 0o600)
+
+            def shutdown_when_idle():
+                while not server.is_idle():
+                    time.sleep(min(idle_timeout, 5))
+                server.shutdown()
+
+            threading.Thread(target=shutdown_when_idle, daemon=True).start()
+
+            try:
+                server.serve_forever()
+            finally:
+                socket_path.unlink(missing_ok=True)
+
+
+def start(socket_path: Path) -> None:
+    """Starts a daemon in the background, without waiting for it to be ready"""
+    subprocess.Popen(
+        [sys.executable, "-m", "xontrib_bluray.daemon", "--socket", str(socket_path)],
+        # Importable from here, even if bluray isn't installed in the usual way
+        cwd=Path(__file__).parent.parent,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+class _DaemonUnavailable(Exception):
+    pass
+
+
+class DaemonFilesystem(LocalFilesystem):
+    """Lists directories through the daemon, and by itself whenever the daemon can't be reached"""
+
+    def __init__(self, socket_path: Path | None = None, *, autostart: bool = True):
+        super().__init__()
+        self.socket_path = socket_path or default_socket_path()
+        self.autostart = autostart
+        # Calls come from several worker threads, each gets its own connection
+        self._local = threading.local()
+        self._retry_at = 0.0
+
+    def _connect(self) -> socket.socket:
+        if time.monotonic() < self._retry_at:
+            raise _DaemonUnavailable
+
+        socket_dir = self.socket_path.parent
+
+        if os.path.lexists(socket_dir) and not is_private_dir(socket_dir):
+            # Whoever owns it could be listening on the socket, the daemon wouldn't start there anyway
+            tracing.count("daemon.insecure")
+            self._retry_at = time.monotonic() + DAEMON_RETRY_INTERVAL
+            raise _DaemonUnavailable
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(DAEMON_TIMEOUT)
+
+        try:
+            sock.connect(str(self.socket_path))
+        except OSError:
+            sock.close()
+            self._retry_at = time.monotonic() + DAEMON_RETRY_INTERVAL
+
+            if self.autostart:
+                tracing.count("daemon.start")
+                start(self.socket_path)
+
+            raise _DaemonUnavailable from None
+
+        return sock
+
+    def _request(self, op: int, payload: bytes = b"") -> bytes:
+        sock: socket.socket | None = getattr(self._local, "sock", None)
+
+        if sock is None:
+            sock = self._local.sock = self._connect()
+
+        try:
+            _send(sock, op, payload)
+            response = _receive(sock)
+
+            if response is None:
+                raise ConnectionError("The daemon closed the connection")
+        except OSError:
+            # The daemon exited (or is stuck), forget the connection and make a new one once it's had time to recover,
+            # rather than waiting on a stuck one for every listing
+            sock.close()
+            self._local.sock = None
+            self._retry_at = time.monotonic() + DAEMON_RETRY_INTERVAL
+            raise _DaemonUnavailable from None
+
+        status, response_payload = response
+
+        if status == STATUS_ERROR:
+            (error_code,) = ERROR_HEADER.unpack_from(response_payload)
+            message = response_payload[ERROR_HEADER.size :].decode()
+            raise OSError(error_code, message)
+
+        return response_payload
+
+    def list_dir(self, path: Path) -> DirListing:
+        with self.handles.open(path) as (fd, mtime_ns):
+            # The same listing as last time while the directory is unchanged, so that the picker can tell nothing changed
+            # by its identity, and without asking the daemon again
+            listing = self.listings.get(path, mtime_ns)
+
+            if listing is not None:
+                return listing
+
+            try:
+                payload = self._request(OP_LIST, os.fsencode(path))
+            except _DaemonUnavailable:
+                tracing.count("daemon.fallback")
+                listing = self._scan(fd)
+            except OSError as e:
+                # Report the error as if it happened here
+                raise OSError(e.errno, e.strerror, str(path)) from None
+            else:
+                tracing.count("daemon.list")
+                # Cached by the mtime the daemon listed it at, a change since then is a miss next time
+                mtime_ns, listing = decode_listing(payload)
+
+        self.listings.put(path, mtime_ns, listing)
+        return listing
+
+    def get_daemon_stats(self) -> stats.CacheStats:
+        try:
+            hits, misses, size, max_size = STATS_RESPONSE.unpack(
+                self._request(OP_STATS)
+            )
+        except (_DaemonUnavailable, OSError, struct.error):
+            hits, misses, size, max_size = 0, 0, 0, DAEMON_MAX_LISTINGS
+
+        return stats.CacheStats(
+            name="daemon_listings",
+            hits=hits,
+            misses=misses,
+            size=size,
+            max_size=max_size,
+        )
+
+
+def enable(socket_path: Path | None = None) -> DaemonFilesystem:
+    """Makes the picker list directories through the daemon"""
+    filesystem = DaemonFilesystem(socket_path)
+    default_filesystem.inner = filesystem
+    stats.register_cache(
+        "dir_handles",
+        filesystem.handles.get_stats,
+        reset_counters=filesystem.handles.reset_counters,
+    )
+    stats.register_cache(
+        "listings",
+        filesystem.listings.get_stats,
+        reset_counters=filesystem.listings.reset_counters,
+    )
+    stats.register_cache("daemon_listings", filesystem.get_daemon_stats)
+
+    return filesystem
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--socket", type=Path, default=default_socket_path())
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=DAEMON_IDLE_TIMEOUT,
+        help="exit after this many seconds without any shells connected",
+    )
+    args = parser.parse_args()
+
+    serve(args.socket, args.idle_timeout)
+
+
+if __name__ == "__main__":
+    main()
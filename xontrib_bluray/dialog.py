@@ -6,6 +6,8 @@ from prompt_toolkit.application import get_app
 from prompt_toolkit.layout import Float, FloatContainer
 from prompt_toolkit.layout.layout import FocusableElement
 
+from xontrib_bluray.constants import DIALOG_REDRAW_INTERVAL
+
 
 class DialogFuture[T](Protocol):
     future: Future[T]
@@ -50,6 +52,9 @@ async def show_as_float[T](
     timeoutlen, ttimeoutlen = app.timeoutlen, app.ttimeoutlen
     # Prevents there being a delay for the escape keypress handler: https://github.com/prompt-toolkit/python-prompt-toolkit/issues/1901
     app.timeoutlen, app.ttimeoutlen = 0, 0
+    min_redraw_interval = app.min_redraw_interval
+    # Redraw at most as often as a terminal can show it, however fast keys come in
+    app.min_redraw_interval = max(min_redraw_interval or 0, DIALOG_REDRAW_INTERVAL)
 
     try:
         if hasattr(dialog, "on_show"):
@@ -57,8 +62,12 @@ async def show_as_float[T](
 
         result = await dialog.future
     finally:
+        if hasattr(dialog, "on_hide"):
+            dialog.on_hide()
+
         app.layout.focus(focused_before)
         app.timeoutlen, app.ttimeoutlen = timeoutlen, ttimeoutlen
+        app.min_redraw_interval = min_redraw_interval
 
     if float_ in root_container.floats:
         root_container.floats.remove(float_)
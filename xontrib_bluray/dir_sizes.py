@@ -0,0 +1,366 @@
+"""
+The total size of everything in a directory, like ``du``, worked out in the background.
+
+Each directory's total is cached by its device, inode and mtime, so walking a tree again only descends into the
+directories that changed (or whose totals have gotten old). Walks run on a couple of low priority worker threads, pause
+between batches of entries so the shell stays responsive, stop at the mount's search budget and are cancelled as soon
+as the picker moves to another directory (or closes).
+
+Directories on disk are walked with ``os.scandir`` directly, never crossing into another mount, so a hung network mount
+inside the tree can't hold up a worker. Anything else, like the inside of an archive, is walked through its filesystem.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from contextlib import suppress
+from pathlib import Path
+from stat import S_ISDIR
+from typing import NamedTuple
+
+from xontrib_bluray import stats, tracing
+from xontrib_bluray.constants import (
+    DIR_SIZE_BATCH,
+    DIR_SIZE_CACHE_SIZE,
+    DIR_SIZE_MAX_AGE,
+    DIR_SIZE_PAUSE,
+    DIR_SIZE_UPDATE_INTERVAL,
+    DIR_SIZE_WORKERS,
+)
+from xontrib_bluray.filesystem import DaemonExecutor, GuardedFilesystem
+from xontrib_bluray.mounts import mount_points
+
+# The lowest priority, for both CPU and (with the default IO scheduler) disk access
+WORKER_NICENESS = 19
+
+
+class DirSize(NamedTuple):
+    # Bytes used on disk, like du
+    size: int
+    # Whether everything in the directory was counted, rather than some of it being unreadable or over the budget
+    complete: bool
+    # Whether the walk is over, or this is a running total
+    done: bool
+
+
+class _Frame:
+    """A directory being walked, waiting on its subdirectories"""
+
+    __slots__ = ("complete", "key", "path", "subdirs", "total")
+
+    def __init__(self, path: str, key: tuple[int, int, int], total: int):
+        self.path = path
+        self.key = key
+        self.total = total
+        self.complete = True
+        self.subdirs: list[tuple[str, os.stat_result]] = []
+
+
+def _key(stat: os.stat_result) -> tuple[int, int, int]:
+    return stat.st_dev, stat.st_ino, stat.st_mtime_ns
+
+
+def _usage(stat: os.stat_result) -> int:
+    return stat.st_blocks * 512
+
+
+class SizeJob:
+    """Walks the subdirectories of the directory being browsed"""
+
+    def __init__(self, budget: int, on_update: Callable[[], None]):
+        # Name -> its size, or running total
+        self.sizes: dict[str, DirSize] = {}
+        # Entries left to visit, shared by every walk in the job
+        self.budget = budget
+        self.on_update = on_update
+        self.cancelled = False
+        self._last_update = 0.0
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+    def update(self, name: str, size: DirSize) -> None:
+        self.sizes[name] = size
+        now = time.monotonic()
+
+        # Running totals are only passed on every now and then, finished ones always
+        if size.done or now - self._last_update >= DIR_SIZE_UPDATE_INTERVAL:
+            self._last_update = now
+            self.on_update()
+
+
+class DirSizes:
+    def __init__(
+        self, max_workers: int = DIR_SIZE_WORKERS, max_sizes: int = DIR_SIZE_CACHE_SIZE
+    ):
+        self.max_sizes = max_sizes
+        self._executor = DaemonExecutor(max_workers, name="bluray-du")
+        # (dev, inode, mtime) -> the directory's total, and when it was worked out
+        self._sizes: OrderedDict[tuple[int, int, int], tuple[int, float]] = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self._running = 0
+        self.hits = 0
+        self.misses = 0
+
+    def measure(
+        self,
+        filesystem: GuardedFilesystem,
+        directory: Path,
+        names: list[str],
+        budget: int,
+        on_update: Callable[[], None],
+    ) -> SizeJob:
+        """
+        Starts working out the sizes of some subdirectories in the background, in order. ``on_update`` is called from
+        the worker threads as their sizes (or running totals) come in.
+        """
+        job = SizeJob(budget, on_update)
+
+        try:
+            native = filesystem.is_native(directory)
+        except OSError:
+            for name in names:
+                job.sizes[name] = DirSize(0, complete=False, done=True)
+
+            return job
+
+        for name in names:
+            self._executor.submit(
+                self._measure, job, filesystem, directory / name, native
+            )
+
+        return job
+
+    def _lookup(self, key: tuple[int, int, int]) -> int | None:
+        with self._lock:
+            cached = self._sizes.get(key)
+
+            if cached is None or time.monotonic() - cached[1] > DIR_SIZE_MAX_AGE:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._sizes.move_to_end(key)
+            return cached[0]
+
+    def _store(self, key: tuple[int, int, int], size: int) -> None:
+        with self._lock:
+            self._sizes[key] = (size, time.monotonic())
+            self._sizes.move_to_end(key)
+
+            while len(self._sizes) > self.max_sizes:
+                self._sizes.popitem(last=False)
+
+    def _measure(
+        self, job: SizeJob, filesystem: GuardedFilesystem, path: Path, native: bool
+    ) -> None:
+        if job.cancelled:
+            return
+
+        if filesystem.is_unresponsive(path):
+            job.update(path.name, DirSize(0, complete=False, done=True))
+            return
+
+        with self._lock:
+            self._running += 1
+
+        # Per thread on Linux, so only the walkers give way
+        with suppress(OSError, AttributeError):
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), WORKER_NICENESS)
+
+        try:
+            with tracing.span("dir_size", path):
+                if native:
+                    self._walk(job, path)
+                else:
+                    self._walk_through(job, filesystem, path)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    def _walk(self, job: SizeJob, root: Path) -> None:
+        try:
+            root_stat = os.lstat(root)
+        except OSError:
+            job.update(root.name, DirSize(0, complete=False, done=True))
+            return
+
+        cached = self._lookup(_key(root_stat))
+        if cached is not None:
+            job.update(root.name, DirSize(cached, complete=True, done=True))
+            return
+
+        # Walked depth first without recursion, each frame's total only including its finished subdirectories
+        stack = [_Frame(os.fspath(root), _key(root_stat), _usage(root_stat))]
+        # Files with several hard links are only counted once, like du does
+        linked: set[int] = set()
+        # Looked up before anything inside the tree is stat'ed, a stat of a hung mount's root would never return
+        skipped = mount_points()
+        self._scan(job, stack[0], root_stat.st_dev, linked, skipped)
+        batch = 0
+
+        while stack:
+            frame = stack[-1]
+
+            if frame.subdirs and job.budget > 0 and not job.cancelled:
+                path, stat = frame.subdirs.pop()
+                cached = self._lookup(_key(stat))
+
+                if cached is not None:
+                    frame.total += cached
+                    continue
+
+                child = _Frame(path, _key(stat), _usage(stat))
+                batch += self._scan(job, child, root_stat.st_dev, linked, skipped)
+                stack.append(child)
+
+                if batch >= DIR_SIZE_BATCH:
+                    batch = 0
+                    job.update(
+                        root.name,
+                        DirSize(
+                            sum(open_frame.total for open_frame in stack),
+                            complete=False,
+                            done=False,
+                        ),
+                    )
+                    # Let the shell have the GIL (and the disk) for a moment
+                    time.sleep(DIR_SIZE_PAUSE)
+
+                continue
+
+            stack.pop()
+            # Cut short by the budget (or cancelled), its total is only a lower bound
+            if frame.subdirs:
+                frame.complete = False
+
+            if frame.complete:
+                self._store(frame.key, frame.total)
+
+            if stack:
+                stack[-1].total += frame.total
+                stack[-1].complete &= frame.complete
+            elif not job.cancelled:
+                job.update(root.name, DirSize(frame.total, frame.complete, done=True))
+
+    def _walk_through(
+        self, job: SizeJob, filesystem: GuardedFilesystem, root: Path
+    ) -> None:
+        """
+        Adds up a directory one listing and stat at a time, for filesystems whose paths aren't real ones. Their stats
+        have no device or inode to cache totals by, so nothing is cached.
+        """
+        total = 0
+        complete = True
+        stack = [root]
+        batch = 0
+
+        while stack:
+            if job.cancelled:
+                return
+            elif job.budget <= 0:
+                complete = False
+                break
+
+            path = stack.pop()
+
+            try:
+                listing = filesystem.list_dir(path)
+            except OSError:
+                complete = False
+                continue
+
+            entries = len(listing.dirs) + len(listing.files)
+            job.budget -= entries
+            batch += entries
+            stack.extend(path / name for name in listing.dirs)
+
+            for name in listing.files:
+                try:
+                    total += _usage(filesystem.stat(path / name))
+                except OSError:
+                    complete = False
+
+            if batch >= DIR_SIZE_BATCH:
+                batch = 0
+                job.update(root.name, DirSize(total, complete=False, done=False))
+                time.sleep(DIR_SIZE_PAUSE)
+
+        job.update(root.name, DirSize(total, complete, done=True))
+
+    def _scan(
+        self,
+        job: SizeJob,
+        frame: _Frame,
+        dev: int,
+        linked: set[int],
+        skipped: frozenset[str],
+    ) -> int:
+        """Adds up the files directly in a directory, and returns how many entries it has"""
+        entries = 0
+        tracing.count("syscall.scandir")
+
+        try:
+            with os.scandir(frame.path) as iterator:
+                for entry in iterator:
+                    entries += 1
+
+                    # Like du -x, other filesystems mounted inside aren't counted (/proc would never end). Going by
+                    # the type in the listing, mount points aren't even stat'ed.
+                    if entry.path in skipped and entry.is_dir(follow_symlinks=False):
+                        continue
+
+                    try:
+                        stat = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        frame.complete = False
+                        continue
+
+                    if not S_ISDIR(stat.st_mode):
+                        if stat.st_nlink > 1:
+                            if stat.st_ino in linked:
+                                continue
+                            linked.add(stat.st_ino)
+
+                        frame.total += _usage(stat)
+                    # Or mounted since the mount points were looked up
+                    elif stat.st_dev == dev:
+                        frame.subdirs.append((entry.path, stat))
+        except OSError:
+            frame.complete = False
+
+        job.budget -= entries
+        return entries
+
+    def count_running(self) -> int:
+        return self._running
+
+    def get_stats(self) -> stats.CacheStats:
+        return stats.CacheStats(
+            name="dir_sizes",
+            hits=self.hits,
+            misses=self.misses,
+            size=len(self._sizes),
+            max_size=self.max_sizes,
+        )
+
+    def reset(self) -> None:
+        with self._lock:
+            self._sizes.clear()
+
+        self.reset_counters()
+
+    def reset_counters(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+
+dir_sizes = DirSizes()
+stats.register_cache(
+    "dir_sizes", dir_sizes.get_stats, reset_counters=dir_sizes.reset_counters
+)
+stats.register_background_tasks("dir_sizes", dir_sizes.count_running)
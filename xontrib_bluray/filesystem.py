@@ -0,0 +1,683 @@
+"""
+Filesystem access for the picker.
+
+Everything the picker needs from the filesystem goes through a ``GuardedFilesystem``, which runs each call on a worker
+thread with a timeout. Browsing into a hung mount (stale NFS, sshfs, ...) then can't freeze the whole shell; the
+directory is marked as unresponsive and avoided for a while instead.
+
+What's behind it is any ``Filesystem``: the local one here, an in-memory one (``memory_fs``) for tests and benchmarks,
+or one which also browses into archives (``archive_fs``).
+"""
+
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Iterator
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import contextmanager, suppress
+from functools import partial
+from pathlib import Path
+from stat import S_ISDIR, S_ISREG
+from typing import NamedTuple, Protocol
+
+from xontrib_bluray import stats, tracing
+from xontrib_bluray.constants import (
+    FS_MAX_DIR_HANDLES,
+    FS_MAX_STUCK_WORKERS,
+    FS_MAX_WORKERS,
+    FS_UNRESPONSIVE_TTL,
+    LISTING_CACHE_MAX_NAMES,
+    LISTING_CACHE_SIZE,
+)
+from xontrib_bluray.mounts import get_mount_policy
+
+DIR_OPEN_FLAGS = os.O_RDONLY | os.O_DIRECTORY | getattr(os, "O_CLOEXEC", 0)
+# Opening a FIFO for reading would otherwise block until something writes to it
+FILE_OPEN_FLAGS = os.O_RDONLY | os.O_NONBLOCK | getattr(os, "O_CLOEXEC", 0)
+RACY_MTIME_NS = 2_000_000_000
+
+# What kind of entry a path is, see ``Filesystem.kind``
+KIND_DIR = "dir"
+KIND_FILE = "file"
+# FIFOs, sockets, devices...
+KIND_OTHER = "other"
+
+
+class UnresponsiveDirectoryError(TimeoutError):
+    """A filesystem call took too long. As a TimeoutError, this is also an OSError."""
+
+
+class DirListing(NamedTuple):
+    """
+    The names of the directories and files in a directory, each sorted case insensitively. Listings may be cached and
+    shared, so they must not be modified.
+    """
+
+    dirs: list[str]
+    files: list[str]
+
+
+def kind_of(mode: int) -> str:
+    if S_ISDIR(mode):
+        return KIND_DIR
+    elif S_ISREG(mode):
+        return KIND_FILE
+
+    return KIND_OTHER
+
+
+def synthetic_stat(mode: int, size: int, mtime_ns: int) -> os.stat_result:
+    """A stat result for an entry that isn't really on disk, with only its kind, size and mtime filled in"""
+    mtime = mtime_ns // 1_000_000_000
+    return os.stat_result(
+        (mode, 0, 0, 1, 0, 0, size, mtime, mtime, mtime),
+        {
+            "st_atime_ns": mtime_ns,
+            "st_mtime_ns": mtime_ns,
+            "st_ctime_ns": mtime_ns,
+            "st_blocks": (size + 511) // 512,
+        },
+    )
+
+
+class Filesystem(Protocol):
+    """
+    What the picker needs from a filesystem. Paths are absolute ``Path``s, whose own ``parent`` and ``/`` are how
+    backends are navigated, including those whose paths aren't real ones (like the members of an archive).
+    """
+
+    def list_dir(self, path: Path) -> DirListing: ...
+
+    def kind(self, path: Path) -> str | None:
+        """``KIND_DIR``, ``KIND_FILE`` or ``KIND_OTHER``, following symlinks, or None if there's nothing there"""
+        ...
+
+    def is_dir(self, path: Path) -> bool: ...
+
+    def is_file(self, path: Path) -> bool: ...
+
+    def exists(self, path: Path) -> bool: ...
+
+    def stat(self, path: Path) -> os.stat_result: ...
+
+    def read_bytes(self, path: Path, max_size: int) -> bytes:
+        """The start of a file, at most ``max_size`` bytes of it"""
+        ...
+
+    def is_native(self, path: Path) -> bool:
+        """Whether the path is a real one, which can also be read with ``os`` calls rather than only through here"""
+        ...
+
+
+class _DirHandle:
+    __slots__ = ("evicted", "fd", "identity", "users")
+
+    def __init__(self, fd: int, identity: tuple[int, int]):
+        self.fd = fd
+        # The device and inode of the directory it was opened on
+        self.identity = identity
+        self.users = 0
+        self.evicted = False
+
+
+class _DirHandles:
+    """
+    ``O_DIRECTORY`` handles for the most recently used directories, which while navigating are the current directory
+    and its ancestors. Stat-ing something in one only has the kernel resolve a single path component instead of the
+    whole (possibly very deep) path again, and a directory whose listing is cached isn't opened again.
+
+    Reusing a handle still takes one stat of the directory's full path, to make sure it hasn't been renamed or replaced
+    since. That stat's mtime is also what its cached listing is checked against, so it's the only syscall a cached
+    listing costs. A changed directory keeps its inode but not its mtime, while a renamed one keeps its mtime too, so
+    neither check can stand in for the other.
+
+    Handles are used from several worker threads at once, so one is only closed once it's been evicted and nothing is
+    using it any more.
+    """
+
+    def __init__(self, max_handles: int):
+        self.max_handles = max_handles
+        self._handles: OrderedDict[Path, _DirHandle] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _acquire_cached(self, path: Path) -> _DirHandle | None:
+        with self._lock:
+            handle = self._handles.get(path)
+
+            if handle is not None:
+                handle.users += 1
+                self._handles.move_to_end(path)
+
+            return handle
+
+    def _release(self, handle: _DirHandle) -> None:
+        with self._lock:
+            handle.users -= 1
+            close = handle.evicted and handle.users == 0
+
+        if close:
+            os.close(handle.fd)
+
+    def _evict(self, path: Path, handle: _DirHandle) -> None:
+        """Must be called with the lock held"""
+        if self._handles.get(path) is handle:
+            del self._handles[path]
+
+        handle.evicted = True
+        if handle.users == 0:
+            os.close(handle.fd)
+
+    def _acquire_current(self, path: Path) -> tuple[_DirHandle, int] | None:
+        """
+        A cached handle and the directory's mtime, if the path still leads to the directory it was opened on. The
+        directory may have been renamed (``mv dir dir.old && mkdir dir``) or deleted since, and the handle would then
+        list the wrong one.
+        """
+        handle = self._acquire_cached(path)
+
+        if handle is None:
+            return None
+
+        # By the full path, as the handle of its parent could just as well be out of date
+        tracing.count("syscall.stat")
+        try:
+            current = os.stat(path)
+        except OSError:
+            current = None
+
+        if current is None or (current.st_dev, current.st_ino) != handle.identity:
+            with self._lock:
+                self._evict(path, handle)
+            self._release(handle)
+            return None
+
+        return handle, current.st_mtime_ns
+
+    def _open(self, path: Path) -> tuple[_DirHandle, int]:
+        # By the full path too, opening it relative to its parent's handle would need that handle to be checked first
+        tracing.count("syscall.open")
+        fd = os.open(path, DIR_OPEN_FLAGS)
+
+        try:
+            opened = os.fstat(fd)
+        except OSError:
+            os.close(fd)
+            raise
+
+        handle = _DirHandle(fd, (opened.st_dev, opened.st_ino))
+        handle.users = 1
+
+        with self._lock:
+            existing = self._handles.get(path)
+            if existing is not None:
+                self._evict(path, existing)
+
+            self._handles[path] = handle
+
+            while len(self._handles) > self.max_handles:
+                self._evict(*next(iter(self._handles.items())))
+
+        return handle, opened.st_mtime_ns
+
+    @contextmanager
+    def open(self, path: Path) -> Iterator[tuple[int, int]]:
+        """A file descriptor for a directory, only valid inside the ``with`` block, and the directory's mtime"""
+        current = self._acquire_current(path)
+
+        if current is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            current = self._open(path)
+
+        handle, mtime_ns = current
+
+        try:
+            yield handle.fd, mtime_ns
+        finally:
+            self._release(handle)
+
+    @contextmanager
+    def open_parent(self, path: Path) -> Iterator[tuple[int | None, str | Path]]:
+        """
+        A file descriptor for the parent of a path if it's already open, along with what to pass to a ``dir_fd``
+        relative call: the name in the parent or otherwise the full path. Unlike ``open``, the parent's handle isn't
+        checked against renames, which would cost more than the stat it saves. Entries are stat-ed right after their
+        directory was listed, which did check it.
+        """
+        parent = self._acquire_cached(path.parent) if path.parent != path else None
+
+        if parent is None:
+            yield None, path
+            return
+
+        try:
+            yield parent.fd, path.name
+        finally:
+            self._release(parent)
+
+    def get_stats(self) -> stats.CacheStats:
+        return stats.CacheStats(
+            name="dir_handles",
+            hits=self.hits,
+            misses=self.misses,
+            size=len(self._handles),
+            max_size=self.max_handles,
+        )
+
+    def reset(self) -> None:
+        with self._lock:
+            for path, handle in list(self._handles.items()):
+                self._evict(path, handle)
+
+        self.reset_counters()
+
+    def reset_counters(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+
+class ListingCache:
+    """
+    Directory listings, reused for as long as the directory's mtime hasn't changed. Bounded by both the number of
+    listings and the total number of names in them, so that a few huge directories can't take up all the memory.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_listings: int = LISTING_CACHE_SIZE,
+        max_names: int = LISTING_CACHE_MAX_NAMES,
+    ):
+        self.name = name
+        self.max_listings = max_listings
+        self.max_names = max_names
+        # Path -> mtime and the listing
+        self._listings: OrderedDict[Path, tuple[int, DirListing]] = OrderedDict()
+        self._names = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path: Path, mtime_ns: int) -> DirListing | None:
+        with self._lock:
+            cached = self._listings.get(path)
+
+            if cached is None or cached[0] != mtime_ns:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._listings.move_to_end(path)
+            return cached[1]
+
+    def put(self, path: Path, mtime_ns: int, listing: DirListing) -> None:
+        # A directory modified this recently may be modified again within the same mtime tick without its mtime
+        # changing, so it can't be cached yet
+        if time.time_ns() - mtime_ns < RACY_MTIME_NS:
+            return
+
+        with self._lock:
+            self._discard(path)
+            self._listings[path] = (mtime_ns, listing)
+            self._names += len(listing.dirs) + len(listing.files)
+
+            while len(self._listings) > 1 and (
+                len(self._listings) > self.max_listings or self._names > self.max_names
+            ):
+                self._discard(next(iter(self._listings)))
+
+    def _discard(self, path: Path) -> None:
+        """Must be called with the lock held"""
+        cached = self._listings.pop(path, None)
+
+        if cached is not None:
+            self._names -= len(cached[1].dirs) + len(cached[1].files)
+
+    def get_stats(self) -> stats.CacheStats:
+        return stats.CacheStats(
+            name=self.name,
+            hits=self.hits,
+            misses=self.misses,
+            size=len(self._listings),
+            max_size=self.max_listings,
+        )
+
+    def reset(self) -> None:
+        with self._lock:
+            self._listings.clear()
+            self._names = 0
+
+        self.reset_counters()
+
+    def reset_counters(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+
+class LocalFilesystem:
+    def __init__(
+        self,
+        max_dir_handles: int = FS_MAX_DIR_HANDLES,
+        listings: ListingCache | None = None,
+    ):
+        self.handles = _DirHandles(max_dir_handles)
+        self.listings = listings or ListingCache("listings")
+
+    def list_dir(self, path: Path) -> DirListing:
+        return self.list_dir_with_mtime(path)[1]
+
+    def list_dir_with_mtime(self, path: Path) -> tuple[int, DirListing]:
+        """A listing, along with the mtime the directory had when it was taken"""
+        # Checking whether a listing is still valid only takes the stat that checks the handle, rather than listing the
+        # whole directory again
+        with self.handles.open(path) as (fd, mtime_ns):
+            listing = self.listings.get(path, mtime_ns)
+
+            if listing is None:
+                listing = self._scan(fd)
+                self.listings.put(path, mtime_ns, listing)
+
+        return mtime_ns, listing
+
+    @staticmethod
+    def _scan(fd: int) -> DirListing:
+        dirs = []
+        files = []
+
+        tracing.count("syscall.scandir")
+        with os.scandir(fd) as entries:
+            for entry in entries:
+                # Only symlinks need a stat, the kind of everything else comes from the directory listing itself
+                if entry.is_dir():
+                    dirs.append(entry.name)
+                elif entry.is_file():
+                    files.append(entry.name)
+
+        with tracing.span("sort"):
+            dirs.sort(key=str.lower)
+            files.sort(key=str.lower)
+
+        return DirListing(dirs=dirs, files=files)
+
+    def stat(self, path: Path) -> os.stat_result:
+        tracing.count("syscall.stat")
+        with self.handles.open_parent(path) as (dir_fd, name):
+            return os.stat(name, dir_fd=dir_fd)
+
+    def kind(self, path: Path) -> str | None:
+        try:
+            return kind_of(self.stat(path).st_mode)
+        except (OSError, ValueError):
+            return None
+
+    def is_dir(self, path: Path) -> bool:
+        try:
+            return S_ISDIR(self.stat(path).st_mode)
+        except (OSError, ValueError):
+            return False
+
+    def is_file(self, path: Path) -> bool:
+        try:
+            return S_ISREG(self.stat(path).st_mode)
+        except (OSError, ValueError):
+            return False
+
+    def exists(self, path: Path) -> bool:
+        try:
+            self.stat(path)
+        except (OSError, ValueError):
+            return False
+
+        return True
+
+    def is_native(self, path: Path) -> bool:
+        return True
+
+    def read_bytes(self, path: Path, max_size: int) -> bytes:
+        tracing.count("syscall.read")
+        with self.handles.open_parent(path) as (dir_fd, name):
+            fd = os.open(name, FILE_OPEN_FLAGS, dir_fd=dir_fd)
+
+        try:
+            chunks = []
+
+            while max_size > 0 and (chunk := os.read(fd, max_size)):
+                chunks.append(chunk)
+                max_size -= len(chunk)
+
+            return b"".join(chunks)
+        finally:
+            os.close(fd)
+
+
+class DaemonExecutor:
+    """
+    A minimal thread pool whose threads are daemons. A thread stuck on a hung mount must not stop the shell from
+    exiting, which ``ThreadPoolExecutor`` would by joining its threads at exit.
+
+    A call that has been given up on (see ``abandon``) no longer counts towards the pool, its worker is replaced so that
+    one hung mount can't take up every worker. Once the stuck call returns, its worker goes away again.
+    """
+
+    def __init__(
+        self,
+        max_workers: int,
+        name: str = "bluray-fs",
+        max_stuck: int = FS_MAX_STUCK_WORKERS,
+    ):
+        self._max_workers = max_workers
+        self._max_stuck = max_stuck
+        self._name = name
+        self._work: queue.SimpleQueue[tuple[Future, Callable, tuple]] = (
+            queue.SimpleQueue()
+        )
+        self._threads = 0
+        self._idle = 0
+        # Running call -> when it started
+        self._started: dict[Future, float] = {}
+        self._abandoned: set[Future] = set()
+        self._lock = threading.Lock()
+
+    @property
+    def stuck(self) -> int:
+        return len(self._abandoned)
+
+    def submit[T](self, fn: Callable[..., T], *args) -> Future[T]:
+        future = Future()
+        self._work.put((future, fn, args))
+
+        with self._lock:
+            if self._idle == 0:
+                self._spawn()
+
+        return future
+
+    def _spawn(self) -> None:
+        """Must be called with the lock held"""
+        if (
+            self._threads - len(self._abandoned) >= self._max_workers
+            or self._threads >= self._max_workers + self._max_stuck
+        ):
+            return
+
+        self._threads += 1
+        threading.Thread(target=self._worker, name=self._name, daemon=True).start()
+
+    def started_at(self, future: Future) -> float | None:
+        """When a worker started running the call, or None if it isn't running"""
+        with self._lock:
+            return self._started.get(future)
+
+    def abandon(self, future: Future) -> None:
+        """Gives up on a call that's taking too long, a new worker takes the place of the one running it"""
+        with self._lock:
+            if future not in self._started or future in self._abandoned:
+                return
+
+            self._abandoned.add(future)
+            if self._idle == 0:
+                self._spawn()
+
+    def _worker(self) -> None:
+        while True:
+            with self._lock:
+                self._idle += 1
+            future, fn, args = self._work.get()
+            with self._lock:
+                self._idle -= 1
+
+                if not future.set_running_or_notify_cancel():
+                    continue
+
+                self._started[future] = time.monotonic()
+
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+            with self._lock:
+                del self._started[future]
+
+                if future in self._abandoned:
+                    self._abandoned.discard(future)
+
+                    # It was replaced while it was stuck, so now there's a worker too many
+                    if self._threads - len(self._abandoned) > self._max_workers:
+                        self._threads -= 1
+                        return
+
+
+class GuardedFilesystem:
+    def __init__(
+        self,
+        inner: Filesystem | None = None,
+        *,
+        timeout: float | None = None,
+        unresponsive_ttl: float = FS_UNRESPONSIVE_TTL,
+        max_workers: int = FS_MAX_WORKERS,
+    ):
+        self.inner = inner or LocalFilesystem()
+        # When not given, each call gets the timeout of the policy for the mount it's on
+        self.timeout = timeout
+        self.unresponsive_ttl = unresponsive_ttl
+        self._executor = DaemonExecutor(max_workers)
+        # Path -> when it may be tried again
+        self._unresponsive: dict[Path, float] = {}
+        # Expired entries are dropped by whichever thread comes across them, while timed out calls add new ones
+        self._unresponsive_lock = threading.Lock()
+
+    @property
+    def has_unresponsive(self) -> bool:
+        return bool(self._unresponsive)
+
+    def is_unresponsive(self, path: Path) -> bool:
+        """Whether the path, or a directory above it, recently timed out"""
+        if not self._unresponsive:
+            return False
+
+        now = time.monotonic()
+
+        with self._unresponsive_lock:
+            for candidate in (path, *path.parents):
+                retry_at = self._unresponsive.get(candidate)
+
+                if retry_at is None:
+                    continue
+                elif retry_at > now:
+                    return True
+                else:
+                    self._unresponsive.pop(candidate, None)
+
+        return False
+
+    def _call[T](self, fn: Callable[[Path], T], path: Path) -> T:
+        if self.is_unresponsive(path):
+            raise UnresponsiveDirectoryError(f"{path} is not responding")
+
+        timeout = self.timeout
+        if timeout is None:
+            timeout = get_mount_policy(path).timeout
+
+        future = self._executor.submit(fn, path)
+
+        with suppress(FutureTimeoutError):
+            return future.result(timeout)
+
+        if future.cancel():
+            # It was queued behind calls to other (hung) directories the whole time, which says nothing about this one
+            tracing.count("fs.queue_timeout")
+            raise UnresponsiveDirectoryError(
+                f"{path} could not be read, the filesystem is busy"
+            )
+
+        started_at = self._executor.started_at(future)
+
+        if started_at is not None:
+            # It only got to a worker after a while, so it gets whatever is left of its own timeout
+            with suppress(FutureTimeoutError):
+                return future.result(max(started_at + timeout - time.monotonic(), 0))
+
+        if future.done():
+            return future.result()
+
+        tracing.count("fs.timeout")
+        self._executor.abandon(future)
+        with self._unresponsive_lock:
+            self._unresponsive[path] = time.monotonic() + self.unresponsive_ttl
+        raise UnresponsiveDirectoryError(f"{path} is not responding")
+
+    def list_dir(self, path: Path) -> DirListing:
+        return self._call(self.inner.list_dir, path)
+
+    def kind(self, path: Path) -> str | None:
+        return self._call(self.inner.kind, path)
+
+    def is_dir(self, path: Path) -> bool:
+        return self._call(self.inner.is_dir, path)
+
+    def is_file(self, path: Path) -> bool:
+        return self._call(self.inner.is_file, path)
+
+    def exists(self, path: Path) -> bool:
+        return self._call(self.inner.exists, path)
+
+    def stat(self, path: Path) -> os.stat_result:
+        return self._call(self.inner.stat, path)
+
+    def read_bytes(self, path: Path, max_size: int) -> bytes:
+        return self._call(partial(self.inner.read_bytes, max_size=max_size), path)
+
+    def is_native(self, path: Path) -> bool:
+        return self._call(self.inner.is_native, path)
+
+    def get_unresponsive_stats(self) -> stats.CacheStats:
+        return stats.CacheStats(
+            name="unresponsive_dirs",
+            hits=0,
+            misses=0,
+            size=len(self._unresponsive),
+            max_size=None,
+        )
+
+
+# Shared between dialogs, so that a hung directory stays marked as unresponsive after the dialog is closed
+_local_filesystem = LocalFilesystem()
+default_filesystem = GuardedFilesystem(_local_filesystem)
+stats.register_cache(
+    "dir_handles",
+    _local_filesystem.handles.get_stats,
+    reset_counters=_local_filesystem.handles.reset_counters,
+)
+stats.register_cache(
+    "listings",
+    _local_filesystem.listings.get_stats,
+    reset_counters=_local_filesystem.listings.reset_counters,
+)
+stats.register_cache("unresponsive_dirs", default_filesystem.get_unresponsive_stats)
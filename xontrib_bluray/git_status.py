@@ -0,0 +1,259 @@
+"""
+The git status of the entries in a repository, for decorating the picker's list.
+
+A repository's status comes from a single ``git status`` run in the background, never from running git per entry. It's
+reused until the repository's index or HEAD changes, and refreshed in the background every now and then for edits to
+files, which git only notices by looking at them.
+"""
+
+import os
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from pathlib import Path
+from typing import NamedTuple
+
+from xontrib_bluray import stats, tracing
+from xontrib_bluray.constants import (
+    GIT_STATUS_MAX_AGE,
+    GIT_STATUS_MAX_REPOS,
+    GIT_STATUS_TIMEOUT,
+)
+from xontrib_bluray.filesystem import Filesystem
+from xontrib_bluray.ignore import GIT_DIR
+
+# States in increasing order of importance, a directory gets the most important state of anything in it
+STATES = ("ignored", "untracked", "staged", "modified", "conflicted")
+_IMPORTANCE = {state: importance for importance, state in enumerate(STATES)}
+
+
+class GitStatus(NamedTuple):
+    root: Path
+    # Path relative to the root -> its state, for everything git reported on. Untracked and ignored directories are
+    # reported as a whole, without anything in them.
+    entries: dict[str, str]
+    # Path relative to the root -> the most important state of anything in it, ignored files aside
+    dirs: dict[str, str]
+
+    def state_of(self, path: str) -> str | None:
+        return self.entries.get(path) or self.dirs.get(path)
+
+    def inherited_state(self, path: str) -> str | None:
+        """The state of a directory's entries when the directory itself, or one it's in, is untracked or ignored"""
+        parts = path.split("/")
+
+        for end in range(1, len(parts) + 1):
+            state = self.entries.get("/".join(parts[:end]))
+
+            if state is not None:
+                return state
+
+        return None
+
+
+def _state_of_change(xy: str) -> str:
+    # X is the state in the index, Y the state in the worktree, "." meaning unchanged
+    return "modified" if xy[1] != "." else "staged"
+
+
+def parse_status(root: Path, output: bytes) -> GitStatus:
+    """Parses the output of ``git status --porcelain=v2 -z``"""
+    entries: dict[str, str] = {}
+    records = iter(os.fsdecode(output).split("\0"))
+
+    for record in records:
+        kind, _, rest = record.partition(" ")
+
+        if kind == "1":
+            # 1 XY sub mH mI mW hH hI path
+            fields = rest.split(" ", 7)
+            entries[fields[7]] = _state_of_change(fields[0])
+        elif kind == "2":
+            # 2 XY sub mH mI mW hH hI Xscore path, then the original path as a record of its own
+            fields = rest.split(" ", 8)
+            entries[fields[8]] = _state_of_change(fields[0])
+            next(records, None)
+        elif kind == "u":
+            # u XY sub m1 m2 m3 mW h1 h2 h3 path
+            entries[rest.split(" ", 9)[9]] = "conflicted"
+        elif kind == "?":
+            entries[rest.rstrip("/")] = "untracked"
+        elif kind == "!":
+            entries[rest.rstrip("/")] = "ignored"
+
+    dirs: dict[str, str] = {}
+
+    for path, state in entries.items():
+        if state == "ignored":
+            continue
+
+        importance = _IMPORTANCE[state]
+        parent, _, _ = path.rpartition("/")
+
+        while parent:
+            existing = dirs.get(parent)
+
+            if existing is not None and _IMPORTANCE[existing] >= importance:
+                # Its parents already have something at least as important
+                break
+
+            dirs[parent] = state
+            parent, _, _ = parent.rpartition("/")
+
+    return GitStatus(root=root, entries=entries, dirs=dirs)
+
+
+class _CachedStatus(NamedTuple):
+    # The mtimes of the index and HEAD when git was run
+    key: tuple[int, int]
+    status: GitStatus
+    checked_at: float
+
+
+class GitStatuses:
+    def __init__(self, max_repos: int = GIT_STATUS_MAX_REPOS):
+        self.max_repos = max_repos
+        self._statuses: OrderedDict[Path, _CachedStatus] = OrderedDict()
+        # Root -> what to call once the git status being worked out is ready
+        self._running: dict[Path, list[Callable[[GitStatus], None]]] = {}
+        self._git_dirs: dict[Path, Path] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _git_dir(self, filesystem: Filesystem, root: Path) -> Path:
+        git_dir = self._git_dirs.get(root)
+
+        if git_dir is None:
+            git_dir = root / GIT_DIR
+
+            # Worktrees and submodules have a file pointing to the real git directory
+            if filesystem.is_file(git_dir):
+                text = os.fsdecode(filesystem.read_bytes(git_dir, 4096)).strip()
+                if text.startswith("gitdir:"):
+                    git_dir = root / text.removeprefix("gitdir:").strip()
+
+            self._git_dirs[root] = git_dir
+
+        return git_dir
+
+    def _key(self, filesystem: Filesystem, root: Path) -> tuple[int, int]:
+        git_dir = self._git_dir(filesystem, root)
+        mtimes = []
+
+        for name in ("index", "HEAD"):
+            try:
+                mtimes.append(filesystem.stat(git_dir / name).st_mtime_ns)
+            except OSError:
+                mtimes.append(0)
+
+        return mtimes[0], mtimes[1]
+
+    def get(
+        self,
+        filesystem: Filesystem,
+        root: Path,
+        on_ready: Callable[[GitStatus], None],
+    ) -> GitStatus | None:
+        """
+        The git status of a repository, or None if it isn't known yet. When it's out of date, it's worked out again in
+        the background and ``on_ready`` is called with it from another thread; until then the old one is returned.
+        """
+        key = self._key(filesystem, root)
+
+        with self._lock:
+            cached = self._statuses.get(root)
+
+            if (
+                cached is not None
+                and cached.key == key
+                and time.monotonic() - cached.checked_at < GIT_STATUS_MAX_AGE
+            ):
+                self.hits += 1
+                self._statuses.move_to_end(root)
+                return cached.status
+
+            self.misses += 1
+            waiters = self._running.get(root)
+
+            if waiters is None:
+                self._running[root] = [on_ready]
+                threading.Thread(
+                    target=self._refresh,
+                    args=(root, key),
+                    name="bluray-git-status",
+                    daemon=True,
+                ).start()
+            elif on_ready not in waiters:
+                waiters.append(on_ready)
+
+        return cached.status if cached is not None else None
+
+    def _refresh(self, root: Path, key: tuple[int, int]) -> None:
+        tracing.count("git.status")
+
+        try:
+            result = subprocess.run(
+                ["git", "status", "--porcelain=v2", "-z", "--ignored"],
+                cwd=root,
+                capture_output=True,
+                timeout=GIT_STATUS_TIMEOUT,
+                # A status run in the background mustn't take the index lock away from the user's own git commands
+                env={**os.environ, "GIT_OPTIONAL_LOCKS": "0"},
+            )
+            output = result.stdout if result.returncode == 0 else None
+        except (OSError, subprocess.SubprocessError):
+            output = None
+
+        if output is not None:
+            status = parse_status(root, output)
+            checked_at = time.monotonic()
+        else:
+            # No git, or a repository too big to get the status of in time. Not tried again until the index or HEAD
+            # change.
+            status = GitStatus(root=root, entries={}, dirs={})
+            checked_at = float("inf")
+
+        with self._lock:
+            self._statuses[root] = _CachedStatus(key, status, checked_at)
+            self._statuses.move_to_end(root)
+
+            while len(self._statuses) > self.max_repos:
+                self._statuses.popitem(last=False)
+
+            waiters = self._running.pop(root, [])
+
+        for on_ready in waiters:
+            on_ready(status)
+
+    def count_running(self) -> int:
+        return len(self._running)
+
+    def get_stats(self) -> stats.CacheStats:
+        return stats.CacheStats(
+            name="git_status",
+            hits=self.hits,
+            misses=self.misses,
+            size=len(self._statuses),
+            max_size=self.max_repos,
+        )
+
+    def reset(self) -> None:
+        with self._lock:
+            self._statuses.clear()
+            self._git_dirs.clear()
+
+        self.reset_counters()
+
+    def reset_counters(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+
+git_statuses = GitStatuses()
+stats.register_cache(
+    "git_status", git_statuses.get_stats, reset_counters=git_statuses.reset_counters
+)
+stats.register_background_tasks("git_status", git_statuses.count_running)
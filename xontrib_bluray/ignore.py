@@ -0,0 +1,419 @@
+"""
+Which files git (and tools like ripgrep) ignore, so the picker can hide them and recursive walks can skip them.
+
+Rules come from ``.git/info/exclude`` and from the ``.gitignore`` and ``.ignore`` files in every directory from the
+root of the repository down, with rules further down winning, the same as git. Every rule is translated into a regex
+over paths relative to the repository root, so a whole directory's worth of rules can be checked against a name with a
+single match.
+"""
+
+import os
+import re
+import threading
+from collections import OrderedDict
+from collections.abc import Iterator
+from pathlib import Path
+from typing import NamedTuple
+
+from xontrib_bluray import stats, tracing
+from xontrib_bluray.constants import IGNORE_MAX_FILE_SIZE, IGNORE_MAX_MATCHERS
+from xontrib_bluray.filesystem import DirListing, Filesystem
+
+GIT_DIR = ".git"
+EXCLUDE_FILE = Path(GIT_DIR, "info", "exclude")
+# In increasing order of precedence
+IGNORE_FILES = (".gitignore", ".ignore")
+
+
+class IgnoreRule(NamedTuple):
+    # Matches paths relative to the repository root, with a trailing "/" for directories
+    pattern: str
+    # A "!" rule, which makes matching paths not ignored after all
+    negated: bool
+
+
+def _translate_segment(segment: str) -> str:
+    """Translates a glob for one path component into a regex"""
+    regex = []
+    i = 0
+
+    while i < len(segment):
+        char = segment[i]
+        i += 1
+
+        if char == "*":
+            # Any run of stars is the same as one within a component
+            while i < len(segment) and segment[i] == "*":
+                i += 1
+            regex.append("[^/]*")
+        elif char == "?":
+            regex.append("[^/]")
+        elif char == "\\" and i < len(segment):
+            regex.append(re.escape(segment[i]))
+            i += 1
+        elif char == "[" and (end := segment.find("]", i + 1)) != -1:
+            contents = segment[i:end]
+            if contents.startswith("!"):
+                contents = "^" + contents[1:]
+            regex.append("[" + contents.replace("\\", "\\\\") + "]")
+            i = end + 1
+        else:
+            regex.append(re.escape(char))
+
+    return "".join(regex)
+
+
+def translate_rule(line: str, base: str) -> IgnoreRule | None:
+    """
+    Translates one line of an ignore file in the directory ``base`` (relative to the repository root, with a trailing
+    "/" unless it's the root) into a rule, or None for blank lines and comments. See gitignore(5) for the format.
+    """
+    # Trailing spaces are ignored unless escaped
+    line = re.sub(r"(?<!\\) +$", "", line)
+
+    if not line or line.startswith("#"):
+        return None
+
+    negated = line.startswith("!")
+    if negated or line.startswith(("\\!", "\\#")):
+        line = line[1:]
+
+    dir_only = line.endswith("/")
+    line = line.rstrip("/")
+
+    if not line:
+        return None
+
+    # Only patterns without a "/" before their end match at any depth, the rest are relative to the ignore file
+    anchored = "/" in line
+    segments = line.lstrip("/").split("/")
+    regex = [re.escape(base)]
+
+    if not anchored:
+        regex.append("(?:.*/)?")
+
+    for i, segment in enumerate(segments):
+        is_last = i == len(segments) - 1
+
+        if segment == "**":
+            regex.append(".*" if is_last else "(?:.*/)?")
+        else:
+            regex.append(_translate_segment(segment))
+            if not is_last:
+                regex.append("/")
+
+    regex.append("/" if dir_only else "/?")
+
+    return IgnoreRule(pattern="".join(regex), negated=negated)
+
+
+def parse_ignore_file(text: str, base: str) -> tuple[IgnoreRule, ...]:
+    return tuple(
+        rule
+        for line in text.splitlines()
+        if (rule := translate_rule(line, base)) is not None
+    )
+
+
+class _IgnoreFile(NamedTuple):
+    mtime_ns: int
+    rules: tuple[IgnoreRule, ...]
+
+
+class IgnoreMatcher:
+    """The rules for the entries of one directory"""
+
+    __slots__ = (
+        "_any",
+        "_has_negated",
+        "files",
+        "ignored",
+        "parent",
+        "prefix",
+        "rules",
+    )
+
+    def __init__(
+        self,
+        prefix: str,
+        rules: tuple[IgnoreRule, ...],
+        *,
+        ignored: bool = False,
+        parent: "IgnoreMatcher | None" = None,
+        files: tuple[_IgnoreFile | None, ...] = (),
+    ):
+        # The directory relative to the repository root, with a trailing "/" unless it's the root
+        self.prefix = prefix
+        self.rules = rules
+        # Whether the directory itself is ignored, which git doesn't allow any rule to take back for what's inside it
+        self.ignored = ignored
+        # What this was built from, to tell whether it's still up to date
+        self.parent = parent
+        self.files = files
+        # Nearly every name matches no rule at all, which this tells with a single match
+        positive = [rule.pattern for rule in rules if not rule.negated]
+        self._any = re.compile("|".join(positive)) if positive else None
+        self._has_negated = len(positive) != len(rules)
+
+    def is_ignored(self, name: str, is_dir: bool) -> bool:
+        if self.ignored:
+            return True
+        elif self._any is None:
+            return False
+
+        path = f"{self.prefix}{name}/" if is_dir else f"{self.prefix}{name}"
+
+        if self._any.fullmatch(path) is None:
+            return False
+        elif not self._has_negated:
+            return True
+
+        # The last rule that matches decides
+        for rule in reversed(self.rules):
+            if re.fullmatch(rule.pattern, path):
+                return not rule.negated
+
+        return False
+
+    def ignored_names(self, listing: DirListing) -> frozenset[str]:
+        if self.ignored:
+            return frozenset((*listing.dirs, *listing.files))
+        elif self._any is None:
+            return frozenset()
+
+        return frozenset(
+            (
+                *(name for name in listing.dirs if self.is_ignored(name, True)),
+                *(name for name in listing.files if self.is_ignored(name, False)),
+            )
+        )
+
+
+NO_RULES = IgnoreMatcher("", ())
+
+
+class IgnoreMatchers:
+    """
+    Matchers for directories, reused until one of the ignore files they were built from changes. Ignore files are only
+    parsed again once their mtime changes.
+    """
+
+    def __init__(self, max_matchers: int = IGNORE_MAX_MATCHERS):
+        self.max_matchers = max_matchers
+        self._matchers: OrderedDict[Path, IgnoreMatcher] = OrderedDict()
+        self._files: dict[Path, _IgnoreFile] = {}
+        # Directory -> its mtime, and whether it's the root of a repository
+        self._roots: dict[Path, tuple[int, bool]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def find_root(self, filesystem: Filesystem, path: Path) -> Path | None:
+        """
+        The root of the git repository a directory is in. Making or removing a ``.git`` changes the mtime of the
+        directory it's in, so whether a directory has one is kept until its mtime changes. That still takes a stat of
+        each directory up to the root, but not a lookup of a ``.git`` in each.
+        """
+        try:
+            mtime_ns = filesystem.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+        cached = self._roots.get(path)
+
+        if cached is not None and cached[0] == mtime_ns:
+            is_root = cached[1]
+        else:
+            is_root = filesystem.exists(path / GIT_DIR)
+
+            if len(self._roots) >= self.max_matchers:
+                self._roots.clear()
+
+            self._roots[path] = (mtime_ns, is_root)
+
+        if is_root:
+            return path
+        elif path.parent == path:
+            return None
+
+        return self.find_root(filesystem, path.parent)
+
+    def _load(
+        self, filesystem: Filesystem, path: Path, base: str
+    ) -> _IgnoreFile | None:
+        try:
+            mtime_ns = filesystem.stat(path).st_mtime_ns
+            cached = self._files.get(path)
+
+            if cached is not None and cached.mtime_ns == mtime_ns:
+                return cached
+
+            text = os.fsdecode(filesystem.read_bytes(path, IGNORE_MAX_FILE_SIZE))
+        except OSError:
+            return None
+
+        with tracing.span("parse_ignore_file"):
+            ignore_file = _IgnoreFile(mtime_ns, parse_ignore_file(text, base))
+
+        self._files[path] = ignore_file
+        return ignore_file
+
+    def _get(
+        self,
+        filesystem: Filesystem,
+        path: Path,
+        parent: IgnoreMatcher | None,
+        file_names: tuple[str | Path, ...],
+    ) -> IgnoreMatcher:
+        if parent is None:
+            prefix = ""
+            ignored = False
+        else:
+            prefix = f"{parent.prefix}{path.name}/"
+            ignored = parent.is_ignored(path.name, True)
+
+        files = tuple(
+            self._load(filesystem, path / name, prefix) for name in file_names
+        )
+
+        with self._lock:
+            matcher = self._matchers.get(path)
+
+            if (
+                matcher is not None
+                and matcher.parent is parent
+                and len(matcher.files) == len(files)
+                and all(a is b for a, b in zip(matcher.files, files, strict=True))
+            ):
+                self.hits += 1
+                self._matchers.move_to_end(path)
+                return matcher
+
+            self.misses += 1
+
+        rules = parent.rules if parent is not None else ()
+        for ignore_file in files:
+            if ignore_file is not None:
+                rules += ignore_file.rules
+
+        matcher = IgnoreMatcher(
+            prefix, rules, ignored=ignored, parent=parent, files=files
+        )
+
+        with self._lock:
+            self._matchers[path] = matcher
+
+            while len(self._matchers) > self.max_matchers:
+                self._matchers.popitem(last=False)
+
+        return matcher
+
+    def _get_root(self, filesystem: Filesystem, root: Path) -> IgnoreMatcher:
+        return self._get(filesystem, root, None, (EXCLUDE_FILE, *IGNORE_FILES))
+
+    def get(self, filesystem: Filesystem, path: Path) -> IgnoreMatcher:
+        """The matcher for the entries of a directory"""
+        root = self.find_root(filesystem, path)
+
+        if root is None:
+            return NO_RULES
+        elif path == root:
+            return self._get_root(filesystem, root)
+
+        parent = self.get(filesystem, path.parent)
+        return self._get(filesystem, path, parent, IGNORE_FILES)
+
+    def get_child(
+        self,
+        filesystem: Filesystem,
+        parent: IgnoreMatcher,
+        path: Path,
+        listing: DirListing,
+    ) -> IgnoreMatcher:
+        """
+        The matcher for a subdirectory of one whose matcher is already known, going by its listing for which ignore
+        files it has. Walks use this to not look for ignore files that aren't there.
+        """
+        if GIT_DIR in listing.dirs or GIT_DIR in listing.files:
+            # A repository of its own
+            return self._get_root(filesystem, path)
+        elif parent is NO_RULES:
+            return NO_RULES
+
+        present = tuple(name for name in IGNORE_FILES if name in listing.files)
+        return self._get(filesystem, path, parent, present)
+
+    def get_stats(self) -> stats.CacheStats:
+        return stats.CacheStats(
+            name="ignore_matchers",
+            hits=self.hits,
+            misses=self.misses,
+            size=len(self._matchers),
+            max_size=self.max_matchers,
+        )
+
+    def reset(self) -> None:
+        with self._lock:
+            self._matchers.clear()
+            self._files.clear()
+            self._roots.clear()
+
+        self.reset_counters()
+
+    def reset_counters(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+
+ignore_matchers = IgnoreMatchers()
+stats.register_cache(
+    "ignore_matchers",
+    ignore_matchers.get_stats,
+    reset_counters=ignore_matchers.reset_counters,
+)
+
+
+def walk(
+    filesystem: Filesystem,
+    root: Path,
+    *,
+    budget: int,
+    skip_ignored: bool = True,
+) -> Iterator[tuple[Path, DirListing]]:
+    """
+    Lists the directories under ``root`` (and ``root`` itself) breadth first, until ``budget`` entries have been seen.
+    Ignored directories, and ``.git`` directories, are never descended into when ``skip_ignored`` is set. Directories
+    which can't be listed are skipped.
+    """
+    # Each directory to list, along with the matcher for the directory it's in
+    pending: list[tuple[Path, IgnoreMatcher | None]] = [(root, None)]
+
+    while pending:
+        next_pending = []
+
+        for path, parent in pending:
+            try:
+                listing = filesystem.list_dir(path)
+            except OSError:
+                continue
+
+            if not skip_ignored:
+                matcher = NO_RULES
+            elif parent is None:
+                matcher = ignore_matchers.get(filesystem, path)
+            else:
+                matcher = ignore_matchers.get_child(filesystem, parent, path, listing)
+
+            yield path, listing
+
+            budget -= len(listing.dirs) + len(listing.files)
+            if budget <= 0:
+                return
+
+            for name in listing.dirs:
+                if skip_ignored and (name == GIT_DIR or matcher.is_ignored(name, True)):
+                    continue
+
+                next_pending.append((path / name, matcher))
+
+        pending = next_pending
@@ -3,127 +3,79 @@ from xonsh.built_ins import XonshSession
 
 def _load_xontrib_(xsh: XonshSession, **_):
     import os
-    import re
     from asyncio import ensure_future
+    from contextlib import suppress
     from pathlib import Path
-    from typing import TYPE_CHECKING, NamedTuple
+    from typing import TYPE_CHECKING
 
     from prompt_toolkit.application import get_app
+    from prompt_toolkit.document import Document
     from prompt_toolkit.filters import Condition
     from prompt_toolkit.key_binding import KeyBindings, KeyPressEvent
     from prompt_toolkit.keys import Keys
     from prompt_toolkit.styles import merge_styles
     from xonsh.events import events
+    from xonsh.tools import to_bool
 
     if TYPE_CHECKING:
         from xonsh.prompt.base import PromptFields
         from xonsh.shells.ptk_shell import PromptToolkitShell
 
-    from xontrib_bluray import constants, dialog
-    from xontrib_bluray.constants import MAX_HEIGHT, STATE_FILE
-    from xontrib_bluray.custom_lexer import CustomLexer
+    from xontrib_bluray import constants, dialog, stats, tracing
+    from xontrib_bluray.constants import (
+        CWD_PROMPT_FIELD_PREFIXES,
+        MAX_HEIGHT,
+        STATE_FILE,
+    )
+    from xontrib_bluray.filesystem import default_filesystem
     from xontrib_bluray.path_picker import PathPickerDialog
+    from xontrib_bluray.prompt_args import (
+        CursorArgs,
+        get_cursor_args,
+        path_string_pattern,
+        splice_arg_into_prompt,
+    )
 
     STATE_FILE.parent.mkdir(exist_ok=True, parents=True)
 
-    path_string_pattern = re.compile("^[pf]?['\"]?(.+?)[\"']?$")
+    if "BLURAY_TRACE" in xsh.env:
+        tracing.configure(
+            enabled=to_bool(xsh.env["BLURAY_TRACE"]),
+            trace_file=xsh.env.get("BLURAY_TRACE_FILE"),
+        )
+
+    if to_bool(xsh.env.get("BLURAY_DAEMON", False)):
+        from xontrib_bluray import daemon
+
+        daemon.enable()
+
+    if to_bool(xsh.env.get("BLURAY_ARCHIVES", False)):
+        from xontrib_bluray import archive_fs
+
+        # After the daemon, whose listings it passes everything outside archives on to
+        archive_fs.enable()
+
+    if to_bool(xsh.env.get("BLURAY_COMPLETER", False)):
+        from xonsh.completers.completer import add_one_completer
+
+        from xontrib_bluray.completer import complete_path_from_cache
+
+        # Before xonsh's own path completer, which still runs whenever this one has nothing to offer
+        add_one_completer("bluray_path", complete_path_from_cache, "<path")
+
+    def cwd_prompt_fields() -> list[str]:
+        """Prompt fields (or prefixes of them) which also depend on the working directory, from the user"""
+        fields = xsh.env.get("BLURAY_CWD_PROMPT_FIELDS", [])
+
+        if isinstance(fields, str):
+            return fields.replace(",", " ").split()
+
+        return [str(field) for field in fields]
+
     coro_refs = set()
+    stats.register_background_tasks("dialogs", lambda: len(coro_refs))
 
-    def split_prompt_to_args(prompt: str) -> list[str]:
-        split_prompt = CustomLexer(tolerant=False, pymode=False).split(prompt)
-        result = []
-
-        for split in split_prompt:
-            result.append(split)
-
-        return result
-
-    class SelectedArg(NamedTuple):
-        position: int
-        is_inserting: bool
-
-    def get_selected_prompt_arg(
-        prompt_args: list[str], cursor_position: int
-    ) -> SelectedArg:
-        arg_position: int = -1
-        is_inserting = True
-        current_arg_start_position = 0
-
-        for idx, arg in enumerate(prompt_args):
-            if cursor_position > current_arg_start_position or (
-                arg.isspace() and cursor_position == current_arg_start_position
-            ):
-                arg_position = idx
-                is_inserting = arg.isspace()
-            elif cursor_position <= current_arg_start_position:
-                break
-
-            current_arg_start_position += len(arg)
-        else:
-            if cursor_position >= current_arg_start_position:
-                arg_position = len(prompt_args)
-                # If it is, we will be inserting
-                is_inserting = True
-
-        return SelectedArg(is_inserting=is_inserting, position=arg_position)
-
-    class PutResult(NamedTuple):
-        new_prompt: str
-        new_cursor_position: int
-
-    def put_arg_in_prompt(
-        *,
-        prompt_args: list[str],
-        selected_arg: SelectedArg,
-        new_arg: str,
-        cursor_position: int,
-    ) -> PutResult:
-        arg_position = selected_arg.position
-        is_inserting = selected_arg.is_inserting
-
-        if len(prompt_args) == 0:
-            # Must not use .insert if the array is empty
-            prompt_args.append(new_arg)
-        elif arg_position == -1:
-            prompt_args.insert(0, new_arg + " ")
-        elif arg_position == len(prompt_args):
-            prompt_args.append(" " + new_arg)
-        elif is_inserting:
-            insertion_position = cursor_position - sum(
-                len(arg) for arg in prompt_args[:arg_position]
-            )
-
-            arg_text = prompt_args[arg_position]
-            text_before = arg_text[:insertion_position]
-            text_after = arg_text[insertion_position:]
-            prompt_args[arg_position] = new_arg
-
-            # Ensure that the new arg is followed by a space
-            if arg_position < len(prompt_args):
-                if len(text_after) > 0:
-                    prompt_args.insert(arg_position + 1, text_after)
-                # len check is for short-circuiting and preventing out of bounds error!
-                elif len(text_after) == 0 or not text_after[0].isspace():
-                    prompt_args[arg_position + 1] = " " + prompt_args[arg_position + 1]
-
-            # Ensure that the new arg is preceded by a space
-            if arg_position > 0:
-                if len(text_before) > 0:
-                    prompt_args.insert(arg_position, text_before)
-                    arg_position += 1
-                # len check is for short-circuiting and preventing out of bounds error!
-                elif len(text_before) == 0 or not text_before[-1].isspace():
-                    prompt_args.insert(arg_position, " ")
-                    arg_position += 1
-        else:
-            prompt_args[arg_position] = new_arg
-
-        return PutResult(
-            new_cursor_position=sum(
-                len(arg) for arg in prompt_args[: arg_position + 1]
-            ),
-            new_prompt="".join(prompt_args),
-        )
+    xsh.aliases["bluray-stats"] = stats.bluray_stats
 
     @events.on_ptk_create
     def custom_keybindings(bindings: KeyBindings, **kw):
@@ -149,9 +101,14 @@ def _load_xontrib_(xsh: XonshSession, **_):
 
                 if not _is_open:
                     _is_open = True
+                    tracing.start_session("change_directory")
                     try:
                         new_dir: Path | None = await dialog.show_as_float(
-                            PathPickerDialog("Change directory", accept_files=False),
+                            PathPickerDialog(
+                                "Change directory",
+                                accept_files=False,
+                                columns=to_bool(xsh.env.get("BLURAY_COLUMNS", False)),
+                            ),
                             height=MAX_HEIGHT,
                             bottom=0,
                             top=1,
@@ -161,23 +118,36 @@ def _load_xontrib_(xsh: XonshSession, **_):
                         if not new_dir:
                             return
 
-                        # Change the working directory to the new one
-                        os.chdir(new_dir)
+                        # Change the working directory to the new one. Directories inside archives can be browsed, but not
+                        # changed into.
+                        try:
+                            os.chdir(new_dir)
+                        except OSError:
+                            return
 
                         # As we have just fucked with the working directory in a way the shell does not expect us to, we need to
                         # update the prompt message and re-render it manually.
                         shell: PromptToolkitShell = xsh.shell.shell
                         prompt_fields: PromptFields = shell.prompt_formatter.fields
-                        # Delete the prompt formatter's cache, it is out of date now.
-                        prompt_fields.reset()
+                        # Only the fields which depend on the working directory are out of date now, the rest (which may
+                        # be expensive, e.g. from other xontribs) stay cached.
+                        cwd_field_prefixes = (
+                            *CWD_PROMPT_FIELD_PREFIXES,
+                            *cwd_prompt_fields(),
+                        )
+                        for field_name in list(prompt_fields):
+                            if field_name.startswith(cwd_field_prefixes):
+                                prompt_fields.reset_key(field_name)
                         # Update the shell environment with the new PWD.
                         xsh.env["PWD"] = str(new_dir)
-                        # Re-format the prompt with the new PWD
+                        # Re-format the prompt with the new PWD. With $ENABLE_ASYNC_PROMPT, xonsh computes the reset
+                        # fields in the background and updates the prompt once they are ready.
                         shell.prompter.message = shell.prompt_tokens()
-                        # Finally, re-render the prompt.
-                        event.cli.renderer.erase()
+                        # Finally, redraw the prompt. The renderer only repaints what changed, no need to erase the screen.
+                        event.app.invalidate()
                     finally:
                         _is_open = False
+                        tracing.end_session()
 
             task = ensure_future(coro())
             coro_refs.add(task)
@@ -187,18 +157,15 @@ def _load_xontrib_(xsh: XonshSession, **_):
         def show_interactive_path_picker(event: KeyPressEvent):
             ensure_added_styles()
 
-            def create_path_picker_dialog(
-                prompt_args: list[str], selected_arg: SelectedArg
-            ) -> PathPickerDialog:
+            def create_path_picker_dialog(cursor_args: CursorArgs) -> PathPickerDialog:
                 current_dir = None
                 selected_file = None
+                selected_arg_text = cursor_args.selected_arg_text
 
-                if not selected_arg.is_inserting:
+                if selected_arg_text is not None:
                     title = "Choose a path to replace this path which is somehow invalid? Wtf are you doing man"
 
-                    selected_path_match = path_string_pattern.match(
-                        prompt_args[selected_arg.position]
-                    )
+                    selected_path_match = path_string_pattern.match(selected_arg_text)
                     if selected_path_match:
                         try:
                             selected_path = Path(
@@ -207,11 +174,14 @@ def _load_xontrib_(xsh: XonshSession, **_):
                         except ValueError:
                             pass
                         else:
-                            if selected_path.exists():
-                                selected_file = selected_path
+                            # A path on a hung mount is treated as not existing, rather than freezing the shell
+                            with suppress(OSError):
+                                if default_filesystem.exists(selected_path):
+                                    selected_file = selected_path
 
-                            if selected_path.parent.exists():
-                                current_dir = selected_path.parent
+                            with suppress(OSError):
+                                if default_filesystem.exists(selected_path.parent):
+                                    current_dir = selected_path.parent
 
                             # TODO make this shorten the path if it's too long instead of just using the file name
                             title = f"Replace {selected_path.name}"
@@ -219,54 +189,65 @@ def _load_xontrib_(xsh: XonshSession, **_):
                     title = "Insert a path"
 
                 return PathPickerDialog(
-                    current_dir=current_dir, selected_item=selected_file, title=title
+                    current_dir=current_dir,
+                    selected_item=selected_file,
+                    title=title,
+                    preview=to_bool(xsh.env.get("BLURAY_PREVIEW", False)),
+                    columns=to_bool(xsh.env.get("BLURAY_COLUMNS", False)),
+                    multi_select=True,
                 )
 
+            def to_path_arg(path: Path, current_dir: Path) -> str:
+                # TODO use ../ instead of absolute path, with a limit of ../../../
+                if path.is_relative_to(current_dir):
+                    path = path.relative_to(current_dir)
+
+                return f'p"{str(path).replace("\\", "\\\\").replace('"', '\\"')}"'
+
             async def coro():
                 nonlocal event, _is_open
 
                 if not _is_open:
                     _is_open = True
+                    tracing.start_session("path_picker")
                     try:
                         prompt_text = event.current_buffer.text
-                        cursor_position = event.current_buffer.cursor_position
-                        prompt_args = split_prompt_to_args(prompt_text)
-                        selected_arg = get_selected_prompt_arg(
-                            prompt_args, cursor_position
+                        # Only the logical line under the cursor is tokenized, pasted scripts can be huge
+                        cursor_args = get_cursor_args(
+                            prompt_text, event.current_buffer.cursor_position
                         )
 
-                        new_dir: Path | None = await dialog.show_as_float(
-                            create_path_picker_dialog(prompt_args, selected_arg),
+                        chosen: Path | list[Path] | None = await dialog.show_as_float(
+                            create_path_picker_dialog(cursor_args),
                             height=MAX_HEIGHT,
                             bottom=0,
                             top=1,
                             left=0,
                         )
 
-                        if not new_dir:
+                        if not chosen:
                             return
 
-                        # TODO use ../ instead of absolute path, with a limit of ../../../
-
                         current_dir = Path(".").absolute()
+                        paths = chosen if isinstance(chosen, list) else [chosen]
+                        # However many paths were marked they go in as one piece of text, so the line is still only
+                        # tokenized once (above) and the buffer only changes once
+                        path_text = " ".join(
+                            to_path_arg(path, current_dir) for path in paths
+                        )
 
-                        if new_dir.is_relative_to(current_dir):
-                            new_dir = new_dir.relative_to(current_dir)
-
-                        path_text = f'p"{str(new_dir).replace("\\", "\\\\").replace('"', '\\"')}"'
-
-                        put_result = put_arg_in_prompt(
-                            selected_arg=selected_arg,
-                            prompt_args=prompt_args,
+                        put_result = splice_arg_into_prompt(
+                            prompt=prompt_text,
+                            cursor_args=cursor_args,
                             new_arg=path_text,
-                            cursor_position=cursor_position,
                         )
-                        event.current_buffer.text = put_result.new_prompt
-                        event.current_buffer.cursor_position = (
-                            put_result.new_cursor_position
+                        # Set the text and cursor together, so the buffer only updates once
+                        event.current_buffer.document = Document(
+                            put_result.new_prompt, put_result.new_cursor_position
                         )
                     finally:
                         _is_open = False
+                        tracing.end_session()
 
             task = ensure_future(coro())
             coro_refs.add(task)
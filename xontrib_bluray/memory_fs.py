@@ -0,0 +1,153 @@
+"""
+A filesystem that only exists in memory, for tests and benchmarks that shouldn't depend on the disk, its caches or the
+time. Nothing in it ever changes by itself, and its mtimes only move when it's modified.
+"""
+
+import errno
+import os
+from collections.abc import Iterable
+from pathlib import Path
+from stat import S_IFDIR, S_IFREG
+
+from xontrib_bluray.filesystem import (
+    KIND_DIR,
+    KIND_FILE,
+    DirListing,
+    LocalFilesystem,
+    synthetic_stat,
+)
+from xontrib_bluray.ignore import walk
+
+
+class _MemoryDir:
+    __slots__ = ("dirs", "files", "listing", "mtime_ns")
+
+    def __init__(self, mtime_ns: int):
+        self.dirs: set[str] = set()
+        self.files: dict[str, bytes] = {}
+        self.mtime_ns = mtime_ns
+        # Built again on the first listing after a change
+        self.listing: DirListing | None = None
+
+
+class MemoryFilesystem:
+    def __init__(self, files: Iterable[tuple[str | Path, bytes | None]] = ()):
+        """``files`` are (path, contents) pairs, with None as the contents of a directory"""
+        # Every change ticks the clock, so anything cached by mtime notices it
+        self._clock = 0
+        self._dirs: dict[Path, _MemoryDir] = {Path("/"): _MemoryDir(0)}
+
+        for path, contents in files:
+            if contents is None:
+                self.add_dir(path)
+            else:
+                self.add_file(path, contents)
+
+    @classmethod
+    def copy_of(cls, root: Path, budget: int = 10_000_000) -> "MemoryFilesystem":
+        """
+        A copy of the directories and file names under ``root`` on disk (and of the directories above it), with every
+        file empty
+        """
+        filesystem = cls()
+        filesystem.add_dir(root)
+
+        for path, listing in walk(
+            LocalFilesystem(), root, budget=budget, skip_ignored=False
+        ):
+            for name in listing.dirs:
+                filesystem.add_dir(path / name)
+            for name in listing.files:
+                filesystem.add_file(path / name)
+
+        return filesystem
+
+    def _touch(self, directory: _MemoryDir) -> None:
+        self._clock += 1
+        directory.mtime_ns = self._clock
+        directory.listing = None
+
+    def add_dir(self, path: str | Path) -> None:
+        """Adds a directory, along with any of its parents that aren't there yet"""
+        path = Path(path)
+
+        if path in self._dirs:
+            return
+
+        self.add_dir(path.parent)
+        parent = self._dirs[path.parent]
+        parent.dirs.add(path.name)
+        self._touch(parent)
+        self._dirs[path] = _MemoryDir(self._clock)
+
+    def add_file(self, path: str | Path, contents: bytes = b"") -> None:
+        path = Path(path)
+        self.add_dir(path.parent)
+        parent = self._dirs[path.parent]
+        parent.files[path.name] = contents
+        self._touch(parent)
+
+    def list_dir(self, path: Path) -> DirListing:
+        directory = self._dirs.get(path)
+
+        if directory is None:
+            raise self._error(path)
+
+        if directory.listing is None:
+            directory.listing = DirListing(
+                dirs=sorted(directory.dirs, key=str.lower),
+                files=sorted(directory.files, key=str.lower),
+            )
+
+        return directory.listing
+
+    def stat(self, path: Path) -> os.stat_result:
+        directory = self._dirs.get(path)
+
+        if directory is not None:
+            return synthetic_stat(S_IFDIR | 0o755, 0, directory.mtime_ns)
+
+        contents = self._contents(path)
+        # A file's mtime is that of its directory, which changes whenever anything in it does
+        return synthetic_stat(
+            S_IFREG | 0o644, len(contents), self._dirs[path.parent].mtime_ns
+        )
+
+    def kind(self, path: Path) -> str | None:
+        if path in self._dirs:
+            return KIND_DIR
+        elif self._find(path) is not None:
+            return KIND_FILE
+
+        return None
+
+    def is_dir(self, path: Path) -> bool:
+        return path in self._dirs
+
+    def is_file(self, path: Path) -> bool:
+        return self._find(path) is not None
+
+    def exists(self, path: Path) -> bool:
+        return self.kind(path) is not None
+
+    def read_bytes(self, path: Path, max_size: int) -> bytes:
+        return self._contents(path)[:max_size]
+
+    def is_native(self, path: Path) -> bool:
+        return False
+
+    def _find(self, path: Path) -> bytes | None:
+        parent = self._dirs.get(path.parent)
+        return parent.files.get(path.name) if parent is not None else None
+
+    def _contents(self, path: Path) -> bytes:
+        contents = self._find(path)
+
+        if contents is None:
+            raise self._error(path)
+
+        return contents
+
+    @staticmethod
+    def _error(path: Path) -> FileNotFoundError:
+        return FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), str(path))
@@ -0,0 +1,246 @@
+"""
+Which filesystem a directory is on, and how hard the picker can afford to hit it.
+
+Local disks and tmpfs can take eager stats and speculative reads, while network and FUSE mounts get a much more
+conservative policy: no per-entry metadata, no prefetching and small budgets for recursive searches.
+"""
+
+import os
+import select
+import threading
+from pathlib import Path
+from typing import NamedTuple
+
+from xontrib_bluray import stats, tracing
+from xontrib_bluray.constants import FS_TIMEOUT
+
+MOUNTINFO = Path("/proc/self/mountinfo")
+MAX_FOUND_MOUNTS = 4096
+
+NETWORK_FS_TYPES = frozenset(
+    (
+        "nfs",
+        "nfs4",
+        "cifs",
+        "smb3",
+        "smbfs",
+        "ncpfs",
+        "afs",
+        "9p",
+        "ceph",
+        "glusterfs",
+        "lustre",
+        "gpfs",
+        "davfs",
+    )
+)
+
+
+class Mount(NamedTuple):
+    mount_point: Path
+    fs_type: str
+    source: str
+
+
+class MountPolicy(NamedTuple):
+    name: str
+    # Whether directories can be listed speculatively, before they're navigated to
+    prefetch: bool
+    # Whether per-entry stats for metadata (sizes, times, git status, ...) are worth it
+    metadata: bool
+    # The most entries a recursive search or walk may visit
+    search_budget: int
+    # How long a single filesystem call may take, in seconds
+    timeout: float
+
+
+LOCAL_POLICY = MountPolicy(
+    name="local",
+    prefetch=True,
+    metadata=True,
+    search_budget=200_000,
+    # Local disks don't hang, they're just slow with huge directories
+    timeout=FS_TIMEOUT * 4,
+)
+NETWORK_POLICY = MountPolicy(
+    name="network",
+    prefetch=False,
+    metadata=False,
+    search_budget=5_000,
+    timeout=FS_TIMEOUT,
+)
+FUSE_POLICY = NETWORK_POLICY._replace(name="fuse")
+
+
+def _unescape(field: str) -> str:
+    # Spaces, tabs, newlines and backslashes are octal escaped
+    if "\\" not in field:
+        return field
+
+    return field.encode().decode("unicode_escape").encode("latin-1").decode()
+
+
+def parse_mountinfo(text: str) -> list[Mount]:
+    """Parses the contents of ``/proc/<pid>/mountinfo``, see proc(5)"""
+    mounts = []
+
+    for line in text.splitlines():
+        fields = line.split(" ")
+
+        try:
+            # A variable number of optional fields are ended by a lone "-"
+            separator = fields.index("-", 6)
+            mounts.append(
+                Mount(
+                    mount_point=Path(_unescape(fields[4])),
+                    fs_type=fields[separator + 1],
+                    source=_unescape(fields[separator + 2]),
+                )
+            )
+        except (ValueError, IndexError):
+            continue
+
+    return mounts
+
+
+class _MountTable:
+    """
+    The mount table, only read again once it has changed. The kernel signals changes to the mount table by marking an
+    open mountinfo file as having an exceptional condition, so checking for changes is a single non-blocking poll.
+    """
+
+    def __init__(self, path: Path = MOUNTINFO):
+        self.path = path
+        self._file = None
+        self._poll: select.poll | None = None
+        # Mount point -> mount, for mounts that shadow others only the last one is kept, which is the one that's visible
+        self._mounts: dict[Path, Mount] | None = None
+        # Path -> the mount it's on, until the mount table changes
+        self._found: dict[Path, Mount | None] = {}
+        self._mount_points: frozenset[str] | None = None
+        # Looked up from the main thread and filesystem and size workers alike
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _has_changed(self) -> bool:
+        if self._mounts is None or self._poll is None:
+            return True
+
+        return bool(self._poll.poll(0))
+
+    def _read(self) -> dict[Path, Mount]:
+        tracing.count("syscall.read_mountinfo")
+        self._found.clear()
+        self._mount_points = None
+
+        try:
+            if self._file is None:
+                self._file = open(self.path)  # noqa: SIM115
+                if hasattr(select, "poll"):
+                    self._poll = select.poll()
+                    self._poll.register(self._file, select.POLLPRI | select.POLLERR)
+
+            self._file.seek(0)
+            text = self._file.read()
+        except OSError:
+            # Not on Linux, everything gets the default policy
+            return {}
+
+        return {mount.mount_point: mount for mount in parse_mountinfo(text)}
+
+    def find(self, path: Path) -> Mount | None:
+        """The mount a path is on. This goes by the path as written, resolving symlinks would mean touching the mount."""
+        with self._lock:
+            if self._has_changed():
+                self._mounts = self._read()
+
+            assert self._mounts is not None
+
+            try:
+                mount = self._found[path]
+            except KeyError:
+                self.misses += 1
+            else:
+                self.hits += 1
+                return mount
+
+            mount = None
+            absolute = Path(os.path.abspath(path))
+            for candidate in (absolute, *absolute.parents):
+                mount = self._mounts.get(candidate)
+
+                if mount is not None:
+                    break
+
+            if len(self._found) >= MAX_FOUND_MOUNTS:
+                self._found.clear()
+
+            self._found[path] = mount
+            return mount
+
+    def mount_points(self) -> frozenset[str]:
+        """Every mount point, as strings to compare with ``DirEntry.path``"""
+        with self._lock:
+            if self._has_changed():
+                self._mounts = self._read()
+
+            assert self._mounts is not None
+
+            if self._mount_points is None:
+                self._mount_points = frozenset(map(os.fspath, self._mounts))
+
+            return self._mount_points
+
+    def get_stats(self) -> stats.CacheStats:
+        return stats.CacheStats(
+            name="mounts",
+            hits=self.hits,
+            misses=self.misses,
+            size=len(self._found),
+            max_size=MAX_FOUND_MOUNTS,
+        )
+
+    def reset(self) -> None:
+        with self._lock:
+            self._mounts = None
+            self._mount_points = None
+            self._found.clear()
+            self.reset_counters()
+
+    def reset_counters(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+
+_mount_table = _MountTable()
+stats.register_cache(
+    "mounts", _mount_table.get_stats, reset_counters=_mount_table.reset_counters
+)
+
+
+def find_mount(path: Path) -> Mount | None:
+    return _mount_table.find(path)
+
+
+def mount_points() -> frozenset[str]:
+    return _mount_table.mount_points()
+
+
+def policy_for_fs_type(fs_type: str) -> MountPolicy:
+    if fs_type in NETWORK_FS_TYPES:
+        return NETWORK_POLICY
+    # sshfs, rclone, s3fs, ... but not fuseblk, which is used by local disks (ntfs-3g, exfat-fuse)
+    elif fs_type.startswith("fuse."):
+        return FUSE_POLICY
+    else:
+        return LOCAL_POLICY
+
+
+def get_mount_policy(path: Path) -> MountPolicy:
+    mount = find_mount(path)
+
+    if mount is None:
+        return LOCAL_POLICY
+
+    return policy_for_fs_type(mount.fs_type)
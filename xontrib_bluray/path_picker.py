@@ -1,8 +1,5 @@
-import difflib
-from asyncio import Future
-from collections.abc import Iterable
-from configparser import ConfigParser
-from heapq import nlargest
+import asyncio
+from asyncio import Future, Task
 from pathlib import Path
 from typing import override
 
@@ -22,38 +19,73 @@ from prompt_toolkit.layout import (
 )
 from prompt_toolkit.widgets import Dialog, Label
 
+from xontrib_bluray import tracing
 from xontrib_bluray.constants import (
-    FILTER_MAX_RESULTS,
-    FILTER_MIN_SCORE,
+    COLUMN_WIDTH,
     MAX_CONTENT_HEIGHT,
     MIN_WIDTH,
-    STATE_FILE,
+    PREVIEW_DEBOUNCE,
+    PREVIEW_WIDTH,
 )
 from xontrib_bluray.custom_text_area import FocusStyleableTextArea
+from xontrib_bluray.filesystem import DirListing, GuardedFilesystem
+from xontrib_bluray.mounts import LOCAL_POLICY, get_mount_policy
+from xontrib_bluray.picker_engine import (
+    CURRENT_DIR_OPTION,
+    ListingColumn,
+    PathPickerEngine,
+    is_dotfile,
+)
+from xontrib_bluray.preview import Preview, format_size, previews
+
+GIT_STATE_SYMBOLS = {
+    "ignored": "!",
+    "untracked": "?",
+    "staged": "+",
+    "modified": "M",
+    "conflicted": "U",
+}
+
+
+def _entry_class(name: str, is_dir: bool) -> str:
+    if is_dotfile(name):
+        return "class:list.dir.hidden" if is_dir else "class:list.file.hidden"
+
+    return "class:list.dir" if is_dir else "class:list.file"
+
 
+def _repeat_count(event: KeyPressEvent) -> int:
+    """
+    How many times in a row a key was pressed, counting the presses of it already waiting to be handled. Those are taken
+    off the input queue, so holding a key down (especially over a slow connection) moves once per batch of input rather
+    than once per repeat, and stops as soon as the key is let go.
+    """
+    queue = event.key_processor.input_queue
+    key = event.key_sequence[-1].key
+    count = 1
 
-def is_dotfile(path: Path) -> bool:
-    return path.name.startswith(".")
+    while queue and queue[0].key == key:
+        queue.popleft()
+        count += 1
 
+    return count
 
-# Shitty settings management, can't really justify adding a package for this when it's literally just 1 setting
-def read_show_dotfiles_state() -> bool:
-    if not STATE_FILE.exists():
-        return True
 
-    state = ConfigParser()
-    state.read(STATE_FILE)
-    if state.has_section("state"):
-        return state["state"].getboolean("show_dotfiles", True)
-    else:
-        return True
+def _separator() -> Window:
+    return Window(width=1, char="\u2502", style="class:preview.title")
 
 
-def write_show_dotfiles_state(show: bool):
-    state = ConfigParser()
-    state["state"] = {"show_dotfiles": show}
-    with open(STATE_FILE, "w") as file:
-        state.write(file)
+class _SideColumn:
+    """One of the Miller columns either side of the list, whose directory is listed in the background"""
+
+    __slots__ = ("error", "listing", "path", "task")
+
+    def __init__(self):
+        # The directory the column is of, or is being listed for
+        self.path: Path | None = None
+        self.listing: DirListing | None = None
+        self.error: str | None = None
+        self.task: Task | None = None
 
 
 class PathPicker:
@@ -63,9 +95,30 @@ class PathPicker:
         current_dir: Path | None = None,
         selected_item: Path | None = None,
         accept_files: bool = True,
+        filesystem: GuardedFilesystem | None = None,
+        preview: bool = False,
+        columns: bool = False,
+        multi_select: bool = False,
     ):
-        self.show_dotfiles = read_show_dotfiles_state()
-        self.is_filtering = False
+        self.engine = PathPickerEngine(
+            current_dir=current_dir,
+            selected_item=selected_item,
+            accept_files=accept_files,
+            filesystem=filesystem,
+        )
+        # Git statuses and directory sizes are worked out in the background, redraw once they're ready. Invalidating
+        # is thread safe.
+        self.engine.on_update = get_app().invalidate
+
+        self.show_preview = preview
+        # The path the preview is of, or is being built for
+        self._preview_path: Path | None = None
+        self._preview: Preview | None = None
+        self._preview_task: Task | None = None
+
+        self.show_columns = columns
+        self._parent_column = _SideColumn()
+        self._child_column = _SideColumn()
 
         self.kb = KeyBindings()
         self.bottom_bar = Label("", align=WindowAlign.RIGHT)
@@ -76,21 +129,14 @@ class PathPicker:
             height=1,
             multiline=False,
         )
-        self.current_dir = current_dir or Path(".").absolute()
-        self.future = Future[Path | None]()
-        self.options: list[Path]
-        self._update_options_list(self.current_dir)
-        self.selected_option = (
-            0 if selected_item is None else self.options.index(selected_item)
-        )
-        self.list_offset = 0
-        self.old_selected_options: dict[Path, int] = {}
-        self.accept_files = accept_files
+        # A list of paths when several were marked
+        self.future = Future[Path | list[Path] | None]()
+        self.multi_select = multi_select
 
         textarea_kb = KeyBindings()
 
         self.filter_textarea.buffer.on_text_changed.add_handler(
-            lambda *args: self._update_and_reselect()
+            lambda *args: self.engine.set_filter_text(self.filter_textarea.text)
         )
         self.filter_textarea.control.key_bindings = textarea_kb
 
@@ -99,12 +145,12 @@ class PathPicker:
         @kb.add("up")
         @textarea_kb.add("up")
         def _(event):
-            self._move_cursor(-1)
+            self._move_cursor(-_repeat_count(event))
 
         @kb.add("down")
         @textarea_kb.add("down")
         def _(event):
-            self._move_cursor(1)
+            self._move_cursor(_repeat_count(event))
 
         @kb.add("left")
         @textarea_kb.add("left")
@@ -135,18 +181,60 @@ class PathPicker:
         def _(event):
             self._toggle_dotfiles()
 
-        @kb.add("end")
+        @kb.add("i")
+        def _(event):
+            self._toggle_ignored()
+
+        @kb.add("p")
         def _(event):
-            if not self.options:
-                return
+            self.show_preview = not self.show_preview
 
-            self.selected_option = len(self.options) - 1
-            self.list_offset = len(self.options) - MAX_CONTENT_HEIGHT
+        @kb.add("s")
+        def _(event):
+            self.engine.toggle_sizes()
+
+        @kb.add("c")
+        def _(event):
+            self.show_columns = not self.show_columns
+
+        @Condition
+        def _is_multi_select():
+            return self.multi_select
+
+        @kb.add("space", filter=_is_multi_select)
+        # Space is part of the filter text while filtering
+        @textarea_kb.add("c-space", filter=_is_multi_select)
+        def _(event):
+            self.engine.toggle_mark()
+            self._update_bottom_bar()
+
+        @kb.add("s-up", filter=_is_multi_select)
+        @textarea_kb.add("s-up", filter=_is_multi_select)
+        def _(event):
+            for _ in range(_repeat_count(event)):
+                self.engine.mark_and_move(-1)
+            self._update_bottom_bar()
+
+        @kb.add("s-down", filter=_is_multi_select)
+        @textarea_kb.add("s-down", filter=_is_multi_select)
+        def _(event):
+            for _ in range(_repeat_count(event)):
+                self.engine.mark_and_move(1)
+            self._update_bottom_bar()
+
+        @kb.add("c-a", filter=_is_multi_select)
+        @textarea_kb.add("c-a", filter=_is_multi_select)
+        def _(event):
+            self.engine.toggle_mark_all()
+            self._update_bottom_bar()
+
+        @kb.add("end")
+        def _(event):
+            self.engine.select_last()
 
         @kb.add("home")
         def _(event):
-            self.selected_option = 0
-            self.list_offset = 0
+            self.engine.select_first()
 
         @kb.add("~")
         def _(event):
@@ -159,15 +247,45 @@ class PathPicker:
         def _(event: KeyPressEvent):
             self._toggle_filtering()
 
+        @textarea_kb.add("tab")
+        def _(event: KeyPressEvent):
+            self.engine.cycle_filter_mode()
+
         self.main_window = Window(
             FormattedTextControl(self._draw, focusable=True, key_bindings=kb),
             always_hide_cursor=True,
             width=Dimension(min=MIN_WIDTH),
         )
 
+        self.preview_window = Window(
+            FormattedTextControl(self._draw_preview),
+            width=Dimension(max=PREVIEW_WIDTH, preferred=PREVIEW_WIDTH),
+            wrap_lines=False,
+        )
+
         @Condition
         def _is_filtering():
-            return self.is_filtering
+            return self.engine.is_filtering
+
+        self.parent_window = Window(
+            FormattedTextControl(self._draw_parent_column),
+            width=COLUMN_WIDTH,
+            wrap_lines=False,
+        )
+
+        self.child_window = Window(
+            FormattedTextControl(self._draw_child_column),
+            width=COLUMN_WIDTH,
+            wrap_lines=False,
+        )
+
+        @Condition
+        def _is_previewing():
+            return self.show_preview
+
+        @Condition
+        def _is_showing_columns():
+            return self.show_columns
 
         self.container = HSplit(
             [
@@ -175,7 +293,15 @@ class PathPicker:
                     [
                         Label(" ", dont_extend_width=True, width=1),  # Spacer
                         ConditionalContainer(
-                            self.filter_textarea,
+                            VSplit(
+                                [
+                                    Label(
+                                        self._get_filter_mode_text,
+                                        dont_extend_width=True,
+                                    ),
+                                    self.filter_textarea,
+                                ]
+                            ),
                             filter=_is_filtering,
                             alternative_content=Label(
                                 "Press '/' to filter...", style="class:filter-hint"
@@ -184,30 +310,50 @@ class PathPicker:
                         Label(" ", dont_extend_width=True, width=1),  # Spacer
                     ],
                 ),
-                self.main_window,
+                VSplit(
+                    [
+                        ConditionalContainer(
+                            VSplit([self.parent_window, _separator()]),
+                            filter=_is_showing_columns,
+                        ),
+                        self.main_window,
+                        ConditionalContainer(
+                            VSplit([_separator(), self.child_window]),
+                            filter=_is_showing_columns,
+                        ),
+                        ConditionalContainer(
+                            VSplit([_separator(), self.preview_window]),
+                            filter=_is_previewing,
+                        ),
+                    ]
+                ),
                 self.bottom_bar,
             ],
         )
         self._update_bottom_bar()
 
-    def _move_cursor(self, direction: int) -> None:
-        # Prevent modulo by 0 errors
-        if not self.options:
-            return
+    def _get_filter_mode_text(self) -> StyleAndTextTuples:
+        style = (
+            "class:filter-error" if self.engine.filter_error else "class:filter-mode"
+        )
+        return [(style, f"{self.engine.filter_mode} \u21e5 ")]
+
+    @property
+    def current_dir(self) -> Path:
+        return self.engine.current_dir
 
-        self.selected_option = (self.selected_option + direction) % len(self.options)
-        self._update_list_offset()
+    def _move_cursor(self, direction: int) -> None:
+        self.engine.move_cursor(direction)
 
     def _toggle_filtering(self) -> None:
-        self.is_filtering = not self.is_filtering
+        self.engine.set_filtering(not self.engine.is_filtering)
         app = get_app()
 
-        if self.is_filtering:
+        if self.engine.is_filtering:
             app.layout.focus(self.filter_textarea)
         else:
             app.layout.focus(self.main_window)
             self._clear_filter()
-            self._update_and_reselect()
 
         self._update_bottom_bar()
 
@@ -215,133 +361,54 @@ class PathPicker:
         self.filter_textarea.text = ""
 
     def _navigate_home(self) -> None:
-        new_dir = Path.home()
-
-        try:
-            self._update_options_list(new_dir)
-        except OSError:
-            return
-
-        self.old_selected_options[self.current_dir] = self.selected_option
-        index_of_current_item_in_parent = (
-            self.options.index(self.current_dir)
-            if self.current_dir in self.options
-            else 0
-        )
-        self.selected_option = self.old_selected_options.get(
-            new_dir, index_of_current_item_in_parent
-        )
-        self.current_dir = new_dir
-        self._update_list_offset()
+        self.engine.navigate_home()
+        self._update_bottom_bar()
 
     def _navigate_up(self) -> None:
-        new_dir = self.current_dir.parent
-
-        try:
-            self._update_options_list(new_dir)
-        except OSError:
-            return
-
-        index_of_current_item_in_parent = (
-            self.options.index(self.current_dir)
-            # Toggling dotfiles may cause the current directory to disappear
-            if self.current_dir in self.options
-            else 0
-        )
-
-        self.old_selected_options[self.current_dir] = self.selected_option
-        self.selected_option = index_of_current_item_in_parent
-        self.current_dir = new_dir
-        self._update_list_offset()
+        self.engine.navigate_up()
+        self._update_bottom_bar()
 
     def _navigate_down(self) -> None:
-        if not self.options:
-            return
-
-        new_dir = self.options[self.selected_option]
-
-        if not new_dir.is_dir():
-            return
-
-        try:
-            self._update_options_list(new_dir)
-        except OSError:
-            return
-
-        self.old_selected_options[self.current_dir] = self.selected_option
-        self.current_dir = new_dir
-        self.selected_option = self.old_selected_options.get(self.current_dir, 0)
-        self._update_list_offset()
+        self.engine.navigate_down()
+        self._update_bottom_bar()
 
     def _toggle_dotfiles(self) -> None:
-        self.show_dotfiles = not self.show_dotfiles
-        self._update_and_reselect()
+        self.engine.toggle_dotfiles()
         self._update_bottom_bar()
-        write_show_dotfiles_state(self.show_dotfiles)
-
-    def _update_and_reselect(self):
-        old_options = self.options
-        old_selection = self.selected_option
-        selection = self.options[min(self.selected_option, len(self.options) - 1)]
-        self._update_options_list(self.current_dir)
-
-        if self.is_filtering:
-            # Always highlight best match while filtering
-            self.selected_option = min(1, len(self.options) - 1)
-        elif selection in self.options:
-            # If the selected is still in the list, re-select it
-            self.selected_option = self.options.index(selection)
-        else:
-            # If the old selection is no longer in the options list, try to select the closest thing to it that is still in the list
-
-            def find_nearest_item(items: Iterable[Path]) -> tuple[int, Path | None]:
-                for distance, option in enumerate(items):
-                    if option in self.options:
-                        return distance, option
-
-                return 0, None
-
-            max_items_to_check = 20
-
-            # Search forwards in the list
-            forwards_distance, forwards_item = find_nearest_item(
-                old_options[old_selection + 1 : old_selection + max_items_to_check :]
-            )
-            # Search backwards in the list
-            backwards_distance, backwards_item = find_nearest_item(
-                old_options[old_selection - 1 : old_selection - max_items_to_check : -1]
-            )
-
-            # Select the nearest previous or next item
-            if forwards_item and backwards_item:
-                if backwards_distance < forwards_distance:
-                    self.selected_option = self.options.index(backwards_item)
-                else:
-                    self.selected_option = self.options.index(forwards_item)
-            elif forwards_item:
-                self.selected_option = self.options.index(forwards_item)
-            elif backwards_item:
-                self.selected_option = self.options.index(backwards_item)
-            else:
-                # Fallback
-                self.selected_option = 0
-
-        self._update_list_offset()
 
-    def _update_list_offset(self) -> None:
-        if self.selected_option >= self.list_offset + MAX_CONTENT_HEIGHT - 1:
-            self.list_offset = self.selected_option - MAX_CONTENT_HEIGHT + 1
-        elif self.selected_option < self.list_offset:
-            self.list_offset = self.selected_option
+    def _toggle_ignored(self) -> None:
+        self.engine.toggle_ignored()
+        self._update_bottom_bar()
 
     def _update_bottom_bar(self) -> None:
         disabled_style = "class:bottom-bar.disabled"
-        dotfile_icon = "\uf441" if self.show_dotfiles else "\uf4c5"
-        filter_icon = "\U000f0233" if self.is_filtering else "\U000f14f0"
+        show_dotfiles = self.engine.show_dotfiles
+        show_ignored = self.engine.show_ignored
+        is_filtering = self.engine.is_filtering
+        dotfile_icon = "\uf441" if show_dotfiles else "\uf4c5"
+        ignored_icon = "\uf441" if show_ignored else "\uf4c5"
+        filter_icon = "\U000f0233" if is_filtering else "\U000f14f0"
+        mount_policy = self.engine.mount_policy
+        mount_icon = "\uf0a0" if mount_policy is LOCAL_POLICY else "\U000f0318"
+
+        marks: StyleAndTextTuples = []
+        mark_count = self.engine.mark_count if self.multi_select else 0
+
+        if mark_count:
+            marks = [("class:bottom-bar.marked", f"{mark_count} marked"), ("", "  ")]
 
         self.bottom_bar.text = [
+            *marks,
+            (
+                f"class:bottom-bar.mount.{mount_policy.name}",
+                f"{mount_icon} {mount_policy.name.capitalize()}",
+            ),
             (
-                "class:bottom-bar.filtering" if self.is_filtering else disabled_style,
+                "",
+                "  ",
+            ),
+            (
+                "class:bottom-bar.filtering" if is_filtering else disabled_style,
                 f"{filter_icon} Filter",
             ),
             (
@@ -349,118 +416,67 @@ class PathPicker:
                 "  ",
             ),
             (
-                "class:bottom-bar.dotfiles" if self.show_dotfiles else disabled_style,
+                "class:bottom-bar.dotfiles" if show_dotfiles else disabled_style,
                 f"{dotfile_icon} Dotfiles",
             ),
+            (
+                "",
+                "  ",
+            ),
+            (
+                "class:bottom-bar.ignored" if show_ignored else disabled_style,
+                f"{ignored_icon} Ignored",
+            ),
         ]
 
-    def _update_options_list(self, new_dir: Path) -> None:
-        def dotfiles_filter(path: Path):
-            if self.show_dotfiles:
-                return True
-            else:
-                return not is_dotfile(path)
-
-        items: list[Path] = list(filter(dotfiles_filter, new_dir.iterdir()))
-        filter_text = self.filter_textarea.text
-
-        if self.is_filtering and filter_text != "":
-            self.options = self._filter_items(items, filter_text)
-        else:
-
-            def name_key(it: Path):
-                return it.name.lower()
-
-            dirs = sorted(filter(lambda it: it.is_dir(), items), key=name_key)
-            files = sorted(filter(lambda it: it.is_file(), items), key=name_key)
-
-            self.options = list(dirs + files)
-
-        # Add an option to select the current directory, always at the top of the list
-        if len(self.options) > 0:
-            self.options.insert(0, new_dir)
-        else:
-            self.options.append(new_dir)
-
-    @staticmethod
-    def _filter_items(items: list[Path], filter_text: str) -> list[Path]:
-        # Modified from difflib.get_close_matches
-
-        if not 0.0 <= FILTER_MIN_SCORE <= 1.0:
-            raise ValueError(f"cutoff must be in [0.0, 1.0]: {FILTER_MIN_SCORE}")
-
-        result = []
-        s = difflib.SequenceMatcher()
-        s.set_seq2(filter_text)
-        for candidate_path in items:
-            candidate = candidate_path.name
-            s.set_seq1(candidate)
-            if (
-                s.real_quick_ratio() >= FILTER_MIN_SCORE
-                and s.quick_ratio() >= FILTER_MIN_SCORE
-                and s.ratio() >= FILTER_MIN_SCORE
-            ):
-                multiplier = 1
-
-                if len(filter_text) >= 3:
-                    # Boost candidates that start with the filter text and other exact matches
-                    if candidate.startswith(filter_text):
-                        multiplier = 9
-                    elif candidate.lower().startswith(filter_text.lower()):
-                        multiplier = 8
-                    elif filter_text in candidate:
-                        multiplier = 7
-                    elif filter_text.lower() in candidate.lower():
-                        multiplier = 6
-
-                result.append((s.ratio() * multiplier, candidate_path))
-
-        # Move the best scorers to head of list
-        result = nlargest(FILTER_MAX_RESULTS, result)
-
-        return [item for score, item in result]
-
     def _selected(self) -> None:
+        if self.multi_select and (marked := self.engine.select_marked()):
+            self.future.set_result(marked)
+            return
+
         # TODO: show a message if the dialog doesn't accept files
-        selected = self.options[self.selected_option]
+        selected = self.engine.select()
 
-        if self.accept_files or not selected.is_file():
+        if selected is not None:
             self.future.set_result(selected)
 
     def _cancelled(self) -> None:
         self.future.set_result(None)
 
     def _draw(self) -> StyleAndTextTuples:
-        if not self.options:
+        with tracing.span("draw"):
+            return self._draw_options()
+
+    def _draw_options(self) -> StyleAndTextTuples:
+        engine = self.engine
+
+        if not engine.options:
             return [("#ff0000", "It's empty here!")]
 
         tokens = []
         this_dir_label = "<this directory>"
         # Only render the options which are visible, much more efficient for directories with tons of items in them
-        visible_options = self.options[
-            self.list_offset : self.list_offset + MAX_CONTENT_HEIGHT
-        ]
+        visible_options = engine.visible_options
+        marked = engine.marked.get(engine.current_dir, ())
         longest_name = max(
-            max(len(option.name) for option in visible_options), len(this_dir_label)
+            max(len(option) for option in visible_options), len(this_dir_label)
         )
 
         for visible_idx, option in enumerate(visible_options):
-            idx = visible_idx + self.list_offset
-            if idx == self.selected_option:
+            idx = visible_idx + engine.list_offset
+            if idx == engine.selected_option:
                 tokens.append(("[SetCursorPosition]", ""))
 
-            is_selected = idx == self.selected_option
+            is_selected = idx == engine.selected_option
 
-            icon = "\uf114" if option.is_dir() else "\uf016"
-            hidden_class = (
-                "class:list.dir.hidden" if option.is_dir() else "class:list.file.hidden"
-            )
-            normal_class = "class:list.dir" if option.is_dir() else "class:list.file"
-            type_class = hidden_class if is_dotfile(option) else normal_class
+            is_dir = engine.is_dir(option)
+            icon = "\uf114" if is_dir else "\uf016"
+            type_class = _entry_class(option, is_dir)
             prefix = ">" if is_selected else " "
+            is_marked = option in marked
 
             # special handling for selecting this directory
-            if option == self.current_dir:
+            if option == CURRENT_DIR_OPTION:
                 combined_class = (
                     "class:list.selected" if is_selected else "class:list.thisdir"
                 )
@@ -473,25 +489,209 @@ class PathPicker:
                     )
                 )
             else:
-                combined_class = "class:list.selected" if is_selected else type_class
+                if is_selected:
+                    combined_class = "class:list.selected"
+                elif is_marked:
+                    combined_class = "class:list.marked"
+                else:
+                    combined_class = type_class
+
                 tokens.append(
                     (
                         combined_class,
-                        f"{prefix} {icon} {option.name}"
-                        + " " * (longest_name - len(option.name)),
+                        f"{prefix}{'*' if is_marked else ' '}{icon} {option}"
+                        + " " * (longest_name - len(option)),
                     )
                 )
 
+                if is_dir and engine.show_sizes:
+                    tokens.append(("class:list.size", self._format_dir_size(option)))
+
+                git_state = engine.git_state(option)
+                if git_state is not None:
+                    tokens.append(
+                        (
+                            f"class:list.git.{git_state}",
+                            f" {GIT_STATE_SYMBOLS[git_state]}",
+                        )
+                    )
+
+                if is_dir and engine.is_unresponsive(option):
+                    tokens.append(("class:list.unresponsive", " (unresponsive)"))
+
+            tokens.append(("", "\n"))
+
+        if engine.filter_error:
+            tokens.append(("class:filter-error", engine.filter_error))
+        else:
+            # remove the trailing \n
+            tokens.pop()
+
+        return tokens
+
+    def _draw_preview(self) -> StyleAndTextTuples:
+        engine = self.engine
+        path = engine.path_of(engine.options[engine.selected_option])
+
+        if path != self._preview_path:
+            self._preview_path = path
+            # Whatever was built for it last time, until it's been checked for changes
+            self._preview = previews.peek(path)
+
+            if self._preview_task is not None:
+                self._preview_task.cancel()
+            self._preview_task = get_app().create_background_task(
+                self._load_preview(path)
+            )
+
+        preview = self._preview
+
+        if preview is None:
+            return [("class:preview.title", " ...")]
+
+        tokens: StyleAndTextTuples = [("class:preview.title", f" {preview.title}")]
+
+        for line in preview.lines:
+            tokens.append(("class:preview", f"\n {line}"))
+
+        return tokens
+
+    async def _load_preview(self, path: Path) -> None:
+        # Moving the cursor cancels this, so nothing is read for entries the cursor only passes over
+        await asyncio.sleep(PREVIEW_DEBOUNCE)
+        preview = await asyncio.to_thread(previews.get, self.engine.filesystem, path)
+
+        if path == self._preview_path:
+            self._preview = preview
+            get_app().invalidate()
+
+    def _draw_parent_column(self) -> StyleAndTextTuples:
+        current_dir = self.engine.current_dir
+        # The root has nothing above it
+        parent = current_dir.parent if current_dir.parent != current_dir else None
+        listing = self._show_in_column(self._parent_column, parent, debounce=False)
+
+        if listing is None:
+            return self._draw_column_hint(self._parent_column)
+
+        column = ListingColumn(listing, self.engine.show_dotfiles)
+        return self._draw_column(column, column.index_of_dir(current_dir.name))
+
+    def _draw_child_column(self) -> StyleAndTextTuples:
+        engine = self.engine
+        path = None
+
+        if engine.options:
+            option = engine.options[engine.selected_option]
+            if option != CURRENT_DIR_OPTION and engine.is_dir(option):
+                path = engine.path_of(option)
+
+        # Listing the selected directory is speculative, which slow mounts can't afford
+        if path is not None and not get_mount_policy(path).prefetch:
+            self._show_in_column(self._child_column, None, debounce=True)
+            return [("class:column.hint", " Not listed ahead on this mount")]
+
+        listing = self._show_in_column(self._child_column, path, debounce=True)
+
+        if listing is None:
+            return self._draw_column_hint(self._child_column)
+
+        column = ListingColumn(listing, engine.show_dotfiles)
+
+        if not column:
+            return [("class:column.hint", " Empty")]
+
+        return self._draw_column(column, None)
+
+    @staticmethod
+    def _draw_column(column: ListingColumn, current: int | None) -> StyleAndTextTuples:
+        tokens: StyleAndTextTuples = []
+
+        # Only the rows in view are looked at, however big the directory is
+        for row in column.window(current or 0, MAX_CONTENT_HEIGHT):
+            name, is_dir = column.entry(row)
+            icon = "\uf114" if is_dir else "\uf016"
+            text = f" {icon} {name}"
+
+            if len(text) > COLUMN_WIDTH:
+                text = text[: COLUMN_WIDTH - 1] + "\u2026"
+
+            style = (
+                "class:column.current" if row == current else _entry_class(name, is_dir)
+            )
+            tokens.append((style, text.ljust(COLUMN_WIDTH) if row == current else text))
             tokens.append(("", "\n"))
 
-        # remove the trailing \n
-        tokens.pop()
+        if tokens:
+            tokens.pop()
 
         return tokens
 
+    @staticmethod
+    def _draw_column_hint(side: _SideColumn) -> StyleAndTextTuples:
+        if side.path is None:
+            return []
+        elif side.error is not None:
+            return [("class:column.hint", f" {side.error}")]
+
+        # Still being listed
+        return [("class:column.hint", " ...")]
+
+    def _show_in_column(
+        self, side: _SideColumn, path: Path | None, debounce: bool
+    ) -> DirListing | None:
+        """The listing of the directory a column is to show, or None while it's being listed in the background"""
+        if path != side.path:
+            side.path = path
+            side.listing = None
+            side.error = None
+
+            if side.task is not None:
+                side.task.cancel()
+                side.task = None
+
+            if path is not None:
+                side.task = get_app().create_background_task(
+                    self._load_column(side, path, debounce)
+                )
+
+        return side.listing
+
+    async def _load_column(self, side: _SideColumn, path: Path, debounce: bool) -> None:
+        if debounce:
+            # Moving the cursor cancels this, so nothing is listed for directories the cursor only passes over
+            await asyncio.sleep(PREVIEW_DEBOUNCE)
+
+        # From the listing cache when it's there. Otherwise this also puts it there, so going into the directory
+        # afterwards doesn't have to list it again.
+        try:
+            listing = await asyncio.to_thread(self.engine.filesystem.list_dir, path)
+            error = None
+        except OSError as e:
+            listing = None
+            error = e.strerror or str(e)
+
+        if path == side.path:
+            side.listing = listing
+            side.error = error
+            get_app().invalidate()
+
+    def _format_dir_size(self, option: str) -> str:
+        size = self.engine.dir_size(option)
+
+        if size is None:
+            return " " * 12
+
+        # Still being added up, or only partly counted
+        suffix = " " if size.complete else "+" if size.done else "\u2026"
+        return f" {format_size(size.size):>10}{suffix}"
+
     def on_show(self) -> None:
         get_app().layout.focus(self.container.children[1])
 
+    def on_hide(self) -> None:
+        self.engine.close()
+
     def __pt_container__(self) -> HSplit:
         return self.container
 
@@ -504,11 +704,19 @@ class PathPickerDialog(PathPicker):
         current_dir: Path | None = None,
         selected_item: Path | None = None,
         accept_files: bool = True,
+        filesystem: GuardedFilesystem | None = None,
+        preview: bool = False,
+        columns: bool = False,
+        multi_select: bool = False,
     ):
         super().__init__(
             current_dir=current_dir,
             selected_item=selected_item,
             accept_files=accept_files,
+            filesystem=filesystem,
+            preview=preview,
+            columns=columns,
+            multi_select=multi_select,
         )
         self._title = title
         self.dialog = Dialog(
@@ -0,0 +1,787 @@
+import difflib
+import fnmatch
+import functools
+import re
+from bisect import bisect_left
+from collections.abc import Callable, Iterable
+from configparser import ConfigParser
+from heapq import nlargest
+from pathlib import Path
+from typing import NamedTuple
+
+from xontrib_bluray import stats, tracing
+from xontrib_bluray.constants import (
+    FILTER_MAX_RESULTS,
+    FILTER_MIN_SCORE,
+    FILTER_PATTERN_CACHE_SIZE,
+    MAX_CONTENT_HEIGHT,
+    STATE_FILE,
+)
+from xontrib_bluray.dir_sizes import DirSize, SizeJob, dir_sizes
+from xontrib_bluray.filesystem import (
+    KIND_DIR,
+    DirListing,
+    GuardedFilesystem,
+    default_filesystem,
+)
+from xontrib_bluray.git_status import GitStatus, git_statuses
+from xontrib_bluray.ignore import ignore_matchers
+from xontrib_bluray.mounts import MountPolicy, get_mount_policy
+
+# The option for choosing the current directory itself. A directory can't contain an entry called ".", and joining it
+# onto a path leaves the path as it is
+CURRENT_DIR_OPTION = "."
+# How the filter text is matched against names: scored by similarity, or selected exactly by a glob or regex
+FILTER_MODES = ("fuzzy", "glob", "regex")
+GLOB_CHARS = frozenset("*?[")
+
+
+def is_dotfile(name: str) -> bool:
+    return name.startswith(".")
+
+
+# Shitty settings management, can't really justify adding a package for this when it's literally just 2 settings
+def read_state_flag(key: str) -> bool:
+    if not STATE_FILE.exists():
+        return True
+
+    state = ConfigParser()
+    state.read(STATE_FILE)
+    if state.has_section("state"):
+        return state["state"].getboolean(key, True)
+    else:
+        return True
+
+
+def write_state_flag(key: str, value: bool):
+    state = ConfigParser()
+    # Keep the other settings
+    state.read(STATE_FILE)
+    if not state.has_section("state"):
+        state.add_section("state")
+    state["state"][key] = str(value)
+    with open(STATE_FILE, "w") as file:
+        state.write(file)
+
+
+def fuzzy_filter(items: list[str], filter_text: str) -> list[str]:
+    """The names which are similar to the filter text, best matches first"""
+    # Modified from difflib.get_close_matches
+
+    if not 0.0 <= FILTER_MIN_SCORE <= 1.0:
+        raise ValueError(f"cutoff must be in [0.0, 1.0]: {FILTER_MIN_SCORE}")
+
+    result = []
+    s = difflib.SequenceMatcher()
+    s.set_seq2(filter_text)
+    for candidate in items:
+        s.set_seq1(candidate)
+        if (
+            s.real_quick_ratio() >= FILTER_MIN_SCORE
+            and s.quick_ratio() >= FILTER_MIN_SCORE
+            and s.ratio() >= FILTER_MIN_SCORE
+        ):
+            multiplier = 1
+
+            if len(filter_text) >= 3:
+                # Boost candidates that start with the filter text and other exact matches
+                if candidate.startswith(filter_text):
+                    multiplier = 9
+                elif candidate.lower().startswith(filter_text.lower()):
+                    multiplier = 8
+                elif filter_text in candidate:
+                    multiplier = 7
+                elif filter_text.lower() in candidate.lower():
+                    multiplier = 6
+
+            result.append((s.ratio() * multiplier, candidate))
+
+    # Move the best scorers to head of list
+    result = nlargest(FILTER_MAX_RESULTS, result)
+
+    return [item for score, item in result]
+
+
+@functools.lru_cache(maxsize=FILTER_PATTERN_CACHE_SIZE)
+def compile_filter(mode: str, filter_text: str) -> Callable[[str], object]:
+    """
+    A predicate matching names against a glob or regex filter. Matching ignores case unless the filter text has an
+    uppercase letter in it. Raises ``re.error`` for an invalid pattern.
+    """
+    flags = 0 if any(char.isupper() for char in filter_text) else re.IGNORECASE
+
+    if mode == "glob":
+        # A glob without any wildcards matches names containing it, like the other modes
+        if GLOB_CHARS.isdisjoint(filter_text):
+            filter_text = f"*{filter_text}*"
+
+        return re.compile(fnmatch.translate(filter_text), flags).match
+    elif mode == "regex":
+        return re.compile(filter_text, flags).search
+
+    raise ValueError(f"Can't compile a {mode} filter")
+
+
+stats.register_lru_cache("filter_patterns", compile_filter)
+
+
+class DotfileViews(NamedTuple):
+    """
+    The options of a listing with and without dotfiles, and where each option of one ends up in the other, so that
+    showing or hiding dotfiles is just a matter of switching lists.
+
+    Listings are sorted case-insensitively, and "." sorts before any letter or digit, so the dotfiles among the dirs
+    and among the files are each one run of options. Positions are translated by skipping over those two runs.
+    """
+
+    # Every option, the current directory option first
+    shown: list[str]
+    # The options which aren't dotfiles, in the same order
+    hidden: list[str]
+    # Where the dotfiles among the dirs, and then among the files, are in ``shown``
+    dir_dotfiles: range
+    file_dotfiles: range
+    # The names of the directories among the options
+    dirs: frozenset[str]
+
+    def to_hidden(self, position: int) -> int:
+        """The position in ``hidden`` of an option in ``shown``, or for a dotfile of the next option that isn't one"""
+        dir_dotfiles, file_dotfiles = self.dir_dotfiles, self.file_dotfiles
+
+        if position >= file_dotfiles.stop:
+            position -= len(dir_dotfiles) + len(file_dotfiles)
+        elif position >= file_dotfiles.start:
+            position = file_dotfiles.start - len(dir_dotfiles)
+        elif position >= dir_dotfiles.stop:
+            position -= len(dir_dotfiles)
+        elif position >= dir_dotfiles.start:
+            position = dir_dotfiles.start
+
+        # Dotfiles at the end of the list have nothing after them, use the option before them
+        return min(position, len(self.hidden) - 1)
+
+    def to_shown(self, position: int) -> int:
+        """The position in ``shown`` of an option in ``hidden``"""
+        if position >= self.dir_dotfiles.start:
+            position += len(self.dir_dotfiles)
+        if position >= self.file_dotfiles.start:
+            position += len(self.file_dotfiles)
+
+        return position
+
+
+def _dotfiles_run(names: list[str], offset: int) -> range:
+    # Names starting with "." sort from "." up to, but not including, "/"
+    return range(
+        offset + bisect_left(names, ".", key=str.lower),
+        offset + bisect_left(names, "/", key=str.lower),
+    )
+
+
+def dotfile_views(listing: DirListing) -> DotfileViews:
+    dirs, files = listing.dirs, listing.files
+    shown = [CURRENT_DIR_OPTION, *dirs, *files]
+    # After the current directory option
+    dir_dotfiles = _dotfiles_run(dirs, 1)
+    file_dotfiles = _dotfiles_run(files, 1 + len(dirs))
+
+    return DotfileViews(
+        shown=shown,
+        hidden=[
+            *shown[: dir_dotfiles.start],
+            *shown[dir_dotfiles.stop : file_dotfiles.start],
+            *shown[file_dotfiles.stop :],
+        ],
+        dir_dotfiles=dir_dotfiles,
+        file_dotfiles=file_dotfiles,
+        dirs=frozenset((CURRENT_DIR_OPTION, *dirs)),
+    )
+
+
+class ListingColumn:
+    """
+    The entries of a listing as shown in one of the Miller columns beside the list: its directories then its files,
+    without the dotfiles while they're hidden. Nothing is copied, entries are only looked up for the rows in view.
+    """
+
+    __slots__ = ("_dir_dotfiles", "_file_dotfiles", "_len", "_len_dirs", "listing")
+
+    def __init__(self, listing: DirListing, show_dotfiles: bool):
+        self.listing = listing
+        if show_dotfiles:
+            self._dir_dotfiles = self._file_dotfiles = range(0)
+        else:
+            self._dir_dotfiles = _dotfiles_run(listing.dirs, 0)
+            self._file_dotfiles = _dotfiles_run(listing.files, 0)
+
+        self._len_dirs = len(listing.dirs) - len(self._dir_dotfiles)
+        self._len = self._len_dirs + len(listing.files) - len(self._file_dotfiles)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def entry(self, index: int) -> tuple[str, bool]:
+        """The name of an entry, and whether it's a directory"""
+        if index < self._len_dirs:
+            names, dotfiles, is_dir = self.listing.dirs, self._dir_dotfiles, True
+        else:
+            index -= self._len_dirs
+            names, dotfiles, is_dir = self.listing.files, self._file_dotfiles, False
+
+        if index >= dotfiles.start:
+            index += len(dotfiles)
+
+        return names[index], is_dir
+
+    def index_of_dir(self, name: str) -> int | None:
+        dirs = self.listing.dirs
+        key = name.lower()
+        position = bisect_left(dirs, key, key=str.lower)
+
+        # Names only differing in case sort next to each other, in no particular order
+        while position < len(dirs) and dirs[position].lower() == key:
+            if dirs[position] == name:
+                if position in self._dir_dotfiles:
+                    return None
+                elif position >= self._dir_dotfiles.stop:
+                    return position - len(self._dir_dotfiles)
+
+                return position
+
+            position += 1
+
+        return None
+
+    def window(self, around: int, height: int) -> range:
+        """The rows in view with ``around`` in the middle, as far as the ends allow"""
+        start = max(0, min(around - height // 2, self._len - height))
+        return range(start, min(start + height, self._len))
+
+
+class PathPickerEngine:
+    """
+    The state of a path picker (the listing, filter, selection and viewport) and the actions which can be performed on
+    it, without any prompt_toolkit widgets. This can be driven without a running application, the ``PathPicker``
+    widget is just a view on top of it.
+
+    Options are the names of the entries in ``current_dir``, full paths are only built for the one that's chosen.
+    """
+
+    def __init__(
+        self,
+        *,
+        current_dir: Path | None = None,
+        selected_item: Path | None = None,
+        accept_files: bool = True,
+        show_dotfiles: bool | None = None,
+        show_ignored: bool | None = None,
+        persist_state: bool = True,
+        filesystem: GuardedFilesystem | None = None,
+    ):
+        self.filesystem = filesystem or default_filesystem
+        self.show_dotfiles = (
+            read_state_flag("show_dotfiles") if show_dotfiles is None else show_dotfiles
+        )
+        # Whether files ignored by git (or .ignore files) are listed
+        self.show_ignored = (
+            read_state_flag("show_ignored") if show_ignored is None else show_ignored
+        )
+        self.persist_state = persist_state
+        self.is_filtering = False
+        self.filter_text = ""
+        self.filter_mode = FILTER_MODES[0]
+        # Why the filter text can't be used, e.g. an invalid regex
+        self.filter_error: str | None = None
+        self.current_dir = current_dir or Path(".").absolute()
+        self.options: list[str]
+        # Both dotfile views of the last listing, reused until the directory is listed again. Its directories are also
+        # how options are known to be directories, so nothing needs to stat them again.
+        self._views: DotfileViews
+        self._views_listing: DirListing | None = None
+        # The ignored names of the last listing, along with its directory and the listing itself
+        self._ignored: tuple[Path, DirListing, frozenset[str]] | None = None
+        # Called from other threads once something worked out in the background (git status, directory sizes) is
+        # ready, e.g. to redraw
+        self.on_update: Callable[[], None] | None = None
+        # Whether the total sizes of the directories are worked out
+        self.show_sizes = False
+        self._size_job: SizeJob | None = None
+        # The repository of the listed directory, and where in it the directory is (with a trailing "/")
+        self._git_root: Path | None = None
+        self._git_prefix = ""
+        self._git_status: GitStatus | None = None
+        # The state of every entry, when the listed directory is untracked or ignored as a whole
+        self._git_inherited_state: str | None = None
+        self._update_options_list(self.current_dir)
+        self.selected_option = (
+            0
+            if selected_item is None
+            # Hidden if it's a dotfile or ignored, the list starts at the top then
+            else self._index_of_path(self.current_dir, selected_item, default=0)
+        )
+        self.list_offset = 0
+        self.old_selected_options: dict[Path, int] = {}
+        self.accept_files = accept_files
+        # Directory -> the names of its marked entries, for choosing several paths at once. Names are all that's kept, so
+        # marking thousands of entries doesn't build thousands of paths.
+        self.marked: dict[Path, set[str]] = {}
+
+    @property
+    def mount_policy(self) -> MountPolicy:
+        return get_mount_policy(self.current_dir)
+
+    @property
+    def visible_options(self) -> list[str]:
+        return self.options[self.list_offset : self.list_offset + MAX_CONTENT_HEIGHT]
+
+    def move_cursor(self, direction: int) -> None:
+        # Prevent modulo by 0 errors
+        if not self.options:
+            return
+
+        self.selected_option = (self.selected_option + direction) % len(self.options)
+        self._update_list_offset()
+
+    def select_first(self) -> None:
+        self.selected_option = 0
+        self.list_offset = 0
+
+    def select_last(self) -> None:
+        if not self.options:
+            return
+
+        self.selected_option = len(self.options) - 1
+        self.list_offset = len(self.options) - MAX_CONTENT_HEIGHT
+
+    def set_filtering(self, is_filtering: bool) -> None:
+        self.is_filtering = is_filtering
+
+        if not is_filtering:
+            self.filter_text = ""
+            self.update_and_reselect()
+
+    def set_filter_text(self, filter_text: str) -> None:
+        if filter_text == self.filter_text:
+            return
+
+        self.filter_text = filter_text
+        self.update_and_reselect()
+
+    def cycle_filter_mode(self) -> None:
+        self.filter_mode = FILTER_MODES[
+            (FILTER_MODES.index(self.filter_mode) + 1) % len(FILTER_MODES)
+        ]
+
+        if self.is_filtering and self.filter_text:
+            self.update_and_reselect()
+
+    def navigate_home(self) -> None:
+        new_dir = Path.home()
+
+        try:
+            self._update_options_list(new_dir)
+        except OSError:
+            return
+
+        self.old_selected_options[self.current_dir] = self.selected_option
+        index_of_current_item_in_parent = self._index_of_path(
+            new_dir, self.current_dir, default=0
+        )
+        self.selected_option = self.old_selected_options.get(
+            new_dir, index_of_current_item_in_parent
+        )
+        self.current_dir = new_dir
+        self._update_list_offset()
+
+    def navigate_up(self) -> None:
+        new_dir = self.current_dir.parent
+
+        try:
+            self._update_options_list(new_dir)
+        except OSError:
+            return
+
+        # Toggling dotfiles may cause the current directory to disappear
+        index_of_current_item_in_parent = self._index_of_path(
+            new_dir, self.current_dir, default=0
+        )
+
+        self.old_selected_options[self.current_dir] = self.selected_option
+        self.selected_option = index_of_current_item_in_parent
+        self.current_dir = new_dir
+        self._update_list_offset()
+
+    def navigate_down(self) -> None:
+        if not self.options:
+            return
+
+        option = self.options[self.selected_option]
+        new_dir = self.current_dir / option
+
+        try:
+            # Some files can be browsed into too, like archives with the archive filesystem
+            if not self.is_dir(option) and self.filesystem.kind(new_dir) != KIND_DIR:
+                return
+
+            self._update_options_list(new_dir)
+        except OSError:
+            return
+
+        self.old_selected_options[self.current_dir] = self.selected_option
+        self.current_dir = new_dir
+        self.selected_option = self.old_selected_options.get(self.current_dir, 0)
+        self._update_list_offset()
+
+    def toggle_dotfiles(self) -> None:
+        self.show_dotfiles = not self.show_dotfiles
+        views = self._views
+
+        if self.options is views.shown or self.options is views.hidden:
+            self._switch_dotfile_view()
+        else:
+            # Filtered, or with ignored files hidden, the options have to be worked out again
+            self.update_and_reselect()
+
+        if self.persist_state:
+            write_state_flag("show_dotfiles", self.show_dotfiles)
+
+    def toggle_ignored(self) -> None:
+        self.show_ignored = not self.show_ignored
+        self.update_and_reselect()
+
+        if self.persist_state:
+            write_state_flag("show_ignored", self.show_ignored)
+
+    def _switch_dotfile_view(self) -> None:
+        views = self._views
+
+        if self.show_dotfiles:
+            self.options = views.shown
+            self.selected_option = views.to_shown(self.selected_option)
+        else:
+            self.options = views.hidden
+            self.selected_option = views.to_hidden(self.selected_option)
+
+        self._update_list_offset()
+
+    def update_and_reselect(self):
+        with tracing.span("reselect"):
+            self._update_and_reselect()
+
+    def _update_and_reselect(self):
+        old_options = self.options
+        old_selection = self.selected_option
+        selection = self.options[min(self.selected_option, len(self.options) - 1)]
+        self._update_options_list(self.current_dir)
+
+        if self.is_filtering:
+            # Always highlight best match while filtering
+            self.selected_option = min(1, len(self.options) - 1)
+        elif selection in self.options:
+            # If the selected is still in the list, re-select it
+            self.selected_option = self.options.index(selection)
+        else:
+            # If the old selection is no longer in the options list, try to select the closest thing to it that is still in the list
+
+            def find_nearest_item(items: Iterable[str]) -> tuple[int, str | None]:
+                for distance, option in enumerate(items):
+                    if option in self.options:
+                        return distance, option
+
+                return 0, None
+
+            max_items_to_check = 20
+
+            # Search forwards in the list
+            forwards_distance, forwards_item = find_nearest_item(
+                old_options[old_selection + 1 : old_selection + max_items_to_check :]
+            )
+            # Search backwards in the list
+            backwards_distance, backwards_item = find_nearest_item(
+                old_options[old_selection - 1 : old_selection - max_items_to_check : -1]
+            )
+
+            # Select the nearest previous or next item
+            if forwards_item and backwards_item:
+                if backwards_distance < forwards_distance:
+                    self.selected_option = self.options.index(backwards_item)
+                else:
+                    self.selected_option = self.options.index(forwards_item)
+            elif forwards_item:
+                self.selected_option = self.options.index(forwards_item)
+            elif backwards_item:
+                self.selected_option = self.options.index(backwards_item)
+            else:
+                # Fallback
+                self.selected_option = 0
+
+        self._update_list_offset()
+
+    def _update_list_offset(self) -> None:
+        if self.selected_option >= self.list_offset + MAX_CONTENT_HEIGHT - 1:
+            self.list_offset = self.selected_option - MAX_CONTENT_HEIGHT + 1
+        elif self.selected_option < self.list_offset:
+            self.list_offset = self.selected_option
+
+    def _update_options_list(self, new_dir: Path) -> None:
+        with tracing.span("list", new_dir):
+            listing = self.filesystem.list_dir(new_dir)
+            # Listings come from the listing cache, an unchanged directory gives the same listing again
+            is_new_listing = listing is not self._views_listing
+            views = dotfile_views(listing) if is_new_listing else self._views
+
+            options = views.shown if self.show_dotfiles else views.hidden
+
+            if not self.show_ignored:
+                ignored = self._ignored_names(new_dir, listing)
+
+                if ignored:
+                    options = [option for option in options if option not in ignored]
+
+            filter_text = self.filter_text if self.is_filtering else ""
+            self.filter_error = None
+
+            if filter_text and self.filter_mode != "fuzzy":
+                with tracing.span("filter"):
+                    try:
+                        predicate = compile_filter(self.filter_mode, filter_text)
+                    except re.error as e:
+                        self.filter_error = f"Invalid {self.filter_mode}: {e.msg}"
+                        predicate = None
+
+                    # Every match is kept, in the listing's order
+                    options = [
+                        CURRENT_DIR_OPTION,
+                        *(filter(predicate, options[1:]) if predicate else ()),
+                    ]
+            elif filter_text:
+                with tracing.span("filter"):
+                    # Add an option to select the current directory, always at the top of the list
+                    options = [
+                        CURRENT_DIR_OPTION,
+                        *fuzzy_filter(options[1:], filter_text),
+                    ]
+
+        self.options = options
+        self._views = views
+        self._views_listing = listing
+
+        # Not while typing a filter, only once something may have changed
+        if is_new_listing:
+            self._request_git_status(new_dir)
+
+            if self.show_sizes:
+                self._measure_sizes(new_dir, listing)
+
+    def toggle_sizes(self) -> None:
+        self.show_sizes = not self.show_sizes
+
+        if self.show_sizes:
+            self._measure_sizes(self.current_dir, self._views_listing)
+        elif self._size_job is not None:
+            self._size_job.cancel()
+            self._size_job = None
+
+    def _measure_sizes(self, path: Path, listing: DirListing | None) -> None:
+        # Whatever is left of walking the last directory's subdirectories is of no use any more
+        if self._size_job is not None:
+            self._size_job.cancel()
+            self._size_job = None
+
+        policy = get_mount_policy(path)
+
+        if listing is None or not policy.metadata:
+            return
+
+        self._size_job = dir_sizes.measure(
+            self.filesystem,
+            path,
+            listing.dirs,
+            policy.search_budget,
+            self._sizes_updated,
+        )
+
+    def close(self) -> None:
+        """Stops any background work that is only of use while the picker is open"""
+        if self._size_job is not None:
+            self._size_job.cancel()
+            self._size_job = None
+
+        self.on_update = None
+
+    def _sizes_updated(self) -> None:
+        if self.on_update is not None:
+            self.on_update()
+
+    def _request_git_status(self, path: Path) -> None:
+        self._git_root = None
+        self._set_git_status(None)
+
+        # Like any other per-entry metadata, not worth it on network mounts
+        if not get_mount_policy(path).metadata:
+            return
+
+        try:
+            root = ignore_matchers.find_root(self.filesystem, path)
+
+            if root is None:
+                return
+
+            self._git_root = root
+            self._git_prefix = (
+                "" if path == root else f"{path.relative_to(root).as_posix()}/"
+            )
+            self._set_git_status(
+                git_statuses.get(self.filesystem, root, self._git_status_ready)
+            )
+        except OSError:
+            return
+
+    def _set_git_status(self, status: GitStatus | None) -> None:
+        self._git_status = status
+        self._git_inherited_state = (
+            status.inherited_state(self._git_prefix.rstrip("/"))
+            if status is not None and self._git_prefix
+            else None
+        )
+
+    def _git_status_ready(self, status: GitStatus) -> None:
+        # The picker may have moved on to another repository in the meantime
+        if status.root != self._git_root:
+            return
+
+        self._set_git_status(status)
+
+        if self.on_update is not None:
+            self.on_update()
+
+    def _ignored_names(self, path: Path, listing: DirListing) -> frozenset[str]:
+        # Kept for as long as the listing is, rather than stat-ing every ignore file up to the root of the repository
+        # on every refresh and filter. Ignore files edited in place are noticed once the directory changes.
+        cached = self._ignored
+        if cached is not None and cached[0] == path and cached[1] is listing:
+            return cached[2]
+
+        try:
+            matcher = ignore_matchers.get(self.filesystem, path)
+        except OSError:
+            # Better to show too much than nothing at all
+            return frozenset()
+
+        with tracing.span("ignored"):
+            ignored = matcher.ignored_names(listing)
+
+        self._ignored = (path, listing, ignored)
+        return ignored
+
+    def _index_of_path(
+        self, listed_dir: Path, path: Path, default: int | None = None
+    ) -> int:
+        """The index of the option for a path in the options listed for ``listed_dir``"""
+        if path == listed_dir:
+            return 0
+
+        if path.parent == listed_dir and path.name in self.options:
+            return self.options.index(path.name)
+
+        if default is None:
+            raise ValueError(f"{path} isn't in the list")
+
+        return default
+
+    def path_of(self, option: str) -> Path:
+        return self.current_dir / option
+
+    def is_dir(self, option: str) -> bool:
+        return option in self._views.dirs
+
+    def git_state(self, option: str) -> str | None:
+        """The git state of an option (see ``git_status.STATES``), or None if it's unchanged or not known (yet)"""
+        status = self._git_status
+
+        if status is None or option == CURRENT_DIR_OPTION:
+            return None
+
+        return self._git_inherited_state or status.state_of(self._git_prefix + option)
+
+    def dir_size(self, option: str) -> DirSize | None:
+        """The total size of a directory option, or its running total while it's being worked out"""
+        job = self._size_job
+
+        if job is None:
+            return None
+
+        return job.sizes.get(option)
+
+    def is_unresponsive(self, option: str) -> bool:
+        # Don't build a path for every drawn directory when, as usual, nothing has timed out
+        return self.filesystem.has_unresponsive and self.filesystem.is_unresponsive(
+            self.path_of(option)
+        )
+
+    @property
+    def marked_here(self) -> frozenset[str] | set[str]:
+        """The marked entries of the current directory, without adding it to ``marked``"""
+        return self.marked.get(self.current_dir, frozenset())
+
+    @property
+    def mark_count(self) -> int:
+        return sum(len(names) for names in self.marked.values())
+
+    def toggle_mark(self) -> None:
+        """Marks the selected option, or unmarks it if it's already marked, and moves on to the next one"""
+        option = self.options[self.selected_option] if self.options else None
+
+        if option is not None and option != CURRENT_DIR_OPTION:
+            if option in self.marked_here:
+                self._unmark((option,))
+            else:
+                self.marked.setdefault(self.current_dir, set()).add(option)
+
+        self.move_cursor(1)
+
+    def mark_and_move(self, direction: int) -> None:
+        """Marks the selected option before moving the cursor, so moving over a range marks all of it"""
+        if self.options and self.selected_option != 0:
+            self.marked.setdefault(self.current_dir, set()).add(
+                self.options[self.selected_option]
+            )
+
+        self.move_cursor(direction)
+
+    def toggle_mark_all(self) -> None:
+        """Marks every option matching the filter, or unmarks them all if they already are"""
+        # Without the current directory option, which is always first
+        options = self.options[1:]
+
+        if self.marked_here.issuperset(options):
+            self._unmark(options)
+        else:
+            self.marked.setdefault(self.current_dir, set()).update(options)
+
+    def _unmark(self, options: Iterable[str]) -> None:
+        marked = self.marked.get(self.current_dir)
+
+        if marked is not None:
+            marked.difference_update(options)
+
+            # Directories whose marks are all gone are dropped, as if they were never marked
+            if not marked:
+                del self.marked[self.current_dir]
+
+    def select_marked(self) -> list[Path]:
+        """The marked paths, a directory at a time in the order they were marked in, or nothing if none are"""
+        return [
+            directory / name
+            for directory, names in self.marked.items()
+            for name in sorted(names, key=str.lower)
+        ]
+
+    def select(self) -> Path | None:
+        """Returns the selected path, or None if it can't be chosen"""
+        selected = self.options[self.selected_option]
+
+        if self.accept_files or self.is_dir(selected):
+            return self.path_of(selected)
+
+        return None
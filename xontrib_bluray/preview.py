@@ -0,0 +1,158 @@
+"""
+Previews of the selected entry: the start of a file, or a summary of a directory.
+
+Only the first few KiB of a file are ever read, in a single bounded read through the (guarded) filesystem, and previews
+are cached until the entry's mtime or size changes. Building one blocks, so the picker does it off the UI thread.
+"""
+
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from stat import S_ISDIR, S_ISREG
+from typing import NamedTuple
+
+from xontrib_bluray import stats, tracing
+from xontrib_bluray.constants import (
+    PREVIEW_CACHE_SIZE,
+    PREVIEW_MAX_BYTES,
+    PREVIEW_MAX_LINES,
+    PREVIEW_SNIFF_BYTES,
+)
+from xontrib_bluray.filesystem import Filesystem
+
+# Control characters would mess up the terminal, tabs are expanded separately
+_CONTROL_CHARS = {
+    code: "\ufffd" for code in (*range(0x00, 0x09), *range(0x0A, 0x20), 0x7F)
+}
+
+
+class Preview(NamedTuple):
+    title: str
+    lines: list[str]
+
+
+def format_size(size: int) -> str:
+    if size < 1024:
+        return f"{size} B"
+
+    scaled = float(size)
+    for unit in ("KiB", "MiB", "GiB"):
+        scaled /= 1024
+        if scaled < 1024:
+            return f"{scaled:.1f} {unit}"
+
+    return f"{scaled / 1024:.1f} TiB"
+
+
+def is_binary(head: bytes) -> bool:
+    """Whether the start of a file looks binary, going by whether there's a NUL in it, like git and grep do"""
+    return b"\0" in head[:PREVIEW_SNIFF_BYTES]
+
+
+def _preview_file(filesystem: Filesystem, path: Path, size: int) -> Preview:
+    head = filesystem.read_bytes(path, PREVIEW_MAX_BYTES)
+
+    if is_binary(head):
+        return Preview(f"{format_size(size)}, binary", [])
+
+    # The last line may have been cut off part way, along with a multibyte character in it
+    text = head.decode(errors="replace")
+    lines = text.splitlines()[:PREVIEW_MAX_LINES]
+
+    return Preview(
+        format_size(size),
+        [line.expandtabs(4).translate(_CONTROL_CHARS) for line in lines],
+    )
+
+
+def _preview_dir(filesystem: Filesystem, path: Path) -> Preview:
+    listing = filesystem.list_dir(path)
+    names = [f"{name}/" for name in listing.dirs[:PREVIEW_MAX_LINES]]
+    names += listing.files[: PREVIEW_MAX_LINES - len(names)]
+
+    return Preview(
+        f"{len(listing.dirs)} dirs, {len(listing.files)} files",
+        [name.translate(_CONTROL_CHARS) for name in names],
+    )
+
+
+class PreviewCache:
+    def __init__(self, max_previews: int = PREVIEW_CACHE_SIZE):
+        self.max_previews = max_previews
+        # Path -> the mtime and size it was built for, and the preview
+        self._previews: OrderedDict[Path, tuple[tuple[int, int], Preview]] = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def peek(self, path: Path) -> Preview | None:
+        """The last preview built for a path without touching the filesystem, which may be out of date"""
+        cached = self._previews.get(path)
+        return cached[1] if cached is not None else None
+
+    def get(self, filesystem: Filesystem, path: Path) -> Preview:
+        """Builds a preview of a path, or reuses the last one if the path hasn't changed since. This blocks."""
+        try:
+            stat = filesystem.stat(path)
+        except OSError as e:
+            return Preview(e.strerror or str(e), [])
+
+        key = (stat.st_mtime_ns, stat.st_size)
+
+        with self._lock:
+            cached = self._previews.get(path)
+
+            if cached is not None and cached[0] == key:
+                self.hits += 1
+                self._previews.move_to_end(path)
+                return cached[1]
+
+            self.misses += 1
+
+        with tracing.span("preview", path):
+            try:
+                if S_ISDIR(stat.st_mode):
+                    preview = _preview_dir(filesystem, path)
+                elif S_ISREG(stat.st_mode):
+                    preview = _preview_file(filesystem, path, stat.st_size)
+                else:
+                    # FIFOs, sockets and devices could block or never end
+                    preview = Preview("Not a regular file", [])
+            except OSError as e:
+                # Not cached, so it's tried again next time
+                return Preview(e.strerror or str(e), [])
+
+        with self._lock:
+            self._previews[path] = (key, preview)
+
+            while len(self._previews) > self.max_previews:
+                self._previews.popitem(last=False)
+
+        return preview
+
+    def get_stats(self) -> stats.CacheStats:
+        return stats.CacheStats(
+            name="previews",
+            hits=self.hits,
+            misses=self.misses,
+            size=len(self._previews),
+            max_size=self.max_previews,
+        )
+
+    def reset(self) -> None:
+        with self._lock:
+            self._previews.clear()
+
+        self.reset_counters()
+
+    def reset_counters(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+
+previews = PreviewCache()
+stats.register_cache(
+    "previews", previews.get_stats, reset_counters=previews.reset_counters
+)
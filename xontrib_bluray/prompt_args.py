@@ -0,0 +1,221 @@
+import re
+from bisect import bisect_left
+from functools import lru_cache
+from itertools import accumulate
+from typing import NamedTuple
+
+from xontrib_bluray import stats, tracing
+from xontrib_bluray.constants import PROMPT_ARGS_CACHE_SIZE
+from xontrib_bluray.custom_lexer import CustomLexer
+
+path_string_pattern = re.compile("^[pf]?['\"]?(.+?)[\"']?$")
+# Only the parts of the prompt which affect where a logical line ends. Strings and comments are matched as a whole so
+# that brackets and newlines inside of them are skipped over.
+logical_line_pattern = re.compile(
+    r"""
+    (?P<string>
+        [rRbBfFpPuU]{0,3}
+        (?:
+            \"\"\"(?:\\.|[^\\])*?\"\"\"
+            | '''(?:\\.|[^\\])*?'''
+            | "(?:\\.|[^"\\\n])*"
+            | '(?:\\.|[^'\\\n])*'
+        )
+    )
+    | (?P<comment>\#[^\n]*)
+    | (?P<escape>\\(?:\r?\n|.))
+    | (?P<open>[(\[{])
+    | (?P<close>[)\]}])
+    | (?P<newline>\n)
+    """,
+    re.VERBOSE,
+)
+
+
+class LogicalLine(NamedTuple):
+    start: int
+    end: int
+
+
+def find_logical_line(prompt: str, cursor_position: int) -> LogicalLine:
+    """
+    Finds the logical line which contains the cursor, following line continuations, open brackets and multi-line
+    strings. This is much cheaper than tokenizing the entire prompt, as only brackets, strings and newlines are looked at.
+    """
+    line_start = 0
+    depth = 0
+
+    for match in logical_line_pattern.finditer(prompt):
+        kind = match.lastgroup
+
+        if kind == "open":
+            depth += 1
+        elif kind == "close":
+            depth = max(depth - 1, 0)
+        elif kind == "newline" and depth == 0:
+            if match.start() >= cursor_position:
+                return LogicalLine(line_start, match.start())
+
+            line_start = match.end()
+
+    return LogicalLine(line_start, len(prompt))
+
+
+class PromptArgs(NamedTuple):
+    """The arguments of a prompt, with the offsets of where each one starts and ends precomputed"""
+
+    text: str
+    args: tuple[str, ...]
+    starts: tuple[int, ...]
+    ends: tuple[int, ...]
+
+
+# Opening the picker again on an unchanged prompt (e.g. after cancelling it and moving the cursor) doesn't need to
+# re-lex it. The results are cached, so they must never be mutated.
+@lru_cache(maxsize=PROMPT_ARGS_CACHE_SIZE)
+def split_prompt_to_args(prompt: str) -> PromptArgs:
+    with tracing.span("tokenise"):
+        args = tuple(CustomLexer(tolerant=False, pymode=False).split(prompt))
+
+    ends = tuple(accumulate(len(arg) for arg in args))
+    starts = (0, *ends[:-1]) if args else ()
+
+    # The offsets are based on the lexed args, so the text must be too
+    return PromptArgs(text="".join(args), args=args, starts=starts, ends=ends)
+
+
+stats.register_lru_cache("prompt_args", split_prompt_to_args)
+
+
+class SelectedArg(NamedTuple):
+    position: int
+    is_inserting: bool
+
+
+def get_selected_prompt_arg(
+    prompt_args: PromptArgs, cursor_position: int
+) -> SelectedArg:
+    args, starts = prompt_args.args, prompt_args.starts
+    # The first arg which starts at or after the cursor
+    next_idx = bisect_left(starts, cursor_position)
+
+    if (
+        next_idx < len(args)
+        and starts[next_idx] == cursor_position
+        and args[next_idx].isspace()
+    ):
+        # The cursor is at the very start of some whitespace
+        selected = SelectedArg(position=next_idx, is_inserting=True)
+        is_last_arg = next_idx == len(args) - 1
+    elif next_idx > 0:
+        # The cursor is inside (or at the end of) the previous arg
+        selected = SelectedArg(
+            position=next_idx - 1, is_inserting=args[next_idx - 1].isspace()
+        )
+        is_last_arg = next_idx == len(args)
+    else:
+        # The cursor is at the start of the prompt, before the first arg
+        selected = SelectedArg(position=-1, is_inserting=True)
+        is_last_arg = len(args) == 0
+
+    if is_last_arg and cursor_position >= len(prompt_args.text):
+        # The cursor is at the end of the prompt, we will be inserting
+        selected = SelectedArg(position=len(args), is_inserting=True)
+
+    return selected
+
+
+class PutResult(NamedTuple):
+    new_prompt: str
+    new_cursor_position: int
+
+
+def put_arg_in_prompt(
+    *,
+    prompt_args: PromptArgs,
+    selected_arg: SelectedArg,
+    new_arg: str,
+    cursor_position: int,
+) -> PutResult:
+    text = prompt_args.text
+    arg_position = selected_arg.position
+
+    if len(prompt_args.args) == 0:
+        return PutResult(new_prompt=new_arg, new_cursor_position=len(new_arg))
+    elif arg_position == -1:
+        return PutResult(new_prompt=f"{new_arg} {text}", new_cursor_position=0)
+    elif arg_position == len(prompt_args.args):
+        new_prompt = f"{text} {new_arg}"
+        return PutResult(new_prompt=new_prompt, new_cursor_position=len(new_prompt))
+
+    arg_start = prompt_args.starts[arg_position]
+    arg_end = prompt_args.ends[arg_position]
+
+    if selected_arg.is_inserting:
+        # Ensure that the new arg is preceded and followed by a space, the whitespace it is being inserted into is only
+        # missing on one side when the cursor is at its start or end
+        space_before = " " if arg_position > 0 and cursor_position == arg_start else ""
+        space_after = " " if cursor_position == arg_end else ""
+
+        return PutResult(
+            new_prompt=text[:cursor_position]
+            + space_before
+            + new_arg
+            + space_after
+            + text[cursor_position:],
+            new_cursor_position=cursor_position + len(space_before) + len(new_arg),
+        )
+    else:
+        return PutResult(
+            new_prompt=text[:arg_start] + new_arg + text[arg_end:],
+            new_cursor_position=arg_start + len(new_arg),
+        )
+
+
+class CursorArgs(NamedTuple):
+    """The arguments of the logical line that the cursor is on"""
+
+    line: LogicalLine
+    args: PromptArgs
+    selected_arg: SelectedArg
+    # Relative to the start of the logical line
+    cursor_position: int
+
+    @property
+    def selected_arg_text(self) -> str | None:
+        if self.selected_arg.is_inserting:
+            return None
+
+        return self.args.args[self.selected_arg.position]
+
+
+def get_cursor_args(prompt: str, cursor_position: int) -> CursorArgs:
+    """Only tokenizes the logical line which the cursor is on, not the entire prompt"""
+    line = find_logical_line(prompt, cursor_position)
+    line_cursor_position = cursor_position - line.start
+    prompt_args = split_prompt_to_args(prompt[line.start : line.end])
+
+    return CursorArgs(
+        line=line,
+        args=prompt_args,
+        selected_arg=get_selected_prompt_arg(prompt_args, line_cursor_position),
+        cursor_position=line_cursor_position,
+    )
+
+
+def splice_arg_into_prompt(
+    *, prompt: str, cursor_args: CursorArgs, new_arg: str
+) -> PutResult:
+    """Puts the new arg into the cursor's logical line and splices it back in between the text around it"""
+    line = cursor_args.line
+    put_result = put_arg_in_prompt(
+        prompt_args=cursor_args.args,
+        selected_arg=cursor_args.selected_arg,
+        new_arg=new_arg,
+        cursor_position=cursor_args.cursor_position,
+    )
+
+    return PutResult(
+        new_prompt=prompt[: line.start] + put_result.new_prompt + prompt[line.end :],
+        new_cursor_position=line.start + put_result.new_cursor_position,
+    )
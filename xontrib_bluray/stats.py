@@ -0,0 +1,183 @@
+import argparse
+import json
+from collections.abc import Callable
+from typing import TYPE_CHECKING, Any, NamedTuple
+
+from xontrib_bluray import tracing
+
+if TYPE_CHECKING:
+    from functools import _lru_cache_wrapper
+
+SLOWEST_OPERATIONS = 10
+
+
+class CacheStats(NamedTuple):
+    name: str
+    hits: int
+    misses: int
+    size: int
+    max_size: int | None
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class _Registered[T](NamedTuple):
+    get: Callable[[], T]
+    # Only zeroes the figures, what the cache holds is left alone
+    reset_counters: Callable[[], None] | None
+
+
+_caches: dict[str, _Registered[CacheStats]] = {}
+_background_tasks: dict[str, _Registered[int]] = {}
+
+
+def register_cache(
+    name: str,
+    get_stats: Callable[[], CacheStats],
+    reset_counters: Callable[[], None] | None = None,
+) -> None:
+    _caches[name] = _Registered(get_stats, reset_counters)
+
+
+def register_lru_cache(name: str, cached_function: "_lru_cache_wrapper") -> None:
+    def get_stats() -> CacheStats:
+        info = cached_function.cache_info()
+        return CacheStats(
+            name=name,
+            hits=info.hits,
+            misses=info.misses,
+            size=info.currsize,
+            max_size=info.maxsize,
+        )
+
+    # The hit and miss counts of an lru_cache can only be reset by clearing it, which is harmless for pure functions
+    register_cache(name, get_stats, reset_counters=cached_function.cache_clear)
+
+
+def register_background_tasks(name: str, count_in_flight: Callable[[], int]) -> None:
+    _background_tasks[name] = _Registered(count_in_flight, None)
+
+
+def get_cache_stats() -> list[CacheStats]:
+    return [cache.get() for cache in _caches.values()]
+
+
+def snapshot() -> dict[str, Any]:
+    """Everything bluray-stats reports, in a JSON serialisable form"""
+    recent_operations = tracing.get_recent_operations()
+    slowest = sorted(recent_operations, key=lambda it: it.duration_ns, reverse=True)
+    listing_times: dict[str, float] = {}
+
+    for operation in recent_operations:
+        if operation.name == "list" and operation.detail is not None:
+            # The latest listing time of each directory
+            listing_times[operation.detail] = operation.duration_ns / 1e6
+
+    return {
+        "tracing": tracing.is_enabled(),
+        "caches": [
+            {**cache._asdict(), "hit_rate": cache.hit_rate}
+            for cache in get_cache_stats()
+        ],
+        "background_tasks": {
+            name: tasks.get() for name, tasks in _background_tasks.items()
+        },
+        "operations": {
+            name: histogram.summary()
+            for name, histogram in tracing.get_histograms().items()
+        },
+        "counters": tracing.get_counters(),
+        "slowest_operations": [
+            {
+                "name": operation.name,
+                "detail": operation.detail,
+                "duration": operation.duration_ns / 1e6,
+            }
+            for operation in slowest[:SLOWEST_OPERATIONS]
+        ],
+        "listing_times": listing_times,
+    }
+
+
+def format_snapshot(stats: dict[str, Any]) -> str:
+    lines = ["Caches"]
+
+    for cache in stats["caches"]:
+        max_size = cache["max_size"] if cache["max_size"] is not None else "inf"
+        lines.append(
+            f"  {cache['name']:<24} {cache['size']}/{max_size} entries,"
+            f" {cache['hit_rate']:.0%} hit rate ({cache['hits']} hits, {cache['misses']} misses)"
+        )
+
+    lines.append("Background tasks")
+    for name, in_flight in stats["background_tasks"].items():
+        lines.append(f"  {name:<24} {in_flight} in flight")
+
+    if not stats["tracing"]:
+        lines.append("Latencies aren't recorded unless $BLURAY_TRACE is enabled")
+        return "\n".join(lines)
+
+    lines.append("Latencies (ms)")
+    for name, summary in stats["operations"].items():
+        lines.append(
+            f"  {name:<24} n={summary['count']:<6} p50={summary['p50']:.2f}"
+            f" p99={summary['p99']:.2f} max={summary['max']:.2f}"
+        )
+
+    lines.append("Counters")
+    for name, value in stats["counters"].items():
+        lines.append(f"  {name:<24} {value}")
+
+    lines.append("Slowest recent operations (ms)")
+    for operation in stats["slowest_operations"]:
+        detail = f" {operation['detail']}" if operation["detail"] else ""
+        lines.append(f"  {operation['duration']:>9.2f} {operation['name']}{detail}")
+
+    lines.append("Directory listing times (ms)")
+    for directory, duration in stats["listing_times"].items():
+        lines.append(f"  {duration:>9.2f} {directory}")
+
+    return "\n".join(lines)
+
+
+def reset() -> None:
+    """
+    Zeroes the hit and miss counts and the latencies. Nothing cached is thrown away, clearing the listings or the
+    unresponsive directories of a live session would only make it slower (or hang on a dead mount again).
+    """
+    for cache in _caches.values():
+        if cache.reset_counters is not None:
+            cache.reset_counters()
+
+    tracing.reset()
+
+
+def bluray_stats(args: list[str], stdout=None):
+    """Prints the current session's cache and latency figures"""
+    parser = argparse.ArgumentParser(
+        prog="bluray-stats", description=bluray_stats.__doc__
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="print the figures as a JSON object"
+    )
+    parser.add_argument(
+        "--reset",
+        action="store_true",
+        help="reset the figures after printing them, without clearing any caches",
+    )
+
+    try:
+        options = parser.parse_args(args)
+    except SystemExit as e:
+        return e.code
+
+    figures = snapshot()
+    print(
+        json.dumps(figures) if options.json else format_snapshot(figures), file=stdout
+    )
+
+    if options.reset:
+        reset()
@@ -0,0 +1,289 @@
+"""
+Opt-in tracing of bluray's hot paths.
+
+Set ``$BLURAY_TRACE = True`` (or the ``BLURAY_TRACE`` environment variable) to record the latency of listing, sorting,
+filtering, reselecting, drawing and prompt tokenisation into in-memory histograms, along with counts of filesystem calls
+and cache hits. A summary of each dialog session is appended as a JSON line to ``$BLURAY_TRACE_FILE``, which defaults
+to ``bluray-trace.jsonl`` next to the state file.
+
+When tracing is disabled, ``span`` hands back a shared no-op context manager and ``count`` returns straight away. When
+it's enabled, spans and counts from worker threads are recorded under one lock.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import AbstractContextManager, nullcontext
+from pathlib import Path
+from typing import NamedTuple
+
+from xontrib_bluray import stats
+from xontrib_bluray.constants import STATE_FILE
+
+DEFAULT_TRACE_FILE = STATE_FILE.with_name("bluray-trace.jsonl")
+RECENT_OPERATIONS = 256
+_null_span = nullcontext()
+
+
+class LatencyHistogram:
+    """
+    A log-linear histogram in the style of HdrHistogram. Each power of two is split into ``SUB_BUCKETS`` linear buckets,
+    so any recorded value is accurate to within ~3% while only a few hundred buckets are ever needed.
+    """
+
+    SUB_BUCKET_BITS = 5
+    SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+    def __init__(self):
+        self.counts: dict[int, int] = {}
+        self.total_count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    @classmethod
+    def _bucket_index(cls, value: int) -> int:
+        if value < cls.SUB_BUCKETS:
+            return value
+
+        magnitude = value.bit_length() - cls.SUB_BUCKET_BITS - 1
+        return cls.SUB_BUCKETS * (magnitude + 1) + (
+            (value >> magnitude) - cls.SUB_BUCKETS
+        )
+
+    @classmethod
+    def _bucket_value(cls, index: int) -> int:
+        """The midpoint of the values which fall into a bucket"""
+        if index < cls.SUB_BUCKETS:
+            return index
+
+        magnitude, sub_bucket = divmod(index - cls.SUB_BUCKETS, cls.SUB_BUCKETS)
+        lowest = (cls.SUB_BUCKETS + sub_bucket) << magnitude
+        return lowest + ((1 << magnitude) >> 1)
+
+    def copy(self) -> "LatencyHistogram":
+        histogram = LatencyHistogram()
+        histogram.counts = dict(self.counts)
+        histogram.total_count = self.total_count
+        histogram.total_ns = self.total_ns
+        histogram.max_ns = self.max_ns
+        return histogram
+
+    def record(self, value_ns: int) -> None:
+        index = self._bucket_index(value_ns)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.total_count += 1
+        self.total_ns += value_ns
+        self.max_ns = max(self.max_ns, value_ns)
+
+    def percentile(self, percentile: float) -> int:
+        if not self.total_count:
+            return 0
+
+        target = percentile / 100 * self.total_count
+        seen = 0
+
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return min(self._bucket_value(index), self.max_ns)
+
+        return self.max_ns
+
+    def summary(self) -> dict[str, float]:
+        """Latencies in milliseconds"""
+        return {
+            "count": self.total_count,
+            "mean": self.total_ns / self.total_count / 1e6 if self.total_count else 0,
+            "p50": self.percentile(50) / 1e6,
+            "p90": self.percentile(90) / 1e6,
+            "p99": self.percentile(99) / 1e6,
+            "max": self.max_ns / 1e6,
+        }
+
+
+class Operation(NamedTuple):
+    name: str
+    detail: str | None
+    duration_ns: int
+    finished_at: float
+
+
+class TraceSession:
+    def __init__(self, name: str):
+        self.name = name
+        self.started_at = time.time()
+        self.histograms: dict[str, LatencyHistogram] = {}
+        self.counters: dict[str, int] = {}
+
+
+class _Tracer:
+    def __init__(self):
+        self.enabled = False
+        self.trace_file = DEFAULT_TRACE_FILE
+        # Everything since tracing was enabled (or last reset)
+        self.histograms: dict[str, LatencyHistogram] = {}
+        self.counters: dict[str, int] = {}
+        self.recent_operations: deque[Operation] = deque(maxlen=RECENT_OPERATIONS)
+        self.session: TraceSession | None = None
+        # Spans and counts come in from worker threads too (listings, sizes, git status)
+        self.lock = threading.Lock()
+
+    def record(self, name: str, detail: str | None, duration_ns: int) -> None:
+        operation = Operation(
+            name=name,
+            detail=detail,
+            duration_ns=duration_ns,
+            finished_at=time.time(),
+        )
+
+        with self.lock:
+            for histograms in self._histogram_sets():
+                histogram = histograms.get(name)
+                if histogram is None:
+                    histogram = histograms[name] = LatencyHistogram()
+                histogram.record(duration_ns)
+
+            self.recent_operations.append(operation)
+
+    def count(self, name: str, amount: int) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+            if self.session is not None:
+                self.session.counters[name] = (
+                    self.session.counters.get(name, 0) + amount
+                )
+
+    def _histogram_sets(self) -> list[dict[str, LatencyHistogram]]:
+        if self.session is None:
+            return [self.histograms]
+
+        return [self.histograms, self.session.histograms]
+
+    def reset(self) -> None:
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.recent_operations.clear()
+
+
+_tracer = _Tracer()
+
+
+class _Span(AbstractContextManager):
+    __slots__ = ("detail", "name", "start")
+
+    def __init__(self, name: str, detail: str | None):
+        self.name = name
+        self.detail = detail
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        _tracer.record(self.name, self.detail, time.perf_counter_ns() - self.start)
+
+
+def configure(*, enabled: bool, trace_file: Path | str | None = None) -> None:
+    _tracer.enabled = enabled
+    if trace_file:
+        _tracer.trace_file = Path(trace_file).expanduser()
+
+
+def is_enabled() -> bool:
+    return _tracer.enabled
+
+
+def span(name: str, detail: object = None) -> AbstractContextManager:
+    """Times the body of a ``with`` block as one ``name`` operation"""
+    if not _tracer.enabled:
+        return _null_span
+
+    return _Span(name, None if detail is None else str(detail))
+
+
+def count(name: str, amount: int = 1) -> None:
+    if _tracer.enabled:
+        _tracer.count(name, amount)
+
+
+def start_session(name: str) -> None:
+    if _tracer.enabled:
+        with _tracer.lock:
+            _tracer.session = TraceSession(name)
+
+
+def end_session() -> None:
+    """Ends the current dialog session, and appends its summary to the trace file"""
+    # Once it's swapped out, nothing else records into it
+    with _tracer.lock:
+        session = _tracer.session
+        _tracer.session = None
+
+    if not _tracer.enabled or session is None:
+        return
+
+    record = {
+        "session": session.name,
+        "started_at": session.started_at,
+        "duration": time.time() - session.started_at,
+        "operations": {
+            name: histogram.summary() for name, histogram in session.histograms.items()
+        },
+        "counters": session.counters,
+        "caches": [
+            {**cache._asdict(), "hit_rate": cache.hit_rate}
+            for cache in stats.get_cache_stats()
+        ],
+    }
+    dump(record)
+
+
+def dump(record: dict | None = None, path: Path | None = None) -> Path:
+    """Appends a record (by default, a summary of everything traced so far) to the trace file as a JSON line"""
+    path = path or _tracer.trace_file
+
+    if record is None:
+        record = {
+            "operations": {
+                name: histogram.summary()
+                for name, histogram in get_histograms().items()
+            },
+            "counters": get_counters(),
+        }
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as file:
+        file.write(json.dumps(record) + "\n")
+
+    return path
+
+
+def get_histograms() -> dict[str, LatencyHistogram]:
+    """Copies of the histograms, which worker threads can't change while they're being summarised"""
+    with _tracer.lock:
+        return {
+            name: histogram.copy() for name, histogram in _tracer.histograms.items()
+        }
+
+
+def get_counters() -> dict[str, int]:
+    with _tracer.lock:
+        return dict(_tracer.counters)
+
+
+def get_recent_operations() -> list[Operation]:
+    with _tracer.lock:
+        return list(_tracer.recent_operations)
+
+
+def reset() -> None:
+    _tracer.reset()
+
+
+configure(
+    enabled=os.environ.get("BLURAY_TRACE", "").lower() in ("1", "true", "yes"),
+    trace_file=os.environ.get("BLURAY_TRACE_FILE"),
+)